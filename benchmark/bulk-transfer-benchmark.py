@@ -0,0 +1,70 @@
+from pybela import Logger
+import numpy as np
+import argparse
+import io
+import os
+import shutil
+import time
+
+# compares the throughput of copy_all_bin_files_in_project() with the "sftp" method (one SFTP transfer per file) and the "tar" method (all files in a single ssh exec channel), with and without ssh compression. Needs a Bela board with a project running, the test files are written to (and then removed from) the project directory
+
+methods = {"sftp": {"method": "sftp"},
+           "tar": {"method": "tar"},
+           "tar+compress": {"method": "tar", "compress": True}}
+
+
+def file_contents(kind, size):
+    """ random data (high entropy, like dense float logs) or mostly zeros (low entropy, like sparse logs with padding) """
+    if kind == "random":
+        return os.urandom(size)
+    data = np.zeros(size, dtype=np.uint8)
+    data[::64] = np.random.randint(0, 256, len(data[::64]))
+    return data.tobytes()
+
+
+def run_method(logger, options, local_dir):
+    shutil.rmtree(local_dir, ignore_errors=True)
+    os.makedirs(local_dir)
+    start = time.perf_counter()
+    logger.copy_all_bin_files_in_project(dir=local_dir, verbose=False, **options)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numFiles", type=int, default=50, help="number of files")
+    parser.add_argument("--fileSize", type=int, default=2**20, help="size of each file in bytes")
+    parser.add_argument("--kind", type=str, default="random", help="file contents (random or sparse)")
+    parser.add_argument("--repetitions", type=int, default=3, help="number of runs of each method")
+    parser.add_argument("--methods", type=str, nargs="+", default=list(methods), help=f"methods to compare ({', '.join(methods)})")
+    parser.add_argument("--localDir", type=str, default="./bulk-transfer-benchmark", help="local directory for the copied files")
+
+    args = parser.parse_args()
+
+    logger = Logger()
+    logger.connect()
+    remote_dir = f"/root/Bela/projects/{logger.project_name}"
+    remote_paths = [f"{remote_dir}/pybela-benchmark-{idx}.bin" for idx in range(args.numFiles)]
+
+    with logger._get_ssh_session().sftp() as sftp:
+        existing_files = [file_name for file_name in sftp.listdir(remote_dir) if file_name.endswith(".bin")]
+        for remote_path in remote_paths:
+            sftp.putfo(io.BytesIO(file_contents(args.kind, args.fileSize)), remote_path)
+    if len(existing_files) > 0:
+        print(f"Note: the {len(existing_files)} .bin files already in {remote_dir} are copied too")
+
+    try:
+        total_size = args.numFiles * args.fileSize
+        print(f"\nfiles: {args.numFiles} x {args.fileSize / 2**20:.2f} MiB ({args.kind}) -- repetitions: {args.repetitions}")
+        print(f"{'method':<14}{'median (s)':>12}{'max (s)':>10}{'MiB/s':>10}{'files/s':>10}")
+        for name in args.methods:
+            times = np.array([run_method(logger, methods[name], args.localDir) for _ in range(args.repetitions)])
+            print(f"{name:<14}{np.median(times):>12.2f}{np.max(times):>10.2f}"
+                  f"{total_size / np.median(times) / 2**20:>10.2f}{args.numFiles / np.median(times):>10.1f}")
+    finally:
+        with logger._get_ssh_session().sftp() as sftp:
+            for remote_path in remote_paths:
+                sftp.remove(remote_path)
+        shutil.rmtree(args.localDir, ignore_errors=True)
+        logger.cleanup()
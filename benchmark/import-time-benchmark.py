@@ -0,0 +1,46 @@
+import subprocess
+import sys
+import argparse
+import numpy as np
+
+# measures the time it takes to import pybela (in a fresh interpreter each time) and which of its optional dependencies are loaded by the import, and by the first use of the features that need them
+
+optional_dependencies = ["bokeh", "paramiko", "aiofiles", "nest_asyncio"]
+
+scenarios = {
+    "import pybela": "import pybela",
+    "Controller": "from pybela import Controller; Controller()",
+    "Logger": "from pybela import Logger; Logger()",
+    "Streamer.plot_data deps": "from pybela import Streamer; Streamer()._bokeh_plot_data_app({}, None, [])",
+}
+
+
+def run_scenario(code):
+    """ runs code in a fresh interpreter and returns the elapsed time and the optional dependencies loaded """
+    child = f"""
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print("loaded:" + ",".join(dep for dep in {optional_dependencies} if dep in sys.modules))
+"""
+    output = subprocess.run([sys.executable, "-c", child],
+                            capture_output=True, text=True, check=True).stdout.strip().split("\n")
+    return float(output[-2]), [dep for dep in output[-1][len("loaded:"):].split(",") if dep]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repetitions", type=int, default=10, help="number of runs of each scenario")
+    parser.add_argument("--scenarios", type=str, nargs="+", default=list(scenarios), help=f"scenarios to run ({', '.join(scenarios)})")
+
+    args = parser.parse_args()
+
+    print(f"\nrepetitions: {args.repetitions}")
+    print(f"{'scenario':<26}{'median (ms)':>13}{'max (ms)':>10}  optional dependencies loaded")
+    for name in args.scenarios:
+        runs = [run_scenario(scenarios[name]) for _ in range(args.repetitions)]
+        times = np.array([elapsed for elapsed, _ in runs]) * 1000
+        print(f"{name:<26}{np.median(times):>13.1f}{np.max(times):>10.1f}  {', '.join(runs[-1][1]) or '-'}")
@@ -0,0 +1,67 @@
+from pybela import Streamer
+from pybela.MockBela import MockBela
+import numpy as np
+import time
+import argparse
+
+# streams from a local MockBela server instead of a Bela board and reports the throughput and latency of pybela, for each of the event loop backends passed in --loopBackends
+
+
+async def callback(buffer, bela, lags):
+    """ lag (in frames) between the last frame emitted by the mock and the last frame in the received buffer """
+    _buffer = buffer["buffer"]
+    last_frame = _buffer["ref_timestamp"] + (_buffer["rel_timestamps"][-1] if "rel_timestamps" in _buffer else len(_buffer["data"]) - 1)
+    lags[buffer["name"]].append(bela.frame - int(last_frame))
+
+
+def run_session(loop_backend, args):
+    variables = [{"name": f"var{idx}", "type": args.type, "timestamp_mode": args.timestampMode}
+                 for idx in range(args.numVars)]
+    speed = args.speed if args.speed > 0 else None
+
+    with MockBela(variables=variables, sample_rate=args.sampleRate, speed=speed, port=0) as bela:
+        streamer = Streamer(ip=bela.ip, port=bela.port, loop_backend=loop_backend)
+        streamer.connect()
+
+        lags = {var["name"]: [] for var in variables}
+        start_frame, start_bytes = bela.frame, bela.sent_bytes
+        start = time.perf_counter()
+        streamer.start_streaming([var["name"] for var in variables],
+                                 on_buffer_callback=callback, callback_args=(bela, lags))
+        streamer.wait(args.time)
+        streamer.stop_streaming()
+        elapsed = time.perf_counter() - start
+        end_frame, end_bytes = bela.frame, bela.sent_bytes
+        streamer.cleanup()
+
+        n_buffers = sum(len(var_lags) for var_lags in lags.values())
+        all_lags = np.concatenate([np.array(var_lags) for var_lags in lags.values()]) if n_buffers > 0 else np.zeros(1)
+        frames_per_second = (end_frame - start_frame) / elapsed
+
+        return {"frames_per_second": frames_per_second,
+                "buffers_per_second": n_buffers / elapsed,
+                "mib_per_second": (end_bytes - start_bytes) / elapsed / 2**20,
+                "mean_lag_ms": np.mean(all_lags) * 1000 / frames_per_second,
+                "max_lag_ms": np.max(all_lags) * 1000 / frames_per_second}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--time", type=float, default=10, help="time interval in seconds")
+    parser.add_argument("--numVars", type=int, default=10, help="number of streamed variables")
+    parser.add_argument("--type", type=str, default="f", help="type of the variables (f, j, i, d)")
+    parser.add_argument("--timestampMode", type=str, default="dense", help="timestamp mode of the variables (dense or sparse)")
+    parser.add_argument("--sampleRate", type=int, default=44100, help="sample rate of the mock")
+    parser.add_argument("--speed", type=float, default=1.0, help="emission rate relative to real time, 0 for as fast as possible")
+    parser.add_argument("--loopBackends", type=str, nargs="+", default=["asyncio"], help="event loop backends to compare (asyncio, uvloop)")
+
+    args = parser.parse_args()
+
+    results = {loop_backend: run_session(loop_backend, args) for loop_backend in args.loopBackends}
+
+    print(f"\nvariables: {args.numVars} ({args.type}, {args.timestampMode}) -- speed: {args.speed if args.speed > 0 else 'max'} -- time: {args.time} s")
+    print(f"{'backend':<10}{'frames/s':>12}{'x real time':>12}{'buffers/s':>12}{'MiB/s':>10}{'mean lag (ms)':>15}{'max lag (ms)':>14}")
+    for loop_backend, result in results.items():
+        print(f"{loop_backend:<10}{result['frames_per_second']:>12.0f}{result['frames_per_second'] / args.sampleRate:>12.2f}{result['buffers_per_second']:>12.1f}"
+              f"{result['mib_per_second']:>10.2f}{result['mean_lag_ms']:>15.1f}{result['max_lag_ms']:>14.1f}")
@@ -4,7 +4,7 @@ from .utils import _print_info, _print_warning
 
 
 class Controller(Watcher):
-    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control"):
+    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
         """Controller class
         Note: All values set with the controller class will be only visible through the "get_value()" method, or the "value" field in the list() function. Values streamed with the streamer, logger or monitor classes will not be affected.
 
@@ -13,8 +13,10 @@ class Controller(Watcher):
                 port (int, optional): Remote address port. Defaults to 5555.
                 data_add (str, optional): Data endpoint. Defaults to "gui_data".
                 control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the event loop in a dedicated background thread, so that data is received continuously and the sync methods can be called from any thread. See Watcher. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation: "asyncio", "uvloop" or an event loop created by the caller. See Watcher. Defaults to "asyncio".
         """
-        super(Controller, self).__init__(ip, port, data_add, control_add)
+        super(Controller, self).__init__(ip, port, data_add, control_add, run_in_thread, loop_backend)
 
         self._mode = "CONTROL"
 
@@ -38,7 +40,7 @@ class Controller(Watcher):
             while not all([_controlled_status[var] for var in variables]):
                 await asyncio.sleep(0.2)
 
-        self.loop.run_until_complete(
+        self._run(
             async_wait_for_control_mode_to_be_set(variables=variables))
 
         _print_info(
@@ -64,7 +66,7 @@ class Controller(Watcher):
             while all([_controlled_status[var] for var in variables]):
                 await asyncio.sleep(0.5)
 
-        self.loop.run_until_complete(
+        self._run(
             async_wait_for_control_mode_to_be_set(variables=variables))
 
         _print_info(f"Stopped controlling variables {variables}.")
@@ -1,13 +1,21 @@
 import os
 import asyncio
-import aiofiles
 import struct
-from .Watcher import Watcher
-from .utils import _print_error, _print_info, _print_ok, _print_warning
+import glob
+import time
+import math
+import shlex
+import shutil
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .Watcher import Watcher, _SSHSession
+from .utils import _print_error, _print_info, _print_ok, _print_warning, _select_time_range
 
 
 class Logger(Watcher):
-    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control"):
+    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
         """ Logger class
 
             Args:
@@ -15,15 +23,23 @@ class Logger(Watcher):
                 port (int, optional): Remote address port. Defaults to 5555.
                 data_add (str, optional): Data endpoint. Defaults to "gui_data".
                 control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the event loop in a dedicated background thread, so that data is received continuously and the sync methods can be called from any thread. See Watcher. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation: "asyncio", "uvloop" or an event loop created by the caller. See Watcher. Defaults to "asyncio".
         """
-        super(Logger, self).__init__(ip, port, data_add, control_add)
+        super(Logger, self).__init__(ip, port, data_add, control_add, run_in_thread, loop_backend)
 
         self._logging_mode = "OFF"
         self._logging_vars = []
         self._logging_transfer = True
+        self._logging_dir = "./"
 
         self._active_copying_tasks = []
 
+        # tail-follow transfer of the logged files (see __copy_file_in_chunks)
+        self.transfer_poll_interval = 0.05  # seconds between checks once the local copy has caught up
+        self.transfer_max_chunk_size = 2**22  # bytes
+        self._transfer_lag = {}  # remote path -> progress of the transfer
+
         self._mode = "LOG"
 
     # -- logging methods --
@@ -41,17 +57,22 @@ class Logger(Watcher):
 
         Args:
             variables (list of str, optional): List of variables to be logged. If no variables are passed, all variables in the watcher are logged. Defaults to [].
-            transfer (bool, optional): If True, the logged files will be transferred automatically during the logging session. Defaults to False. #FIXME too slow
+            transfer (bool, optional): If True, the logged files will be transferred automatically during the logging session (see transfer_lag). Defaults to True.
 
         Returns:
             list of str: List of local paths to the logged files.
         """
-        remote_paths = self.loop.run_until_complete(self.__async_logging_common_routine(
-            mode="FOREVER", timestamps=[], durations=[], variables=variables, logging_dir=logging_dir))
+        return self._run(self._async_start_logging(variables, transfer, logging_dir))
+
+    async def _async_start_logging(self, variables=[], transfer=True, logging_dir="./"):
+        """ Async version of start_logging()
+        """
+        remote_paths = await self.__async_logging_common_routine(
+            mode="FOREVER", timestamps=[], durations=[], variables=variables, logging_dir=logging_dir)
 
+        self._logging_transfer = transfer
         local_paths = {}
         if transfer:
-            self.connect_ssh()  # start ssh connection
             for var in [v for v in self.watcher_vars if v["name"] in variables]:
                 var = var["name"]
                 local_path = os.path.join(
@@ -84,7 +105,7 @@ class Logger(Watcher):
         assert isinstance(
             durations, list) and all(isinstance(duration, int) for duration in durations), "Error: durations must be a list of ints."
 
-        remote_paths = self.loop.run_until_complete(self.__async_logging_common_routine(
+        remote_paths = self._run(self.__async_logging_common_routine(
             mode="SCHEDULED", timestamps=timestamps, durations=durations, variables=variables, logging_dir=logging_dir))
 
         async def _async_schedule_logging(variables, timestamps, durations, transfer, logging_dir):
@@ -93,7 +114,6 @@ class Logger(Watcher):
 
             local_paths = {}
             if transfer:
-                self.connect_ssh()  # start ssh connection
 
                 async def _async_check_if_file_exists_and_start_copying(var, timestamp):
 
@@ -101,8 +121,9 @@ class Logger(Watcher):
                     while True:
                         _has_file_been_created = 0
 
-                        remote_file_size = self.sftp_client.stat(
-                            remote_paths[var]).st_size
+                        async with self._async_sftp() as sftp:
+                            remote_file_size = (await self._async_run_ssh(
+                                sftp.stat, remote_paths[var], channel=sftp)).st_size
 
                         if remote_file_size > 0:  # white till first buffers are written into the file
                             _has_file_been_created = 1
@@ -130,7 +151,7 @@ class Logger(Watcher):
 
                 _active_checking_tasks = []
                 for idx, var in enumerate(variables):
-                    check_task = self.loop.create_task(
+                    check_task = self._create_task(
                         _async_check_if_file_exists_and_start_copying(var, timestamps[idx]))
                     _active_checking_tasks.append(check_task)
 
@@ -144,8 +165,6 @@ class Logger(Watcher):
                 await asyncio.gather(*self._active_copying_tasks, return_exceptions=True)
                 self._active_copying_tasks.clear()
                 _active_checking_tasks.clear()
-                if self.sftp_client:
-                    self.disconnect_ssh()
 
                 # async version (non blocking)
                 # async def _async_cleanup():
@@ -156,7 +175,7 @@ class Logger(Watcher):
 
             return {"local_paths": local_paths, "remote_paths": remote_paths}
 
-        return self.loop.run_until_complete(_async_schedule_logging(variables=variables, timestamps=timestamps, durations=durations, transfer=transfer, logging_dir=logging_dir))
+        return self._run(_async_schedule_logging(variables=variables, timestamps=timestamps, durations=durations, transfer=transfer, logging_dir=logging_dir))
 
     async def __async_logging_common_routine(self, mode, timestamps=[], durations=[], variables=[], logging_dir="./"):
         # checks types and if no variables are specified, stream all watcher variables (default)
@@ -166,11 +185,14 @@ class Logger(Watcher):
             os.makedirs(logging_dir)
 
         if self.is_logging():
-            self.loop.create_task(self._async_stop_logging())
+            self._create_task(self._async_stop_logging())
 
         # self.connect_ssh()  # start ssh connection
 
         self._logging_mode = mode
+        self._logging_vars = variables
+        self._logging_dir = logging_dir
+        self._transfer_lag = {}
 
         remote_files, remote_paths = {}, {}
 
@@ -198,6 +220,8 @@ class Logger(Watcher):
             # if no variables specified, stop streaming all watcher variables (default)
             variables = [var["name"] for var in self.watcher_vars]
 
+        self._logging_vars = [
+            var for var in self._logging_vars if var not in variables]
         await self._async_send_ctrl_msg(
             {"watcher": [{"cmd": "unlog", "watchers": variables}]})
 
@@ -205,8 +229,6 @@ class Logger(Watcher):
 
         await asyncio.gather(*self._active_copying_tasks, return_exceptions=True)
         self._active_copying_tasks.clear()
-        if self.sftp_client:
-            self.disconnect_ssh()
 
     def stop_logging(self, variables=[]):
         """ Stops logging session. Sync wrapper for _async_stop_logging().
@@ -215,12 +237,38 @@ class Logger(Watcher):
             variables (list of str, optional): List of variables to stop logging. If none is passed, logging is stopped for all variables in the watcher. Defaults to [].
         """
 
-        return self.loop.run_until_complete(self._async_stop_logging(variables))
+        return self._run(self._async_stop_logging(variables))
+
+    async def _async_resume_session(self):
+        """ Restarts logging, after a reconnection, the variables that Bela stopped logging while disconnected. The logging continues in new files, which are transferred if the session was started with transfer=True and listed in the last discontinuity ("remote_paths").
+        """
+        if self._logging_mode != "FOREVER" or len(self._logging_vars) == 0:
+            return
+        _list = await self._async_list(max_age=0)
+        stopped = [var["name"] for var in _list["watchers"]
+                   if var["name"] in self._logging_vars and not var["logged"]]
+        if len(stopped) == 0:
+            return
+
+        await self._async_send_ctrl_msg({"watcher": [{"cmd": "log", "watchers": stopped}]})
+        _list = await self._async_list(max_age=0)
+        remote_paths = {var["name"]: f'/root/Bela/projects/{self.project_name}/{var["logFileName"]}'
+                        for var in _list["watchers"] if var["name"] in stopped}
+        self.discontinuities[-1]["remote_paths"] = remote_paths
+        _print_warning(
+            f"Bela stopped logging {stopped} while disconnected. Logging continues in new files: {list(remote_paths.values())}")
+
+        if self._logging_transfer:
+            for var, remote_path in remote_paths.items():
+                local_path = self._generate_local_filename(os.path.join(
+                    self._logging_dir, os.path.basename(remote_path)))
+                self._active_copying_tasks.append(
+                    self.__copy_file_in_chunks(remote_path, local_path))
 
     # -- binary file parsing method
 
     def read_binary_file(self, file_path, timestamp_mode):
-        """ Reads a binary file generated by the logger and returns a dictionary with the file contents.
+        """ Reads a binary file generated by the logger and returns a dictionary with the file contents. The buffers are read from a memory-mapped file (see open_binary_file()), so their data and rel_timestamps are read-only numpy views on the file.
 
         Args:
             file_path (str): Path of the file to be read.
@@ -232,71 +280,250 @@ class Logger(Watcher):
         if file_path is None:
             _print_error("Error: No file path provided.")
             return
+
+        log_file = self.open_binary_file(file_path, timestamp_mode)
+        records = log_file.records
+        parsed_buffers = [{"ref_timestamp": int(records["ref_timestamp"][idx]),
+                           **{name: records[name][idx] for name in records.dtype.names if name != "ref_timestamp"}}
+                          for idx in range(len(records))]
+
+        return {
+            "project_name": log_file.project_name,
+            "var_name": log_file.var_name,
+            "type": log_file.type,
+            # "pid": pid,
+            # "pid_id": pid_id,
+            "buffers": parsed_buffers
+        }
+
+    @staticmethod
+    def open_binary_file(file_path, timestamp_mode=None):
+        """ Opens a binary file generated by the logger without reading its contents. The header is parsed once and the buffers are memory-mapped as an array of records (ref_timestamp, data and, in sparse mode, rel_timestamps, including the padding of the buffers stored in the file). The flat data and timestamps arrays are only computed when they are accessed.
+
+        Args:
+            file_path (str): Path of the file to be read.
+            timestamp_mode (str, optional): Timestamp mode of the variable. Can be "dense" or "sparse". Defaults to None (inferred from the contents of the file, see _infer_timestamp_mode()).
+
+        Returns:
+            LogFile: Memory-mapped log file. See LogFile for the available attributes.
+        """
         file_size = os.path.getsize(file_path)
         assert file_size != 0, f"Error: The size of {file_path} is 0."
 
-        def _parse_null_terminated_string(file):
-            result = ""
-            while True:
-                char = file.read(1).decode('utf-8')
-                if char == '\0':
-                    break
-                result += char
-            return result
-
         with open(file_path, "rb") as file:
+            header = Logger._parse_binary_file_header(file)
 
-            # parse header
-            name = _parse_null_terminated_string(file)
-            var_name = _parse_null_terminated_string(file)
-            _type = _parse_null_terminated_string(file)
-            pid = struct.unpack("I", file.read(struct.calcsize("I")))[0]
-            pid_id = struct.unpack("I", file.read(struct.calcsize("I")))[0]
+        if timestamp_mode is None:
+            timestamp_mode = Logger._infer_timestamp_mode(file_path, header)
 
-            # if header size is not a multiple of 4, we need to add padding
-            header_size = len(name) + len(var_name) + len(_type) + \
-                3 + struct.calcsize("I") + struct.calcsize("I")
-            if header_size % 4 != 0:
-                file.read(4 - header_size % 4)  # padding
+        record_dtype = Logger._get_buffer_dtype(
+            header["type"], timestamp_mode, padded=True)
+        n_records, remainder = divmod(
+            file_size - header["header_size"], record_dtype.itemsize)
+        if remainder != 0:
+            _print_warning(
+                f"{file_path} ends with an incomplete buffer ({remainder} bytes), which will be ignored.")
 
-            _parse_type = 'i' if _type == 'j' else _type  # struct does not understand 'j'
+        records = np.memmap(file_path, dtype=record_dtype, mode="r", offset=header["header_size"], shape=(
+            n_records,)) if n_records > 0 else np.zeros(0, dtype=record_dtype)
 
-            # parse data buffers
-            parsed_buffers = []
-            while True:
-                # Read file buffer by buffer
+        return LogFile(file_path, header["project_name"], header["var_name"], header["type"], timestamp_mode, records)
+
+    def read_binary_files(self, path, timestamp_mode=None, output_dir=None, max_workers=None):
+        """ Decodes several binary files generated by the logger in parallel, in a pool of processes. The type of each variable is read from the header of its file and, unless timestamp_mode is given, its timestamp mode is inferred from the contents of the file. Each process writes the flat timestamps and data of a file to .npy files in output_dir ({file name}_timestamps.npy and {file name}_data.npy), which are returned memory-mapped, so that the decoded arrays are not pickled between processes. The .npy files are not removed automatically, since the returned arrays are read from them: once the arrays are no longer used, delete output_dir (the directory of the files is also the "output_dir" value of each result).
+
+        Args:
+            path (str or list of str): Directory with the .bin files, glob pattern (e.g. "./logs/*.bin") or list of file paths.
+            timestamp_mode (str, optional): Timestamp mode of all the variables ("dense" or "sparse"). Defaults to None (inferred for each file).
+            output_dir (str, optional): Directory where the .npy files are written. Defaults to None (a new temporary directory, see tempfile.mkdtemp()).
+            max_workers (int, optional): Number of processes. Defaults to None (number of CPUs).
+
+        Returns:
+            dict: Dictionary with the file paths as keys and dictionaries with the project name, variable name, type, timestamp mode, memory-mapped "timestamps" and "data" arrays and "output_dir" as values.
+        """
+        if isinstance(path, (list, tuple)):
+            file_paths = list(path)
+        elif os.path.isdir(path):
+            file_paths = sorted(glob.glob(os.path.join(path, "*.bin")))
+        else:
+            file_paths = sorted(glob.glob(path))
+        if len(file_paths) == 0:
+            _print_warning(f"No .bin files found in {path}.")
+            return {}
+
+        if output_dir is None:
+            output_dir = tempfile.mkdtemp(prefix="pybela-")
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+
+        decoded = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {file_path: executor.submit(_decode_binary_file, file_path, timestamp_mode, output_dir)
+                       for file_path in file_paths}
+            for file_path, future in futures.items():
                 try:
-                    data = file.read(self.get_buffer_size(
-                        _parse_type, timestamp_mode))
-                    if len(data) == 0:
-                        break  # No more data to read
-                    _parsed_buffer = self._parse_binary_data(
-                        data, timestamp_mode, _parse_type)
-                    parsed_buffers.append(_parsed_buffer)
-
-                except struct.error as e:
-                    _print_error(str(e))
-                    break  # No more data to read
+                    result = future.result()
+                except Exception as e:
+                    _print_error(f"Error decoding {file_path}: {e}")
+                    continue
+                for key in ("timestamps", "data"):
+                    result[key] = np.load(result[key], mmap_mode="r")
+                result["output_dir"] = output_dir
+                decoded[file_path] = result
 
-        return {
-            "project_name": name,
-            "var_name": var_name,
-            "type": _type,
-            # "pid": pid,
-            # "pid_id": pid_id,
-            "buffers": parsed_buffers
-        }
+        return decoded
+
+    def read_binary_file_time_range(self, file_path, timestamp_mode, start_timestamp=None, end_timestamp=None, save_index=False):
+        """ Returns the values logged in a binary file whose timestamps are in the range [start_timestamp, end_timestamp], with their timestamps. The buffers in the range are found by binary search in the index of ref_timestamps of the file (see LogFile.build_index()), and only those buffers are read and decoded. For sparse variables, the timestamps are computed from the rel_timestamps.
+
+        Args:
+            file_path (str): Path of the file to be read.
+            timestamp_mode (str): Timestamp mode of the variable. Can be "dense" or "sparse".
+            start_timestamp (int, optional): Start of the time range (in frames). Defaults to None (start of the file).
+            end_timestamp (int, optional): End of the time range (in frames). Defaults to None (end of the file).
+            save_index (bool, optional): Save the index in a sidecar file (file_path + ".idx") so that it is not built again in later queries on the same file. If the sidecar file can't be written (e.g. read-only directory), the index is only kept in memory. Defaults to False (nothing is written next to the log file).
+
+        Returns:
+            dict: Dictionary with flat "timestamps" and "data" arrays
+        """
+        log_file = self.open_binary_file(file_path, timestamp_mode)
+        log_file.build_index(save=save_index)
+        return log_file.get_time_range(start_timestamp, end_timestamp)
+
+    def iter_binary_file(self, file_path, timestamp_mode=None, chunk_size=2**16):
+        """ Iterates over the values logged in a binary file (and their timestamps) in chunks of chunk_size values, using constant memory. See LogFile.iter_chunks(). For reductions over the whole file computed chunk by chunk, see LogFile.min(), LogFile.max(), LogFile.mean() and LogFile.histogram().
+
+        Args:
+            file_path (str): Path of the file to be read.
+            timestamp_mode (str, optional): Timestamp mode of the variable. Can be "dense" or "sparse". Defaults to None (inferred from the contents of the file).
+            chunk_size (int, optional): Number of values in each chunk. Defaults to 2**16.
+
+        Returns:
+            generator: Generator of dictionaries with "timestamps" and "data" arrays
+        """
+        return self.open_binary_file(file_path, timestamp_mode).iter_chunks(chunk_size)
+
+    @staticmethod
+    def _parse_binary_file_header(file):
+        """ Parses the header of a binary file generated by the logger: project name, variable name and type (null-terminated strings), pid and pid_id (uint32), padded to a multiple of 4 bytes.
+
+        Args:
+            file (file object): File opened in binary mode, at position 0
+
+        Returns:
+            dict: Header fields and header size in bytes ("header_size")
+        """
+        header = file.read(256)
+        # read until the three strings and the pids are in the header
+        while header.count(b"\0") < 3 or len(header.split(b"\0", 3)[3]) < struct.calcsize("II"):
+            chunk = file.read(256)
+            if not chunk:
+                raise ValueError(f"Incomplete header in {file.name}.")
+            header += chunk
+        name, var_name, _type, rest = header.split(b"\0", 3)
+        pid, pid_id = struct.unpack_from("II", rest)
+
+        # if header size is not a multiple of 4, there is padding
+        header_size = len(name) + len(var_name) + len(_type) + \
+            3 + struct.calcsize("I") + struct.calcsize("I")
+        header_size += -header_size % 4
+
+        return {"project_name": name.decode("utf-8"),
+                "var_name": var_name.decode("utf-8"),
+                "type": _type.decode("utf-8"),
+                "pid": pid,
+                "pid_id": pid_id,
+                "header_size": header_size}
+
+    @staticmethod
+    def _infer_timestamp_mode(file_path, header):
+        """ Infers the timestamp mode of a binary file generated by the logger, as it is not stored in its header. Dense and sparse buffers have the same size, so the buffers are checked against both layouts: the ref_timestamps of consecutive dense buffers are data_length frames apart, and the rel_timestamps of sparse buffers start at 0, increase within the buffer and are smaller than the distance to the next buffer. If both layouts are consistent with the file, the rel_timestamps are only taken as such if they are not all 0. If none is, "dense" is assumed.
+
+        Args:
+            file_path (str): Path of the file
+            header (dict): Header of the file, as returned by _parse_binary_file_header()
+
+        Returns:
+            str: "dense" or "sparse"
+        """
+        record_dtype = Logger._get_buffer_dtype(
+            header["type"], "sparse", padded=True)
+        n_records = (os.path.getsize(file_path) -
+                     header["header_size"]) // record_dtype.itemsize
+        if n_records == 0:
+            return "dense"
+        records = np.memmap(file_path, dtype=record_dtype, mode="r",
+                            offset=header["header_size"], shape=(n_records,))
+
+        ref_timestamps = records["ref_timestamp"].astype(np.int64)
+        dense_length = Logger.get_data_length(header["type"], "dense")
+        is_dense = n_records > 1 and bool(
+            np.all(np.diff(ref_timestamps) == dense_length))
+
+        rel_timestamps = records["rel_timestamps"]
+        is_sparse = bool(np.all(rel_timestamps[:, 0] == 0))
+        if is_sparse:
+            # the first buffers are enough to check the order of the rel_timestamps
+            for rel in rel_timestamps[:8]:
+                filled = rel[:max(1, np.count_nonzero(rel) + 1)]
+                if np.any(np.diff(filled.astype(np.int64)) <= 0):
+                    is_sparse = False
+                    break
+        if is_sparse and n_records > 1:
+            is_sparse = bool(
+                np.all(rel_timestamps[:-1].max(axis=1) < np.diff(ref_timestamps)))
+
+        # dense data can only look like sparse buffers by chance if it has zeros where the rel_timestamps would be
+        if is_sparse and (not is_dense or np.any(rel_timestamps[:8] != 0)):
+            return "sparse"
+        if not is_dense:
+            _print_warning(
+                f"The timestamp mode of {file_path} could not be inferred, assuming 'dense'.")
+        return "dense"
 
     # -- file transfer utils --
     # expand copy_file_from_bela method in Watcher
 
+    @property
+    def transfer_lag(self):
+        """ Progress of the transfers of the files logged in the current logging session (with transfer=True).
+
+        Returns:
+            dict: For each remote path: local path, size of the remote file ("remote_size"), bytes transferred, how far the local copy trails the remote file in bytes ("lag_bytes") and in seconds of logged data ("lag_seconds", estimated from the growth rate of the remote file), transfer rate ("bytes_per_second") and whether the transfer has finished ("done")
+        """
+        return {remote_path: dict(lag) for remote_path, lag in self._transfer_lag.items()}
+
+    def stats(self):
+        """ Returns the stats of the data pipeline (see Watcher.stats()) and the progress of the file transfers ("transfers", see transfer_lag).
+
+        Returns:
+            dict: Stats
+        """
+        stats = super().stats()
+        stats["transfers"] = self.transfer_lag
+        return stats
+
+    @staticmethod
+    def _read_range(remote_file, offset, size):
+        """ Reads size bytes of a remote file starting at offset. readv() splits the range into SFTP requests that are sent in parallel, instead of waiting for the response of each request before sending the next one.
+
+        Args:
+            remote_file (paramiko.SFTPFile): Remote file
+            offset (int): Offset in bytes
+            size (int): Number of bytes
+
+        Returns:
+            bytes: Data
+        """
+        return b"".join(remote_file.readv([(offset, size)]))
+
     def __copy_file_in_chunks(self, remote_path, local_path,  chunk_size=2**12):
-        """ Copies a file from the remote path to the local path in chunks. This function is called by start_logging() if transfer=True.
+        """ Copies a file from the remote path to the local path while it is being logged (tail-follow). This function is called by start_logging() if transfer=True. All the data available in the remote file is read at once, in chunks that grow with the backlog up to transfer_max_chunk_size, and the task only sleeps (transfer_poll_interval) when it has caught up with the remote file. The progress of the transfer is reported in transfer_lag.
 
         Args:
             remote_path (str): Path to the file in Bela.
             local_path (str): Path to the file in the local machine (where the file is copied to)
-            chunk_size (int, optional): Chunk size. Defaults to 2**12.
+            chunk_size (int, optional): Initial chunk size. Defaults to 2**12.
 
         Returns:
             asyncio.Task: Task that copies the file in chunks.
@@ -304,40 +531,71 @@ class Logger(Watcher):
 
         async def async_copy_file_in_chunks(remote_path, local_path, chunk_size=2**12):
 
-            while True:
-                # Wait for a second before checking again
-                await asyncio.sleep(1)  # TODO can this be lower?
-
-                try:
-                    remote_file = self.sftp_client.open(remote_path, 'rb')
-                    remote_file_size = self.sftp_client.stat(
-                        remote_path).st_size
-
-                    if remote_file_size > 0:  # white till first buffers are written into the file
-                        break  # Break the loop if the remote file size is non-zero
-
-                except FileNotFoundError:
-                    _print_error(
-                        f"Remote file '{remote_path}' does not exist.")
-                    return None
-
+            lag = {"local_path": local_path, "remote_size": 0, "transferred": 0, "lag_bytes": 0,
+                   "lag_seconds": 0.0, "bytes_per_second": 0.0, "done": False}
+            self._transfer_lag[remote_path] = lag
             try:
-                async with aiofiles.open(local_path, 'wb') as local_file:
+                # each transfer reads through its own channel of the ssh session. The reads run in the ssh executor (see _async_run_ssh), so the websockets keep being read during the transfer
+                async with self._async_sftp() as sftp:
+                    # wait till first buffers are written into the file
+                    poll_interval = self.transfer_poll_interval
                     while True:
-                        chunk = remote_file.read(chunk_size)
-                        # keep checking file whilst logging is still going on (in case a variable fills the buffers slowly)
-                        if not chunk and self._logging_mode == "OFF":
-                            await asyncio.sleep(0.1)  # flushed data
+                        remote_size = (await self._async_run_ssh(
+                            sftp.stat, remote_path, channel=sftp)).st_size
+                        if remote_size > 0:
                             break
-                        await local_file.write(chunk)
-                        _print_ok(
-                            f"\rTransferring {remote_path}-->{local_path}...", end="", flush=True)
-                        await asyncio.sleep(0.1)
-                    chunk = remote_file.read()
-                    if chunk:
-                        await local_file.write(chunk)
-                    remote_file.close()
-                    _print_ok("Done.")
+                        await asyncio.sleep(poll_interval)
+                        poll_interval = min(2*poll_interval, 1)
+
+                    remote_file = await self._async_run_ssh(sftp.open, remote_path, 'rb', channel=sftp)
+                    _print_ok(f"Transferring {remote_path}-->{local_path}...")
+
+                    import aiofiles  # imported on the first transfer
+                    start_time, start_size = time.perf_counter(), remote_size
+                    transferred, flushing = 0, False
+                    async with aiofiles.open(local_path, 'wb') as local_file:
+                        while True:
+                            backlog = remote_size - transferred
+                            if backlog > 0:
+                                data = await self._async_run_ssh(
+                                    self._read_range, remote_file, transferred, min(backlog, chunk_size), channel=sftp)
+                                await local_file.write(data)
+                                transferred += len(data)
+                                # the chunks grow while the transfer is behind, and shrink back once it catches up
+                                if backlog > chunk_size:
+                                    chunk_size = min(
+                                        2*chunk_size, self.transfer_max_chunk_size)
+                                elif backlog < chunk_size // 4:
+                                    chunk_size = max(chunk_size // 2, 2**12)
+                            elif flushing:
+                                break
+                            elif self._logging_mode == "OFF":
+                                # check the file once more for the data flushed when logging stopped
+                                await asyncio.sleep(0.1)
+                                flushing = True
+                            else:
+                                await asyncio.sleep(self.transfer_poll_interval)
+
+                            remote_size = (await self._async_run_ssh(
+                                sftp.stat, remote_path, channel=sftp)).st_size
+
+                            elapsed = time.perf_counter() - start_time
+                            growth_rate = (remote_size - start_size) / \
+                                elapsed if elapsed > 0 else 0
+                            lag.update({"remote_size": remote_size, "transferred": transferred,
+                                        "lag_bytes": remote_size - transferred,
+                                        "lag_seconds": (remote_size - transferred) / growth_rate if growth_rate > 0 else 0.0,
+                                        "bytes_per_second": transferred / elapsed if elapsed > 0 else 0.0})
+
+                    await self._async_run_ssh(remote_file.close, channel=sftp)
+                    lag["done"] = True
+                    _print_ok(
+                        f"Transferring {remote_path}-->{local_path}... Done.")
+
+            except FileNotFoundError:
+                _print_error(
+                    f"Remote file '{remote_path}' does not exist.")
+                return None
 
             except Exception as e:
                 _print_error(
@@ -347,24 +605,30 @@ class Logger(Watcher):
             finally:
                 await self._async_remove_item_from_list(self._active_copying_tasks, asyncio.current_task())
 
-        return self.loop.create_task(async_copy_file_in_chunks(remote_path, local_path, chunk_size))
+        return self._create_task(async_copy_file_in_chunks(remote_path, local_path, chunk_size))
 
-    def copy_all_bin_files_in_project(self, dir="./", verbose=True):
-        """ Copies all .bin files in the specified remote directory using SFTP.
+    def copy_all_bin_files_in_project(self, dir="./", verbose=True, method="sftp", compress=False):
+        """ Copies all .bin files in the specified remote directory.
 
         Args:
             dir (str, optional): Path to the local directory where the files are copied to. Defaults to "./".
             verbose (bool, optional): Show info messages. Defaults to True.
+            method (str, optional): "sftp" copies each file with its own SFTP transfer. "tar" streams all the files as a tar archive through a single ssh exec channel and unpacks them as they arrive, which avoids the round trips per file when there are many files. Defaults to "sftp".
+            compress (bool, optional): Enable ssh transport compression for method="tar", which speeds up sparse or low-entropy logs on slow links. Defaults to False.
         """
+        if method not in ("sftp", "tar"):
+            raise ValueError(
+                f"Invalid method: {method}. Use 'sftp' or 'tar'.")
         remote_path = f'/root/Bela/projects/{self.project_name}'
         try:
-            self.connect_ssh()
-            copy_tasks = self._action_on_all_bin_files_in_project(
-                "copy", dir)
+            if method == "tar":
+                self._run(self._async_copy_bin_files_with_tar(dir, compress))
+            else:
+                copy_tasks = self._run(self._async_action_on_all_bin_files_in_project(
+                    "copy", dir))
 
-            # wait until all files are copied
-            self.loop.run_until_complete(asyncio.gather(
-                *copy_tasks, return_exceptions=True))
+                # wait until all files are copied
+                self._run(self._async_wait_for_tasks(copy_tasks))
 
             if verbose:
                 _print_ok(
@@ -372,8 +636,71 @@ class Logger(Watcher):
         except Exception as e:
             _print_error(
                 f"Error copying .bin files in {remote_path}: {e}")
+
+    async def _async_copy_bin_files_with_tar(self, local_dir, compress=False):
+        """ Copies the .bin files of the project through a single ssh exec channel, as a tar stream that is unpacked as it is received. Files that already exist in local_dir are renamed (see _generate_local_filename()). Raises a RuntimeError if tar fails in Bela (e.g. if a file is removed during the transfer).
+
+        Args:
+            local_dir (str): Local directory
+            compress (bool, optional): Enable ssh transport compression. A dedicated ssh connection is opened for the transfer, since compression is negotiated when connecting. Defaults to False.
+
+        Returns:
+            list of str: Local paths of the copied files
+        """
+        remote_path = f'/root/Bela/projects/{self.project_name}'
+        async with self._async_sftp() as sftp:
+            file_list = await self._async_run_ssh(sftp.listdir, remote_path, channel=sftp)
+        file_names = [file_name for file_name in file_list if file_name.endswith('.bin')]
+        if len(file_names) == 0:
+            _print_warning(f"No .bin files in {remote_path}.")
+            return []
+        os.makedirs(local_dir, exist_ok=True)
+
+        session = _SSHSession(
+            self.ip, compress=True) if compress else self._get_ssh_session()
+        command = f"tar -C {shlex.quote(remote_path)} -cf - -- " + \
+            " ".join(shlex.quote(file_name) for file_name in file_names)
+        channel = None
+        try:
+            _, stdout, stderr = await self._async_run_ssh(session.exec_command, command)
+            channel = stdout.channel
+            # a stalled stream is aborted by the channel timeout, so the transfer itself has no time limit
+            channel.settimeout(self.ssh_timeout)
+            local_paths = await self._async_run_ssh(self._unpack_tar_stream, stdout, local_dir, timeout=math.inf, channel=channel)
+            exit_status = await self._async_run_ssh(channel.recv_exit_status, channel=channel)
+            if exit_status != 0:
+                error = (await self._async_run_ssh(stderr.read, channel=channel)).decode(errors="replace")
+                raise RuntimeError(
+                    f"tar exited with status {exit_status} after copying {len(local_paths)} of {len(file_names)} files: {error.strip()}")
         finally:
-            self.disconnect_ssh()
+            if channel is not None:
+                channel.close()
+            if compress:
+                session.close()
+        return local_paths
+
+    def _unpack_tar_stream(self, stream, local_dir):
+        """ Unpacks the files of a tar stream into local_dir as the stream is read. Runs in the ssh executor.
+
+        Args:
+            stream (file-like object): Tar stream
+            local_dir (str): Local directory
+
+        Returns:
+            list of str: Local paths of the unpacked files
+        """
+        local_paths = []
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                # only the file name is used, so the archive can't write outside local_dir
+                local_path = self._generate_local_filename(
+                    os.path.join(local_dir, os.path.basename(member.name)))
+                with tar.extractfile(member) as remote_file, open(local_path, "wb") as local_file:
+                    shutil.copyfileobj(remote_file, local_file, 2**20)
+                local_paths.append(local_path)
+        return local_paths
 
     def finish_copying_file(self, remote_path, local_path):  # TODO test
         """Finish copying file if it was interrupted. This function is used to copy the remaining part of a file that was interrupted during the copy process.
@@ -382,45 +709,49 @@ class Logger(Watcher):
            remote_path (str): Path to the file in Bela.
             local_path (str): Path to the file in the local machine (where the file is copied to)
         """
-        self.connect_ssh()
-
-        try:
-            remote_file = self.sftp_client.open(remote_path, 'rb')
-            remote_file_size = self.sftp_client.stat(
-                remote_path).st_size
-        except FileNotFoundError:
-            _print_error(
-                f"Remote file '{remote_path}' does not exist.")
-            self.disconnect_ssh()
-            return None
-        if not os.path.exists(local_path):
-            _print_error(
-                f"Local file '{local_path}' does not exist. If you want to copy a file that hasn't been partially copied yet, use copy_file_from_bela() instead.")
-            self.disconnect_ssh()
-            return None
-        local_file_size = os.path.getsize(local_path)
-
-        try:
-            if local_file_size < remote_file_size:
-                # Calculate the remaining part to copy
-                remaining_size = remote_file_size - local_file_size
-                # Use readv to read the remaining part of the file
-                chunks = [(local_file_size, remaining_size)]
-                data = remote_file.readv(chunks)
+        return self._run(self._async_finish_copying_file(remote_path, local_path))
 
-                _print_ok(
-                    f"\rTransferring {remote_path}-->{local_path}...", end="", flush=True)
-                # Append the data to the local file
-                with open(local_path, 'ab') as local_file:
-                    local_file.write(data)
-                _print_ok("Done.")
-            else:
+    async def _async_finish_copying_file(self, remote_path, local_path):
+        """ Async version of finish_copying_file()
+        """
+        async with self._async_sftp() as sftp:
+            try:
+                remote_file = await self._async_run_ssh(sftp.open, remote_path, 'rb', channel=sftp)
+                remote_file_size = (await self._async_run_ssh(
+                    sftp.stat, remote_path, channel=sftp)).st_size
+            except FileNotFoundError:
                 _print_error(
-                    "Local file is already up-to-date or larger than the remote file.")
-        except Exception as e:
-            _print_error(f"Error finishing file copy: {e}")
+                    f"Remote file '{remote_path}' does not exist.")
+                return None
+            if not os.path.exists(local_path):
+                _print_error(
+                    f"Local file '{local_path}' does not exist. If you want to copy a file that hasn't been partially copied yet, use copy_file_from_bela() instead.")
+                await self._async_run_ssh(remote_file.close, channel=sftp)
+                return None
+            local_file_size = os.path.getsize(local_path)
 
-        self.disconnect_ssh()
+            try:
+                if local_file_size < remote_file_size:
+                    # Calculate the remaining part to copy
+                    remaining_size = remote_file_size - local_file_size
+                    # Use readv to read the remaining part of the file
+                    chunks = [(local_file_size, remaining_size)]
+                    data = await self._async_run_ssh(
+                        lambda: b"".join(remote_file.readv(chunks)), channel=sftp)
+
+                    _print_ok(
+                        f"\rTransferring {remote_path}-->{local_path}...", end="", flush=True)
+                    # Append the data to the local file
+                    with open(local_path, 'ab') as local_file:
+                        local_file.write(data)
+                    _print_ok("Done.")
+                else:
+                    _print_error(
+                        "Local file is already up-to-date or larger than the remote file.")
+            except Exception as e:
+                _print_error(f"Error finishing file copy: {e}")
+            finally:
+                await self._async_run_ssh(remote_file.close, channel=sftp)
 
     def delete_file_from_bela(self, remote_path, verbose=True):
         """Deletes a file from the remote path in Bela.
@@ -428,23 +759,19 @@ class Logger(Watcher):
         Args:
             remote_path (str): Path to the remote file to be deleted. 
         """
-        self.connect_ssh()
-        self.loop.run_until_complete(
+        self._run(
             self._async_delete_file_from_bela(remote_path, verbose))
-        self.disconnect_ssh()
 
     def delete_all_bin_files_in_project(self, verbose=True):
         """ Deletes all .bin files in the specified remote directory using SFTP.
         """
         remote_path = f'/root/Bela/projects/{self.project_name}'
         try:
-            self.connect_ssh()
-            deletion_tasks = self._action_on_all_bin_files_in_project(
-                "delete")
+            deletion_tasks = self._run(self._async_action_on_all_bin_files_in_project(
+                "delete"))
 
             # wait until all files are deleted
-            self.loop.run_until_complete(asyncio.gather(
-                *deletion_tasks, return_exceptions=True))
+            self._run(self._async_wait_for_tasks(deletion_tasks))
 
             if verbose:
                 _print_ok(
@@ -452,41 +779,42 @@ class Logger(Watcher):
         except Exception as e:
             _print_error(
                 f"Error deleting .bin files in {remote_path}: {e}")
-        finally:
-            self.disconnect_ssh()
 
     async def _async_delete_file_from_bela(self, remote_path, verbose=True):
         # this function doesn't return until the file has been deleted
-        try:
-            self.sftp_client.stat(remote_path)  # check if file exists
-        except FileNotFoundError:
-            _print_error(
-                f"Error: Remote file '{remote_path}' does not exist.")
-            return
-
-        while True:
-            await asyncio.sleep(0.1)  # Adjust the interval as needed
+        async with self._async_sftp() as sftp:
             try:
-                # Attempt to remove the file
-                self.sftp_client.remove(remote_path)
+                # check if file exists
+                await self._async_run_ssh(sftp.stat, remote_path, channel=sftp)
             except FileNotFoundError:
-                # File does not exist, it has been successfully removed
-                if verbose:
-                    _print_ok(
-                        f"File '{remote_path}' has been removed from Bela.")
-                break
-            except Exception as e:
                 _print_error(
-                    f"Error while deleting file in Bela: {e} ")
-                break
+                    f"Error: Remote file '{remote_path}' does not exist.")
+                return
+
+            while True:
+                await asyncio.sleep(0.1)  # Adjust the interval as needed
+                try:
+                    # Attempt to remove the file
+                    await self._async_run_ssh(sftp.remove, remote_path, channel=sftp)
+                except FileNotFoundError:
+                    # File does not exist, it has been successfully removed
+                    if verbose:
+                        _print_ok(
+                            f"File '{remote_path}' has been removed from Bela.")
+                    break
+                except Exception as e:
+                    _print_error(
+                        f"Error while deleting file in Bela: {e} ")
+                    break
 
-    def _action_on_all_bin_files_in_project(self, action, local_dir=None):
+    async def _async_action_on_all_bin_files_in_project(self, action, local_dir=None):
         # List all files in the remote directory
         remote_path = f'/root/Bela/projects/{self.project_name}'
-        file_list = self.sftp_client.listdir(remote_path)
+        async with self._async_sftp() as sftp:
+            file_list = await self._async_run_ssh(sftp.listdir, remote_path, channel=sftp)
         if len(file_list) == 0:
             _print_warning(f"No .bin files in {remote_path}.")
-            return
+            return []
 
         # Iterate through the files and delete .bin files
         tasks = []
@@ -495,11 +823,11 @@ class Logger(Watcher):
             if file_name.endswith('.bin'):
                 remote_file_path = f"{remote_path}/{file_name}"
                 if action == "delete":
-                    task = self.loop.create_task(
+                    task = self._create_task(
                         self._async_delete_file_from_bela(remote_file_path))
                 elif action == "copy":
                     local_filename = os.path.join(local_dir, file_name)
-                    task = self.loop.create_task(
+                    task = self._create_task(
                         self._async_copy_file_from_bela(remote_file_path, local_filename))
                 else:
                     raise ValueError(f"Invalid action: {action}")
@@ -510,3 +838,237 @@ class Logger(Watcher):
     def __del__(self):
         super().__del__()
         self.disconnect_ssh()  # disconnect ssh
+
+
+def _decode_binary_file(file_path, timestamp_mode, output_dir, chunk_size=2**18):
+    """ Decodes a binary file generated by the logger into .npy files with its flat timestamps and data. Runs in the processes of Logger.read_binary_files(). The values are decoded in chunks of chunk_size values (see LogFile.iter_chunks()), so that the memory used does not depend on the size of the file.
+
+    Args:
+        file_path (str): Path of the file
+        timestamp_mode (str): Timestamp mode of the variable ("dense" or "sparse"), or None to infer it
+        output_dir (str): Directory of the .npy files, or None for the directory of the file
+        chunk_size (int, optional): Number of values decoded at a time. Defaults to 2**18.
+
+    Returns:
+        dict: Project name, variable name, type, timestamp mode and paths of the "timestamps" and "data" .npy files
+    """
+    log_file = Logger.open_binary_file(file_path, timestamp_mode)
+    records = log_file.records
+
+    if log_file.timestamp_mode == "sparse":
+        # the padding at the end of partially filled buffers is discarded, so the number of values is counted first
+        buffers_per_chunk = max(1, chunk_size // records.dtype["data"].shape[0])
+        n_values = len(records) + sum(int(np.count_nonzero(records["rel_timestamps"][start:start+buffers_per_chunk, 1:]))
+                                      for start in range(0, len(records), buffers_per_chunk))
+    else:
+        n_values = records["data"].size
+
+    base_path = os.path.join(output_dir if output_dir is not None else os.path.dirname(file_path),
+                             os.path.splitext(os.path.basename(file_path))[0])
+    paths = {"timestamps": f"{base_path}_timestamps.npy",
+             "data": f"{base_path}_data.npy"}
+    outputs = {"timestamps": np.lib.format.open_memmap(paths["timestamps"], mode="w+", dtype=np.uint64, shape=(n_values,)),
+               "data": np.lib.format.open_memmap(paths["data"], mode="w+", dtype=records.dtype["data"].base, shape=(n_values,))}
+
+    position = 0
+    for chunk in log_file.iter_chunks(chunk_size):
+        n_decoded = len(chunk["data"])
+        for key, output in outputs.items():
+            output[position:position+n_decoded] = chunk[key]
+        position += n_decoded
+
+    for output in outputs.values():
+        output.flush()
+
+    return {"project_name": log_file.project_name,
+            "var_name": log_file.var_name,
+            "type": log_file.type,
+            "timestamp_mode": log_file.timestamp_mode,
+            **paths}
+
+
+class LogFile:
+    def __init__(self, file_path, project_name, var_name, _type, timestamp_mode, records):
+        """ Memory-mapped binary file generated by the logger. Returned by Logger.open_binary_file().
+
+            Args:
+                file_path (str): Path of the file
+                project_name (str): Name of the Bela project
+                var_name (str): Name of the logged variable
+                _type (str): Type of the variable
+                timestamp_mode (str): Timestamp mode of the variable ("dense" or "sparse")
+                records (np.memmap): Buffers in the file, as an array of records
+        """
+        self.file_path = file_path
+        self.project_name = project_name
+        self.var_name = var_name
+        self.type = _type
+        self.timestamp_mode = timestamp_mode
+        self.records = records
+        self._index = None
+
+    def __len__(self):
+        """ Number of buffers in the file """
+        return len(self.records)
+
+    @property
+    def ref_timestamps(self):
+        """ Reference timestamp of each buffer (n_buffers,) """
+        return self.records["ref_timestamp"]
+
+    @property
+    def data(self):
+        """ Flat array with the logged values. Computed from the records each time it is accessed, so it reads the whole file into memory (use iter_chunks() or get_time_range() to read it in parts). In sparse mode, the padding at the end of partially filled buffers is discarded, as in iter_chunks(). """
+        return self.get_time_range()["data"]
+
+    @property
+    def timestamps(self):
+        """ Flat array with the timestamp of each logged value, aligned with data. In dense mode, values are logged at consecutive frames starting at the ref_timestamp of their buffer. In sparse mode, the timestamp of each value is the ref_timestamp of its buffer plus its relative timestamp, and the padding is discarded. Computed from the records each time it is accessed, like data. """
+        return self.get_time_range()["timestamps"]
+
+    @property
+    def index_path(self):
+        """ Path of the sidecar file where the index is saved """
+        return self.file_path + ".idx"
+
+    @property
+    def index(self):
+        """ Index of ref_timestamps of the buffers (n_buffers,). Built on the fly (see build_index()) the first time it is accessed. """
+        if self._index is None:
+            self.build_index(save=False)
+        return self._index
+
+    def build_index(self, save=True):
+        """ Builds the index of ref_timestamps of the buffers in the file, used to find time ranges by binary search (see get_time_range()). If a sidecar index file exists, it is loaded and only the buffers appended to the log file since it was saved are indexed. Reading the ref_timestamps of the buffers reads most of the file from disk, so saving the index speeds up later queries on the same file.
+
+            Args:
+                save (bool, optional): Save the index in the sidecar file (index_path). Defaults to True.
+
+            Returns:
+                np.ndarray: Index of ref_timestamps
+        """
+        index = np.zeros(0, dtype="<u8")
+        if os.path.exists(self.index_path):
+            index = np.fromfile(self.index_path, dtype="<u8")
+            # discard the saved index if the log file has been replaced
+            if len(index) > len(self.records) or (len(index) > 0 and (index[0] != self.records["ref_timestamp"][0] or index[-1] != self.records["ref_timestamp"][len(index)-1])):
+                index = np.zeros(0, dtype="<u8")
+
+        n_saved = len(index)
+        if n_saved < len(self.records):
+            index = np.concatenate(
+                (index, self.records["ref_timestamp"][n_saved:].astype("<u8")))
+            if save:
+                try:
+                    index.tofile(self.index_path)
+                except OSError as e:
+                    _print_warning(
+                        f"Could not save index of {self.file_path}: {e}")
+
+        self._index = index
+        return self._index
+
+    def get_time_range(self, start_timestamp=None, end_timestamp=None):
+        """ Returns the values whose timestamps are in the range [start_timestamp, end_timestamp], with their timestamps. Only the buffers overlapping the range are read from the file.
+
+            Args:
+                start_timestamp (int, optional): Start of the time range (in frames). Defaults to None (start of the file).
+                end_timestamp (int, optional): End of the time range (in frames). Defaults to None (end of the file).
+
+            Returns:
+                dict: Dictionary with flat "timestamps" and "data" arrays
+        """
+        return _select_time_range(self.records, self.index, self.timestamp_mode, start_timestamp, end_timestamp)
+
+    def iter_chunks(self, chunk_size=2**16):
+        """ Iterates over the values in the file (and their timestamps) in chunks of chunk_size values. Only the buffers needed for each chunk are read and decoded, so the memory used depends on chunk_size and not on the size of the file. In sparse mode, the padding at the end of partially filled buffers is discarded.
+
+            Args:
+                chunk_size (int, optional): Number of values in each chunk (the last chunk can be shorter). Defaults to 2**16.
+
+            Yields:
+                dict: Dictionary with "timestamps" and "data" arrays of chunk_size values
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size should be positive.")
+        buffers_per_chunk = max(1, chunk_size // self.records.dtype["data"].shape[0])
+
+        pending = None
+        for start in range(0, len(self.records), buffers_per_chunk):
+            chunk = self.records[start:start+buffers_per_chunk]
+            decoded = _select_time_range(
+                chunk, chunk["ref_timestamp"], self.timestamp_mode)
+            if pending is not None:
+                decoded = {key: np.concatenate((pending[key], decoded[key]))
+                           for key in decoded}
+            n_chunks = len(decoded["data"]) // chunk_size
+            for idx in range(n_chunks):
+                yield {key: value[idx*chunk_size:(idx+1)*chunk_size] for key, value in decoded.items()}
+            pending = {key: value[n_chunks*chunk_size:]
+                       for key, value in decoded.items()}
+
+        if pending is not None and len(pending["data"]) > 0:
+            yield pending
+
+    def min(self, chunk_size=2**16):
+        """ Minimum of the values in the file, computed chunk by chunk (see iter_chunks())
+
+            Args:
+                chunk_size (int, optional): Number of values in each chunk. Defaults to 2**16.
+
+            Returns:
+                Minimum value, or None if the file has no values
+        """
+        minima = [chunk["data"].min()
+                  for chunk in self.iter_chunks(chunk_size)]
+        return min(minima).item() if len(minima) > 0 else None
+
+    def max(self, chunk_size=2**16):
+        """ Maximum of the values in the file, computed chunk by chunk (see iter_chunks())
+
+            Args:
+                chunk_size (int, optional): Number of values in each chunk. Defaults to 2**16.
+
+            Returns:
+                Maximum value, or None if the file has no values
+        """
+        maxima = [chunk["data"].max()
+                  for chunk in self.iter_chunks(chunk_size)]
+        return max(maxima).item() if len(maxima) > 0 else None
+
+    def mean(self, chunk_size=2**16):
+        """ Mean of the values in the file, computed chunk by chunk (see iter_chunks()) with float64 accumulators
+
+            Args:
+                chunk_size (int, optional): Number of values in each chunk. Defaults to 2**16.
+
+            Returns:
+                float: Mean value, or None if the file has no values
+        """
+        total, count = 0.0, 0
+        for chunk in self.iter_chunks(chunk_size):
+            total += chunk["data"].sum(dtype=np.float64)
+            count += len(chunk["data"])
+        return float(total / count) if count > 0 else None
+
+    def histogram(self, bins=10, range=None, chunk_size=2**16):
+        """ Histogram of the values in the file, computed chunk by chunk (see iter_chunks()). The arguments and return values are the same as numpy.histogram().
+
+            Args:
+                bins (int or sequence, optional): Number of bins or bin edges. Defaults to 10.
+                range (tuple, optional): Lower and upper range of the bins. Defaults to None (minimum and maximum of the values, which takes an extra pass over the file).
+                chunk_size (int, optional): Number of values in each chunk. Defaults to 2**16.
+
+            Returns:
+                tuple: Counts in each bin and bin edges
+        """
+        if np.ndim(bins) == 0 and range is None:
+            range = (self.min(chunk_size), self.max(chunk_size))
+            if range[0] is None:
+                range = (0, 1)
+        bin_edges = np.histogram_bin_edges([], bins=bins, range=range)
+
+        counts = np.zeros(len(bin_edges) - 1, dtype=np.int64)
+        for chunk in self.iter_chunks(chunk_size):
+            counts += np.histogram(chunk["data"], bins=bin_edges)[0]
+        return counts, bin_edges
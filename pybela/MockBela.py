@@ -0,0 +1,422 @@
+import asyncio
+import collections
+import json
+import os
+import struct
+import threading
+import time
+import websockets
+import numpy as np
+from .Watcher import Watcher, _numpy_type_map
+from .utils import _print_error
+
+# variables of the bela-test project (test/bela-test/render.cpp)
+_default_variables = [
+    {"name": "myvar", "type": "d", "timestamp_mode": "dense"},
+    {"name": "myvar2", "type": "j", "timestamp_mode": "dense"},
+    {"name": "myvar3", "type": "j", "timestamp_mode": "sparse"},
+    {"name": "myvar4", "type": "d", "timestamp_mode": "sparse"},
+    {"name": "myvar5", "type": "d", "timestamp_mode": "dense"},
+]
+
+
+class MockBela:
+    def __init__(self, variables=None, sample_rate=44100, speed=1.0, ip="127.0.0.1", port=5555, data_add="gui_data", control_add="gui_control", project_name="mock-bela", sparse_period=12, block_size=16, log_dir=None):
+        """ MockBela class - local websocket server that implements the protocol of the Bela watcher, so that pybela can be tested and benchmarked without a Bela board. The server runs in its own thread and event loop (see start()), emulating a Bela project that assigns the current frame to each watcher variable at every frame (as in test/bela-test): dense variables are assigned at every frame and sparse variables every sparse_period frames. Controlled variables take the value set with the "set" command instead.
+
+            Args:
+                variables (list of dicts, optional): Watcher variables, as dicts with "name", "type" ("f", "j", "i", "c", "d") and "timestamp_mode" ("dense" or "sparse"). Defaults to None (the variables of the bela-test project).
+                sample_rate (int, optional): Sample rate of the emulated project. Defaults to 44100.
+                speed (float, optional): Rate at which frames are emitted, relative to real time (e.g. 10 emits 10 times as many frames per second as Bela would). If None, frames are emitted as fast as possible. Defaults to 1.0.
+                ip (str, optional): Address the server listens on. Defaults to "127.0.0.1".
+                port (int, optional): Port the server listens on. If 0, a free port is chosen (see port after start()). Defaults to 5555.
+                data_add (str, optional): Data endpoint. Defaults to "gui_data".
+                control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                project_name (str, optional): Project name sent on connection. Defaults to "mock-bela".
+                sparse_period (int, optional): Number of frames between assignments of sparse variables. Defaults to 12.
+                block_size (int, optional): Number of frames emitted at a time. Defaults to 16.
+                log_dir (str, optional): Directory where the log files of logged variables are written. If None, log commands are acknowledged but no files are written. Defaults to None.
+        """
+        self.variables = [dict(var) for var in (
+            variables if variables is not None else _default_variables)]
+        for var in self.variables:
+            if var["type"] not in _numpy_type_map or var["timestamp_mode"] not in ["dense", "sparse"]:
+                raise ValueError(
+                    f"Unsupported type or timestamp mode for {var['name']}: {var['type']}, {var['timestamp_mode']}")
+
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.ip = ip
+        self.port = port
+        self.data_add = data_add
+        self.control_add = control_add
+        self.project_name = project_name
+        self.sparse_period = sparse_period
+        self.block_size = block_size
+        self.log_dir = log_dir
+
+        self.frame = 0
+        self._state = [self._initial_var_state() for _ in self.variables]
+
+        self._ctrl_connections = set()
+        self._data_connections = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stop_event = None
+
+        # stats
+        self.sent_buffers = 0
+        self.sent_bytes = 0
+        self.received_buffers = []
+        self.received_list_requests = 0
+        self.received_ctrl_msgs = 0
+        self.received_cmds = collections.Counter()  # watcher commands received, by name
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- server methods --- #
+
+    def start(self):
+        """ Starts the server in a background thread. Returns once the server is listening.
+        """
+        if self.is_running:
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            self._thread.join()
+            raise ConnectionError(
+                f"MockBela could not listen on {self.ip}:{self.port}.")
+
+    def drop_connections(self):
+        """ Closes the connections of all the clients without stopping the server, as if the network went down. The state of the variables (watched, logged, etc.) is kept.
+        """
+        if not self.is_running:
+            return
+
+        async def _async_drop_connections():
+            # the connections are aborted without a closing handshake, as when the network goes down
+            for ws in [*self._ctrl_connections, *self._data_connections]:
+                ws.transport.abort()
+        asyncio.run_coroutine_threadsafe(
+            _async_drop_connections(), self._loop).result()
+
+    def send_buffer(self, name, ref_timestamp, data):
+        """ Sends a buffer of a variable with the given data to the clients, e.g. to test buffers of non-standard length (the buffers of dense variables are sent without padding, so their length follows the length of data).
+
+            Args:
+                name (str): Variable name
+                ref_timestamp (int): Timestamp of the first value
+                data (list or np.ndarray): Values
+        """
+        channel = self._var_index(name)
+        var = self.variables[channel]
+        header = f"{channel}/{var['type']}".encode()
+        body = struct.pack("<Q", ref_timestamp) + \
+            np.asarray(data, dtype=_numpy_type_map[var["type"]]).tobytes()
+        asyncio.run_coroutine_threadsafe(
+            self._broadcast(header, body), self._loop).result()
+
+    def stop(self):
+        """ Stops the server and its thread, closing the connections and the log files.
+        """
+        if not self.is_running:
+            return
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._async_run())
+        finally:
+            self._loop.close()
+
+    async def _async_run(self):
+        self._stop_event = asyncio.Event()
+        try:
+            self._server = await websockets.serve(self._handler, self.ip, self.port)
+        except OSError as e:
+            _print_error(f"Error starting MockBela: {e}")
+            self._server = None
+            self._ready.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+        emitter_task = asyncio.create_task(self._emitter())
+        await self._stop_event.wait()
+
+        emitter_task.cancel()
+        await asyncio.gather(emitter_task, return_exceptions=True)
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        for state in self._state:
+            self._close_log_file(state)
+
+    async def _handler(self, ws):
+        path = ws.request.path.strip("/")
+        if path == self.control_add:
+            self._ctrl_connections.add(ws)
+            try:
+                await ws.send(json.dumps({"event": "connection", "projectName": self.project_name}))
+                async for msg in ws:
+                    await self._process_ctrl_msg(ws, msg)
+            except websockets.ConnectionClosed:
+                pass
+            finally:
+                self._ctrl_connections.discard(ws)
+        elif path == self.data_add:
+            self._data_connections.add(ws)
+            try:
+                async for msg in ws:
+                    self._process_data_msg(msg)
+            except websockets.ConnectionClosed:
+                pass
+            finally:
+                self._data_connections.discard(ws)
+        else:
+            await ws.close()
+
+    # --- control messages --- #
+
+    async def _process_ctrl_msg(self, ws, msg):
+        self.received_ctrl_msgs += 1
+        try:
+            _msg = json.loads(msg)
+        except json.JSONDecodeError:
+            return
+        for cmd in _msg.get("watcher", []) if isinstance(_msg, dict) else []:
+            self.received_cmds[cmd.get("cmd")] += 1
+            if cmd.get("cmd") == "list":
+                self.received_list_requests += 1
+                await ws.send(json.dumps({"watcher": self._list()}))
+            else:
+                self._process_cmd(cmd)
+
+    def _process_cmd(self, cmd):
+        """ Applies a watcher command (watch, unwatch, monitor, log, unlog, control, uncontrol, set) to the state of the variables
+        """
+        names = cmd.get("watchers", [])
+        for idx, name in enumerate(names):
+            var_idx = self._var_index(name)
+            if var_idx is None:
+                continue
+            state = self._state[var_idx]
+            timestamps, durations = cmd.get(
+                "timestamps", []), cmd.get("durations", [])
+            if cmd["cmd"] in ["watch", "log"]:
+                key = "watch" if cmd["cmd"] == "watch" else "log"
+                start = timestamps[idx] if idx < len(timestamps) else self.frame
+                end = start + \
+                    durations[idx] if idx < len(durations) else None
+                state[key] = (start, end)
+                if key == "log":
+                    state["log_file_name"] = f"{name}_{state['n_logs']}.bin"
+                    state["n_logs"] += 1
+            elif cmd["cmd"] == "unwatch":
+                state["watch"] = None
+            elif cmd["cmd"] == "unlog":
+                state["log"] = None
+                self._close_log_file(state)
+            elif cmd["cmd"] == "monitor":
+                periods = cmd.get("periods", [])
+                state["monitor"] = int(periods[idx]) if idx < len(
+                    periods) else 0
+                state["next_monitor_frame"] = self.frame
+            elif cmd["cmd"] == "control":
+                state["controlled"] = True
+            elif cmd["cmd"] == "uncontrol":
+                state["controlled"] = False
+            elif cmd["cmd"] == "set":
+                values = cmd.get("values", [])
+                if idx < len(values):
+                    state["value"] = values[idx]
+
+    def _list(self):
+        """ Response to the list command
+        """
+        return {"sampleRate": self.sample_rate,
+                "timestamp": self.frame,
+                "watchers": [{"name": var["name"],
+                              "type": var["type"],
+                              "timestampMode": 1 if var["timestamp_mode"] == "sparse" else 0,
+                              "watched": self._is_active(state["watch"]),
+                              "logged": self._is_active(state["log"]),
+                              "logFileName": state["log_file_name"],
+                              "monitor": state["monitor"],
+                              "controlled": state["controlled"],
+                              "value": state["value"] if state["controlled"] else self._value(var, self.frame).item()}
+                             for var, state in zip(self.variables, self._state)]}
+
+    def _process_data_msg(self, msg):
+        """ Buffers sent by pybela (see Streamer.send_buffer()) are stored in received_buffers
+        """
+        if isinstance(msg, bytes) and len(msg) >= 16:
+            buffer_id, buffer_type, buffer_length = struct.unpack_from(
+                "<I4sI4x", msg)
+            buffer_type = buffer_type.rstrip(b"\0").decode()
+            self.received_buffers.append({"id": buffer_id,
+                                          "type": buffer_type,
+                                          "length": buffer_length,
+                                          "data": np.frombuffer(msg, dtype=_numpy_type_map.get(buffer_type, "<i4"), offset=16)})
+
+    # --- data emission --- #
+
+    async def _emitter(self):
+        """ Advances the frame counter at speed times the sample rate and emits the buffers completed by each block of frames
+        """
+        start_time, start_frame = time.perf_counter(), self.frame
+        while True:
+            if self.speed is None:
+                await asyncio.sleep(0)
+            else:
+                target_frame = start_frame + \
+                    (time.perf_counter() - start_time) * \
+                    self.sample_rate * self.speed
+                delay = (self.frame + self.block_size -
+                         target_frame) / (self.sample_rate * self.speed)
+                await asyncio.sleep(max(delay, 0))
+            self.frame += self.block_size
+            for channel, (var, state) in enumerate(zip(self.variables, self._state)):
+                await self._emit(channel, var, state)
+
+    async def _emit(self, channel, var, state):
+        header = f"{channel}/{var['type']}".encode()
+
+        if state["monitor"] > 0:
+            while state["next_monitor_frame"] < self.frame:
+                frame = state["next_monitor_frame"]
+                body = struct.pack("<Q", frame) + np.array(
+                    self._var_value(var, state, frame), dtype=_numpy_type_map[var["type"]]).tobytes()
+                await self._broadcast(header, body)
+                state["next_monitor_frame"] += state["monitor"]
+
+        for key in ["watch", "log"]:
+            if state[key] is None:
+                state["next_frame"][key] = None
+                continue
+            start, end = state[key]
+            span = self._buffer_span(var)
+            if state["next_frame"][key] is None or state["next_frame"][key] < start:
+                state["next_frame"][key] = start
+            # emit the buffers that have been completed (and the last buffer of a scheduled session)
+            while (end is None or state["next_frame"][key] < end) and \
+                    (state["next_frame"][key] + span <= self.frame or (end is not None and end <= self.frame)):
+                body = self._buffer(var, state, state["next_frame"][key], end)
+                if key == "watch":
+                    await self._broadcast(header, body)
+                else:
+                    self._write_log(var, state, body)
+                state["next_frame"][key] += span
+            if end is not None and state["next_frame"][key] >= end:
+                # scheduled session finished
+                state[key] = None
+                if key == "log":
+                    self._close_log_file(state)
+
+    def _buffer_span(self, var):
+        """ Number of frames covered by a buffer of var
+        """
+        data_length = Watcher.get_data_length(
+            var["type"], var["timestamp_mode"])
+        return data_length * (self.sparse_period if var["timestamp_mode"] == "sparse" else 1)
+
+    def _buffer(self, var, state, ref_timestamp, end=None):
+        """ Buffer of var starting at ref_timestamp, in the format sent by Bela (padded to Watcher.get_buffer_size())
+        """
+        record = np.zeros(1, dtype=Watcher._get_buffer_dtype(
+            var["type"], var["timestamp_mode"], padded=True))
+        data_length = record["data"].shape[1]
+        if var["timestamp_mode"] == "sparse":
+            rel_timestamps = np.arange(
+                data_length, dtype=np.uint64) * self.sparse_period
+            if end is not None:  # the last buffer of a scheduled session is not full
+                rel_timestamps = rel_timestamps[ref_timestamp +
+                                                rel_timestamps < end]
+            record["rel_timestamps"][0, :len(rel_timestamps)] = rel_timestamps
+        else:
+            rel_timestamps = np.arange(data_length, dtype=np.uint64)
+        record["ref_timestamp"] = ref_timestamp
+        record["data"][0, :len(rel_timestamps)] = self._var_value(
+            var, state, ref_timestamp + rel_timestamps)
+        return record.tobytes()
+
+    def _var_value(self, var, state, frames):
+        if state["controlled"]:
+            return np.full(np.shape(frames), state["value"])
+        return self._value(var, frames)
+
+    @staticmethod
+    def _value(var, frames):
+        """ Value assigned to var at frames: the frame (as in test/bela-test)
+        """
+        return np.asarray(frames).astype(_numpy_type_map[var["type"]])
+
+    async def _broadcast(self, header, body):
+        # the header and the body are sent one after the other to each connection, as in Bela
+        for ws in list(self._data_connections):
+            try:
+                await ws.send(header)
+                await ws.send(body)
+            except websockets.ConnectionClosed:
+                self._data_connections.discard(ws)
+                continue
+            self.sent_buffers += 1
+            self.sent_bytes += len(header) + len(body)
+
+    # --- logging --- #
+
+    def _write_log(self, var, state, body):
+        if self.log_dir is None:
+            return
+        if state["log_file"] is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            state["log_file"] = open(os.path.join(
+                self.log_dir, state["log_file_name"]), "wb")
+            header = self.project_name.encode() + b"\0" + var["name"].encode() + b"\0" + \
+                var["type"].encode() + b"\0" + struct.pack("II", os.getpid(), 0)
+            state["log_file"].write(header + bytes(-len(header) % 4))
+        state["log_file"].write(body)
+
+    def _close_log_file(self, state):
+        if state["log_file"] is not None:
+            state["log_file"].close()
+            state["log_file"] = None
+
+    # --- utils --- #
+
+    @staticmethod
+    def _initial_var_state():
+        return {"watch": None,  # (start frame, end frame or None)
+                "log": None,
+                "log_file_name": "",
+                "log_file": None,
+                "n_logs": 0,
+                "next_frame": {"watch": None, "log": None},
+                "monitor": 0,  # period in frames, 0 if not monitored
+                "next_monitor_frame": 0,
+                "controlled": False,
+                "value": 0}
+
+    def _is_active(self, window):
+        return window is not None and window[0] <= self.frame and (window[1] is None or self.frame < window[1])
+
+    def _var_index(self, name):
+        return next((idx for idx, var in enumerate(self.variables) if var["name"] == name), None)
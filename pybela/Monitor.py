@@ -1,8 +1,10 @@
+import os
 from .Streamer import Streamer
+from .utils import _print_error
 
 
 class Monitor(Streamer):
-    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control"):
+    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
         """ Monitor class
 
             Args:
@@ -10,31 +12,30 @@ class Monitor(Streamer):
                 port (int, optional): Remote address port. Defaults to 5555.
                 data_add (str, optional): Data endpoint. Defaults to "gui_data".
                 control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the event loop in a dedicated background thread, so that data is received continuously and the sync methods can be called from any thread. See Watcher. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation: "asyncio", "uvloop" or an event loop created by the caller. See Watcher. Defaults to "asyncio".
         """
 
-        super(Monitor, self).__init__(ip, port, data_add, control_add)
+        super(Monitor, self).__init__(ip, port, data_add, control_add, run_in_thread, loop_backend)
 
         self._mode = "MONITOR"
 
-    def connect(self):
-        if (super().connect()):
+    async def _async_connect(self):
+        connected = await super()._async_connect()
+        if connected:
             # longer queue for monitor since each buffer has only one value
             self.streaming_buffers_queue_length = 2000
+        return connected
 
     @property
     def values(self):
         """ Get monitored values from last monitoring session
 
         Returns:
-            dict of dicts of list: Dict containing the monitored buffers for each variable in the watcher
+            dict of dicts of arrays: Dict containing the monitored timestamps and values for each variable in the watcher. The arrays are copies of the streaming buffers, taken in the loop thread, so they don't change while monitoring continues.
         """
-        values = {}
-        for var in self.streaming_buffers_queue:
-            values[var] = {"timestamps": [], "values": []}
-            for _buffer in self.streaming_buffers_queue[var]:
-                values[var]["timestamps"].append(_buffer["timestamp"])
-                values[var]["values"].append(_buffer["value"])
-        return values
+        return self._call_on_loop(lambda: {var: {"timestamps": ring.snapshot("timestamp", copy=True), "values": ring.snapshot("value", copy=True)}
+                                           for var, ring in self._streaming_buffers_queue.items()})
 
     def peek(self, variables=[]):
         """ Peek at variables
@@ -50,7 +51,7 @@ class Monitor(Streamer):
             # checks types and if no variables are specified, stream all watcher variables (default)
             variables = self._var_arg_checker(variables)
             self._peek_response = {var: None for var in variables}
-            self.start_monitoring(variables, [1]*len(variables))
+            await self._async_start_monitoring(variables, [1]*len(variables))
             await self._peek_response_available.wait()
             self._peek_response_available.clear()
             peeked_values = self._peek_response
@@ -60,13 +61,13 @@ class Monitor(Streamer):
 
             return peeked_values
 
-        return self.loop.run_until_complete(_async_peek(variables))
+        return self._run(_async_peek(variables))
 
         # using list
         # res = self.list()
         # return {var: next(r["value"] for r in res if r["name"] == var) for var in variables}
 
-    def start_monitoring(self, variables=[], periods=[], saving_enabled=False, saving_filename="monitor.txt", saving_dir="./"):
+    def start_monitoring(self, variables=[], periods=[], saving_enabled=False, saving_filename="monitor.bin", saving_dir="./"):
         """
         Starts the monitoring session. The session can be stopped with stop_monitoring().
 
@@ -79,14 +80,19 @@ class Monitor(Streamer):
             saving_filename (str, optional) Filename for saving the monitored data. Defaults to None.
             saving_dir (str, optional): Directory for saving the monitored data. Defaults to "/.".
         """
+        self._run(self._async_start_monitoring(
+            variables, periods, saving_enabled, saving_filename, saving_dir))
 
+    async def _async_start_monitoring(self, variables=[], periods=[], saving_enabled=False, saving_filename="monitor.bin", saving_dir="./"):
+        """ Async version of start_monitoring()
+        """
         variables = self._var_arg_checker(variables)
         self._periods = self._check_periods(periods, variables)
 
-        self.start_streaming(
+        await self._async_start_streaming(
             variables=variables, periods=self._periods, saving_enabled=saving_enabled, saving_filename=saving_filename, saving_dir=saving_dir)
 
-    def monitor_n_values(self, variables=[], periods=[], n_values=1000, saving_enabled=False, saving_filename="monitor.txt"):
+    def monitor_n_values(self, variables=[], periods=[], n_values=1000, saving_enabled=False, saving_filename="monitor.bin"):
         """
         Monitors a given number of values. Since the data comes in buffers of a predefined size, always an extra number of frames will be monitored (unless the number of frames is a multiple of the buffer size). 
 
@@ -142,7 +148,8 @@ class Monitor(Streamer):
         await self._async_stop_streaming(variables)
         self._monitored_vars = None
         self._periods = None
-        return {var: self.values[var] for var in self.values if self.values[var]["timestamps"] != []}
+        values = self.values
+        return {var: values[var] for var in values if len(values[var]["timestamps"]) > 0}
 
     def stop_monitoring(self, variables=[]):
         """
@@ -157,18 +164,27 @@ class Monitor(Streamer):
         self.stop_streaming(variables)
         self._monitored_vars = None  # reset monitored variables
         # return only nonempty variables
-        return {var: self.values[var] for var in self.values if self.values[var]["timestamps"] != []}
+        values = self.values
+        return {var: values[var] for var in values if len(values[var]["timestamps"]) > 0}
 
     def load_data_from_file(self, filename, flatten=True):
         """
-        Loads data from a file saved through the saving_enabled function in start_monitoring() or monitor_n_values(). The file should contain a list of dicts, each dict containing a variable name and a list of values. The list of dicts should be separated by newlines.
+        Loads data from a file saved through the saving_enabled function in start_monitoring() or monitor_n_values(). Files saved by previous versions of pybela (one json dict per line) are also supported.
         Args:
             filename (str): Filename
             flatten (bool, optional): If True, the returned list of values is flattened. Defaults to True.
 
         Returns:
-            dict of lists: Dict with "timestamps" and "values" list if flatten is True, otherwise a list of dicts with "timestamp" and "value" keys.
+            dict of lists: Dict with "timestamps" and "values" arrays (lists for json lines files) if flatten is True, otherwise a list of dicts with "timestamp" and "value" keys.
         """
+        if flatten and os.path.exists(filename) and self._is_stream_file(filename):
+            try:
+                stream = self.read_stream_file(filename)
+            except Exception as e:
+                _print_error(f"Error while loading data from file: {e}")
+                return None
+            return {"timestamps": stream["timestamps"], "values": stream["values"]}
+
         loaded_buffers = super().load_data_from_file(filename)
         if flatten:
             flatten_loaded_buffers = {"timestamps": [], "values": []}
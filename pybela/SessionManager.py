@@ -0,0 +1,277 @@
+import asyncio
+import os
+from .Streamer import Streamer
+from .Logger import Logger
+from .Monitor import Monitor
+from .utils import _print_error
+
+
+class SessionManager:
+    def __init__(self, boards, port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
+        """ SessionManager class - manages sessions with several Bela boards from a single process. Each board gets its own Streamer, Logger and Monitor (created when first used), and all of them share one event loop, so the commands sent to the boards run concurrently and their data is received in a single ingest pipeline (see start_streaming()).
+
+            Args:
+                boards (dict or list): Boards to connect to. Either a list of IPs (the IPs are used as board names) or a dict with the board names as keys and the IPs, or dicts with "ip" and optionally "port", "data_add" and "control_add", as values.
+                port (int, optional): Default remote port. Defaults to 5555.
+                data_add (str, optional): Default data endpoint. Defaults to "gui_data".
+                control_add (str, optional): Default control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the shared event loop in a background thread. See Watcher. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation. See Watcher. Defaults to "asyncio".
+        """
+        if not isinstance(boards, dict):
+            boards = {ip: ip for ip in boards}
+        if len(boards) == 0:
+            raise ValueError("At least one board is needed.")
+
+        self._boards = {}
+        for name, board in boards.items():
+            board = board if isinstance(board, dict) else {"ip": board}
+            self._boards[name] = {"ip": board["ip"],
+                                  "port": board.get("port", port),
+                                  "data_add": board.get("data_add", data_add),
+                                  "control_add": board.get("control_add", control_add)}
+
+        self._run_in_thread = run_in_thread
+        self._loop_backend = loop_backend
+        self._instances = {name: {} for name in self._boards}
+        self._classes = {"streamer": Streamer,
+                         "logger": Logger, "monitor": Monitor}
+
+        # all instances share the loop of the first instance
+        self._watcher = self.streamer(next(iter(self._boards)))
+        self.loop = self._watcher.loop
+
+        self._metrics_start = {}  # (board, kind) -> stats() when streaming started, see metrics()
+
+    @property
+    def boards(self):
+        """ Names of the boards """
+        return list(self._boards)
+
+    def streamer(self, board):
+        """ Streamer of a board
+
+            Args:
+                board (str): Board name
+
+            Returns:
+                Streamer: Streamer of the board
+        """
+        return self._get_instance(board, "streamer")
+
+    def logger(self, board):
+        """ Logger of a board
+
+            Args:
+                board (str): Board name
+
+            Returns:
+                Logger: Logger of the board
+        """
+        return self._get_instance(board, "logger")
+
+    def monitor(self, board):
+        """ Monitor of a board
+
+            Args:
+                board (str): Board name
+
+            Returns:
+                Monitor: Monitor of the board
+        """
+        return self._get_instance(board, "monitor")
+
+    def _get_instance(self, board, kind):
+        if board not in self._boards:
+            raise ValueError(
+                f"Board {board} is not in the session. Boards: {self.boards}")
+        if kind not in self._instances[board]:
+            loop_backend = self.loop if hasattr(
+                self, "loop") else self._loop_backend
+            self._instances[board][kind] = self._classes[kind](
+                **self._boards[board], run_in_thread=self._run_in_thread, loop_backend=loop_backend)
+        return self._instances[board][kind]
+
+    # --- consolidated commands --- #
+
+    def connect(self, kinds=["streamer"]):
+        """ Connects the Streamers (and/or Loggers and Monitors) of all boards concurrently.
+
+            Args:
+                kinds (list of str, optional): Instances to connect ("streamer", "logger", "monitor"). Defaults to ["streamer"].
+
+            Returns:
+                dict: Connection result (1 if successful, 0 otherwise) for each board and instance
+        """
+        instances = {(board, kind): self._get_instance(board, kind)
+                     for board in self._boards for kind in kinds}
+        results = self._watcher._run(self._async_gather(
+            {key: instance._async_connect() for key, instance in instances.items() if not instance.is_connected()}))
+        return {board: {kind: 1 if instances[(board, kind)].is_connected() else results.get((board, kind), 0) for kind in kinds} for board in self._boards}
+
+    def start_streaming(self, variables=[], on_buffer_callback=None, callback_args=(), saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./"):
+        """ Starts streaming on all boards. The buffers received from all the boards can be processed in a single callback, which receives the board name along with the variable name and the buffer.
+
+            Args:
+                variables (list or dict, optional): Variables to stream. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all the variables in the watcher of each board).
+                on_buffer_callback (function, optional): Callback called every time a buffer is received from any board. It takes a dict with "board", "name" and "buffer" keys (and callback_args). Accepts asynchronous functions (defined with async def). Defaults to None.
+                callback_args (tuple, optional): Arguments to pass to the callback. Defaults to ().
+                saving_enabled (bool, optional): Enables/disables saving streamed data to local files. The files of each board are saved in a subdirectory of saving_dir named as the board. Defaults to False.
+                saving_filename (str, optional): Filename for saving the streamed data. Defaults to "var_stream.bin".
+                saving_dir (str, optional): Directory for saving the streamed data. Defaults to "./".
+        """
+        callback_args = callback_args if isinstance(
+            callback_args, tuple) else (callback_args,)
+        for board in self._boards:
+            streamer = self.streamer(board)
+            board_callback = None
+            if on_buffer_callback is not None:
+                board_callback = self._board_callback(
+                    board, on_buffer_callback, callback_args)
+            board_saving_dir = os.path.join(
+                saving_dir, self._safe_name(board)) if saving_enabled else saving_dir
+            for kind, instance in self._instances[board].items():
+                self._metrics_start[(board, kind)] = instance.stats()
+            streamer.start_streaming(variables=self._board_variables(variables, board),
+                                     saving_enabled=saving_enabled,
+                                     saving_filename=saving_filename,
+                                     saving_dir=board_saving_dir,
+                                     on_buffer_callback=board_callback)
+
+    def stop_streaming(self, variables=[]):
+        """ Stops streaming on all boards concurrently.
+
+            Args:
+                variables (list or dict, optional): Variables to stop streaming. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all variables).
+        """
+        self._watcher._run(self._async_gather(
+            {board: self.streamer(board)._async_stop_streaming(self._board_variables(variables, board)) for board in self._boards}))
+
+    def start_logging(self, variables=[], transfer=True, logging_dir="./"):
+        """ Starts logging on all boards concurrently. The files of each board are transferred to a subdirectory of logging_dir named as the board.
+
+            Args:
+                variables (list or dict, optional): Variables to log. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all variables).
+                transfer (bool, optional): Transfer the logged files during the logging session. Defaults to True.
+                logging_dir (str, optional): Local directory for the logged files. Defaults to "./".
+
+            Returns:
+                dict: Local and remote paths of the logged files for each board
+        """
+        self.connect(["logger"])
+        return self._watcher._run(self._async_gather(
+            {board: self.logger(board)._async_start_logging(self._board_variables(variables, board), transfer, os.path.join(logging_dir, self._safe_name(board))) for board in self._boards}))
+
+    def stop_logging(self, variables=[]):
+        """ Stops logging on all boards concurrently.
+
+            Args:
+                variables (list or dict, optional): Variables to stop logging. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all variables).
+        """
+        self._watcher._run(self._async_gather(
+            {board: self.logger(board)._async_stop_logging(self._board_variables(variables, board)) for board in self._boards}))
+
+    def start_monitoring(self, variables=[], periods=[]):
+        """ Starts monitoring on all boards.
+
+            Args:
+                variables (list or dict, optional): Variables to monitor. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all variables).
+                periods (list or dict, optional): Monitoring periods. Either a list, used for all boards, or a dict with a list for each board. Defaults to [].
+        """
+        self.connect(["monitor"])
+        for board in self._boards:
+            self.monitor(board).start_monitoring(
+                self._board_variables(variables, board), self._board_variables(periods, board))
+
+    def stop_monitoring(self, variables=[]):
+        """ Stops monitoring on all boards concurrently.
+
+            Args:
+                variables (list or dict, optional): Variables to stop monitoring. Either a list, used for all boards, or a dict with a list for each board. Defaults to [] (all variables).
+
+            Returns:
+                dict: Monitored values for each board (see Monitor.values)
+        """
+        self._watcher._run(self._async_gather(
+            {board: self.monitor(board)._async_stop_monitoring(self._board_variables(variables, board)) for board in self._boards}))
+        return {board: self.monitor(board).values for board in self._boards}
+
+    def wait(self, time_in_seconds=0):
+        """ Waits while the data of all boards is received. See Watcher.wait().
+
+            Args:
+                time_in_seconds (float, optional): Time to wait in seconds. If 0, it waits forever. Defaults to 0.
+        """
+        self._watcher.wait(time_in_seconds)
+
+    def cleanup(self):
+        """ Cleans up the tasks and closes the connections of all the instances of all boards concurrently.
+        """
+        self._watcher._run(self._async_gather(
+            {(board, kind): instance._async_cleanup() for board, instances in self._instances.items() for kind, instance in instances.items()}))
+
+    # --- metrics --- #
+
+    def metrics(self):
+        """ Per-board metrics of the data received in the data websocket of each instance, since streaming started (see start_streaming()). For the instances that were not connected then, or whose stats have been reset since (see Watcher.reset_stats()), they cover the window of Watcher.stats().
+
+            Returns:
+                dict: For each board and instance: connected (bool), messages and bytes received, message rate and byte rate (per second), and framing errors (see Watcher.data_framing_errors)
+        """
+        metrics = {}
+        for board, instances in self._instances.items():
+            metrics[board] = {}
+            for kind, instance in instances.items():
+                stats = instance.stats()
+                elapsed, messages, _bytes = stats["elapsed"], stats["messages"], stats["bytes"]
+                start = self._metrics_start.get((board, kind))
+                if start is not None and elapsed >= start["elapsed"] and messages >= start["messages"]:
+                    elapsed -= start["elapsed"]
+                    messages -= start["messages"]
+                    _bytes -= start["bytes"]
+                metrics[board][kind] = {"connected": instance.is_connected(),
+                                        "messages": messages,
+                                        "bytes": _bytes,
+                                        "messages_per_second": messages / elapsed if elapsed > 0 else None,
+                                        "bytes_per_second": _bytes / elapsed if elapsed > 0 else None,
+                                        "framing_errors": stats["errors"]["framing"]}
+        return metrics
+
+    # --- utils --- #
+
+    async def _async_gather(self, coros):
+        """ Runs coroutines concurrently and returns their results by key. Exceptions are printed and returned as results.
+
+            Args:
+                coros (dict): Coroutines by key
+
+            Returns:
+                dict: Results by key
+        """
+        results = await asyncio.gather(*coros.values(), return_exceptions=True)
+        for key, result in zip(coros, results):
+            if isinstance(result, Exception):
+                _print_error(f"Error in {key}: {result}")
+        return dict(zip(coros, results))
+
+    def _board_variables(self, variables, board):
+        if isinstance(variables, dict):
+            return variables.get(board, [])
+        return variables
+
+    @staticmethod
+    def _safe_name(board):
+        # board names can be IPs or hostnames
+        return str(board).replace(":", "_").replace("/", "_")
+
+    @staticmethod
+    def _board_callback(board, on_buffer_callback, callback_args):
+        """ Wraps the callback of the session so that it receives the board name along with the buffer
+        """
+        if asyncio.iscoroutinefunction(on_buffer_callback):
+            async def board_callback(msg):
+                await on_buffer_callback({"board": board, **msg}, *callback_args)
+        else:
+            def board_callback(msg):
+                on_buffer_callback({"board": board, **msg}, *callback_args)
+        return board_callback
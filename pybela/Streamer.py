@@ -4,25 +4,22 @@ import copy
 import os
 import glob
 import asyncio
-import aiofiles  # async file i/o
-from collections import deque  # circular buffers
+import queue
+import threading
+import time
+import array
 from itertools import cycle
 import warnings
-import re
 import struct
 
-import bokeh.plotting
-import bokeh.io
-import bokeh.driving
-from bokeh.resources import INLINE
-from .Watcher import Watcher
-from .utils import _print_info, _print_error, _print_warning
+from .Watcher import Watcher, _numpy_type_map
+from .utils import _print_info, _print_error, _print_warning, _RingBuffer, _IngestQueue, _LatencyHistogram, _search_time_range, _select_time_range
 
 import numpy as np
 
 
 class Streamer(Watcher):
-    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control"):
+    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
         """ Streamer class
 
             Args:
@@ -30,36 +27,49 @@ class Streamer(Watcher):
                 port (int, optional): Remote address port. Defaults to 5555.
                 data_add (str, optional): Data endpoint. Defaults to "gui_data".
                 control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the event loop in a dedicated background thread, so that data is received continuously and the sync methods can be called from any thread. See Watcher. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation: "asyncio", "uvloop" or an event loop created by the caller. See Watcher. Defaults to "asyncio".
         """
 
-        super(Streamer, self).__init__(ip, port, data_add, control_add)
+        super(Streamer, self).__init__(ip, port, data_add, control_add, run_in_thread, loop_backend)
 
         # -- streaming --
         self._streaming_mode = "OFF"  # OFF, FOREVER, N_VALUES, PEEK :: this flag prevents writing into the streaming buffer unless requested by the user using the start/stop_streaming() functions
-        self._streaming_buffer_available = asyncio.Event()
+        self._streaming_buffer_available = self._call_on_loop(asyncio.Event)
         # number of streaming buffers (not of data points!)
         self._streaming_buffers_queue_length = 1000
+        # total memory (in bytes) for the streaming buffers of all variables. If set, it overrides the streaming buffers queue length
+        self._streaming_buffers_memory_budget = None
+        self._streaming_buffers_vars = None  # variables sharing the memory budget
         self._streaming_buffers_queue = None
         self.last_streamed_buffer = {}
 
+        # -- subscription --
+        # variables watched (or monitored) by this instance, with their periods and the number of values received. Kept on the client side so that the streamed data can be accounted for without calling list()
+        self._subscription = {}
+        self._n_values_pending_vars = set()  # variables whose streaming buffer is not full yet in N_VALUES mode
+
         # -- on data/block callbacks --
-        self._processed_data_msg_queue = asyncio.Queue()
+        # parsed buffers waiting for the callbacks. Unbounded by default, see set_ingest_queue()
+        self._processed_data_msg_queue = self._call_on_loop(_IngestQueue)
         self._on_buffer_callback_is_active = False
         self._on_buffer_callback_worker_task = None
         self._on_block_callback_is_active = False
         self._on_block_callback_worker_task = None
+        self._callback_latency = _LatencyHistogram()
+        self._callback_error_count = 0
+        self._parse_error_count = 0
 
         # -- save --
         self._saving_enabled = False
         self._saving_filename = None
-        self._saving_task = None
-        self._active_saving_tasks = []
-        self._saving_file_locks = {}
+        self._saving_writer = None
+        self._saving_var_filenames = {}
 
         # -- monitor --
         # stores the list of monitored variables for each monitored session. cleaned after each monitoring session. used to avoid calling list() every time a new message is parsed
         self._monitored_vars = None
-        self._peek_response_available = asyncio.Event()
+        self._peek_response_available = self._call_on_loop(asyncio.Event)
         self._peek_response = None
         self._periods = None
 
@@ -96,6 +106,37 @@ class Streamer(Watcher):
                 self._monitored_vars = None
         return self._monitored_vars
 
+    @property
+    def subscription(self):
+        """ Returns a dict where each key corresponds to a variable watched (or monitored) by this instance and each value to a dict with its monitoring period ("period", None in streaming mode) and the number of values received since it was watched ("received").
+
+        Returns:
+            dict: Subscribed variables
+        """
+        return {var: {"period": sub["period"], "received": sub["received"]} for var, sub in self._subscription.items()}
+
+    def _subscribe(self, variables, periods=None):
+        """ Adds variables to the subscription set, resetting their counters.
+
+        Args:
+            variables (list of str): Variables watched or monitored
+            periods (list of int, optional): Monitoring periods of the variables. Defaults to None.
+        """
+        for idx, var in enumerate(variables):
+            self._subscription[var] = {"period": periods[idx] if periods is not None else None,
+                                       "received": 0,
+                                       "last_timestamp": None}
+
+    def _unsubscribe(self, variables):
+        """ Removes variables from the subscription set.
+
+        Args:
+            variables (list of str): Variables unwatched or no longer monitored
+        """
+        for var in variables:
+            self._subscription.pop(var, None)
+            self._n_values_pending_vars.discard(var)
+
     @property
     def streaming_buffers_queue_length(self):
         """
@@ -108,86 +149,211 @@ class Streamer(Watcher):
     def streaming_buffers_queue_length(self, value):
         """Sets the maximum number of streaming buffers allowed in self.streaming_buffers_queue. Warning: setting the streaming buffer value will result in deleting the current streaming buffer queue.
         """
-        # TODO resize in terms of number of datapoints instead of number of buffers?
+        # see streaming_buffers_memory_budget to size the buffers in bytes instead
         self._streaming_buffers_queue_length = value
-        self._streaming_buffers_queue = {var["name"]: deque(
-            maxlen=self._streaming_buffers_queue_length) for var in self.watcher_vars}  # resize streaming buffer
+        # the buffers are read by the loop, so they are replaced in the loop thread
+        self._call_on_loop(self._reset_streaming_buffers_queue,
+                           self._streaming_buffers_vars)  # resize streaming buffer
+
+    @property
+    def streaming_buffers_memory_budget(self):
+        """
+        Returns:
+            int: maximum memory in bytes used by the streaming buffers of all variables, or None if the streaming buffers are sized by streaming_buffers_queue_length
+        """
+        return self._streaming_buffers_memory_budget
+
+    @streaming_buffers_memory_budget.setter
+    def streaming_buffers_memory_budget(self, value):
+        """Sets the maximum memory in bytes used by the streaming buffers of all variables (None to size them by streaming_buffers_queue_length instead). The budget is split in equal numbers of bytes between the streamed variables (all watcher variables if no streaming session has been started), regardless of their type or timestamp mode, and each variable stores as many buffers as fit in its share (see get_buffer_size()). A variable whose share is smaller than one buffer still stores one buffer, so the memory allocated (see streaming_buffers_memory_usage) can exceed a very small budget. Once a variable's share is full, its oldest buffer is evicted every time a new buffer is received, so variables never evict each other's buffers. The budget is ignored by stream_n_values() and monitor_n_values(). Warning: setting the budget will result in deleting the current streaming buffer queue.
+        """
+        if value is not None and value < 0:
+            raise ValueError("The memory budget should be a positive number of bytes.")
+        self._streaming_buffers_memory_budget = value
+        self._call_on_loop(self._reset_streaming_buffers_queue,
+                           self._streaming_buffers_vars)
+
+    @property
+    def streaming_buffers_memory_usage(self):
+        """Returns a dict where each key corresponds to a variable and each value to a dict with the memory used by the buffers currently stored ("used") and the memory allocated for the variable's streaming buffer ("allocated"), in bytes.
+
+        Returns:
+            dict: Memory usage of the streaming buffers
+        """
+        return {var: {"used": ring.nbytes_used, "allocated": ring.nbytes}
+                for var, ring in self._streaming_buffers_queue.items()}
 
     @property
     def streaming_buffers_queue(self):
-        """Returns a dict where each key corresponds to a variable and each item to the variable's buffer queue. The queue has maximum length determined by streamer.streaming_buffers_queue_length. Each item of the queue is a received buffer of the form {"frame: int, "data": {"var1": [val1, val2, ...], "var2": [val1, val2, ...], ...} }
+        """Returns a dict where each key corresponds to a variable and each item to the variable's buffer queue. The queue has maximum length determined by streamer.streaming_buffers_queue_length. Each item of the queue is a received buffer of the form {"ref_timestamp": int, "data": np.ndarray} (plus "rel_timestamps" for sparse variables, or {"timestamp": int, "value": number} in monitor mode). The arrays are copies of the streaming buffers, taken in the loop thread, so they don't change while streaming continues.
 
         Returns:
             dict: streaming buffers queue
         """
-        # returns a dict of lists instead of a dict of dequeues
-        return {key: list(value) for key, value in self._streaming_buffers_queue.items()}
+        def _streaming_buffers_queue():
+            queue = {}
+            for var, ring in self._streaming_buffers_queue.items():
+                fields = {name: ring.snapshot(name, copy=True)
+                          for name in ring.fields}
+                overflow = ring.overflow()  # e.g. buffers of non-standard length
+                if self._mode == "MONITOR":
+                    queue[var] = [{"timestamp": int(timestamp), "value": value.item()}
+                                  for timestamp, value in zip(fields["timestamp"], fields["value"])]
+                else:
+                    queue[var] = [{"ref_timestamp": int(fields["ref_timestamp"][idx]),
+                                   **{name: fields[name][idx] for name in fields if name != "ref_timestamp"}}
+                                  if idx not in overflow else {**overflow[idx], "ref_timestamp": int(overflow[idx]["ref_timestamp"])}
+                                  for idx in range(len(ring))]
+            return queue
+        return self._call_on_loop(_streaming_buffers_queue)
 
     @property
     def streaming_buffers_data(self):
-        """Returns a dict where each key corresponds to a variable and each value to a flat list of the streamed values. Does not return timestamps of each datapoint since that depends on how often the variables are reassigned in the Bela code.
+        """Returns a dict where each key corresponds to a variable and each value to a flat array of the streamed values. Does not return timestamps of each datapoint since that depends on how often the variables are reassigned in the Bela code.
         Returns:
-            dict: Dict of flat lists of streamed values.
+            dict: Dict of flat arrays of streamed values.
         """
-        data = {}
-        for var in self.streaming_buffers_queue:
-            data[var] = []
-            for _buffer in self.streaming_buffers_queue[var]:
-                data[var].extend(_buffer["data"] if self._mode !=
-                                 "MONITOR" else [_buffer["value"]])
-        return data
+        return self._call_on_loop(lambda: {var: ring.flat("value" if self._mode == "MONITOR" else "data")
+                                           for var, ring in self._streaming_buffers_queue.items()})
+
+    def _reset_streaming_buffers_queue(self, variables=None):
+        """Allocates an empty ring buffer (see utils._RingBuffer) for each variable in the watcher. In monitor mode each item stores a timestamp and a value, otherwise it stores a full buffer (ref_timestamp, data and, for sparse variables, rel_timestamps). The length of the ring buffers is streaming_buffers_queue_length, or, if streaming_buffers_memory_budget is set, the number of buffers that fit in the variable's share of the budget (at least one).
+
+        Args:
+            variables (list of str, optional): Variables sharing the memory budget. Variables not in the list get no streaming buffer if a budget is set. If None, all the watcher variables share the budget. Defaults to None.
+        """
+        self._streaming_buffers_vars = variables
+        _budget_vars = variables if variables is not None else [
+            var["name"] for var in self.watcher_vars]
+
+        self._streaming_buffers_queue = {}
+        _over_budget_vars = []
+        for var in self.watcher_vars:
+            capacity = self._streaming_buffers_queue_length
+            # stream_n_values() sizes the buffers to the requested number of values
+            if self._streaming_buffers_memory_budget is not None and self._streaming_mode != "N_VALUES":
+                if self._mode == "MONITOR":
+                    buffer_size = struct.calcsize(
+                        "Q") + self.get_data_byte_size(var["type"])
+                else:
+                    buffer_size = self.get_buffer_size(
+                        var["type"], var["timestamp_mode"])
+                capacity = self._streaming_buffers_memory_budget // len(
+                    _budget_vars) // buffer_size if var["name"] in _budget_vars else 0
+                if var["name"] in _budget_vars and capacity == 0:
+                    # keep at least one buffer so that the variable is not silently dropped
+                    capacity = 1
+                    _over_budget_vars.append(var["name"])
+
+            if self._mode == "MONITOR":
+                fields = {"timestamp": "<u8",
+                          "value": _numpy_type_map[var["type"]]}
+            else:
+                buffer_dtype = self._get_buffer_dtype(
+                    var["type"], var["timestamp_mode"])
+                fields = {name: buffer_dtype.fields[name][0]
+                          for name in buffer_dtype.names}
+            self._streaming_buffers_queue[var["name"]] = _RingBuffer(
+                capacity, fields)
+
+        if len(_over_budget_vars) > 0:
+            _print_warning(
+                f"The memory budget share of {', '.join(_over_budget_vars)} is smaller than one buffer, one buffer will be stored for each of them.")
+
+    # -- reconnection --
+
+    def _last_received_timestamps(self):
+        timestamps = {}
+        for var, last in self.last_streamed_buffer.items():
+            if self._mode == "MONITOR" and "timestamp" in last:
+                timestamps[var] = int(last["timestamp"])
+            elif len(last.get("timestamps", [])) > 0:
+                timestamps[var] = int(last["timestamps"][-1])
+        return timestamps
+
+    async def _async_resume_session(self):
+        """ Re-issues the watch (or monitor) command of the subscribed variables after a reconnection. The streaming buffers, callbacks and saving files of the session are kept.
+        """
+        if self._streaming_mode == "OFF" or len(self._subscription) == 0:
+            return
+        if self._streaming_mode == "SCHEDULE":
+            _print_warning(
+                "Scheduled streaming sessions can't be resumed after a reconnection.")
+            return
+        variables = list(self._subscription.keys())
+        if self._mode == "STREAM":
+            await self._async_send_ctrl_msg(
+                {"watcher": [{"cmd": "watch", "watchers": variables}]})
+        elif self._mode == "MONITOR":
+            await self._async_send_ctrl_msg(
+                {"watcher": [{"cmd": "monitor", "watchers": variables, "periods": [self._subscription[var]["period"] for var in variables]}]})
+        _print_info(f"Resumed {'monitoring' if self._mode == 'MONITOR' else 'streaming'} variables {variables}")
+
+    @property
+    def _ingest_queues(self):
+        return {"received": self._received_data_msg_queue, "processed": self._processed_data_msg_queue}
+
+    @property
+    def _latency_histograms(self):
+        return {"process": self._process_latency, "callback": self._callback_latency}
+
+    @property
+    def _error_counts(self):
+        return {"framing": self.data_framing_errors, "parse": self._parse_error_count, "callback": self._callback_error_count}
 
     # -- streaming methods --
 
-    def __streaming_common_routine(self, variables=[], saving_enabled=False, saving_filename="var_stream.txt", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+    async def __async_streaming_common_routine(self, streaming_mode, variables=[], saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+        # runs in the event loop, since it resets the state used to process the received data (streaming buffers, queues, subscription and saving writer)
 
         if self.is_streaming():
             _print_warning("Stopping previous streaming session...")
-            self.stop_streaming()  # stop any previous streaming
+            await self._async_stop_streaming()  # stop any previous streaming
 
         if not self.is_connected():
 
             raise ConnectionError(
                 f'{"Monitor" if self._mode=="MONITOR" else "Streamer" } is not connected to Bela. Run {"monitor" if self._mode=="MONITOR" else "streamer"}.connect() first.')
 
-        # reset streaming buffers queue
-        self._streaming_buffers_queue = {var["name"]: deque(
-            maxlen=self._streaming_buffers_queue_length) for var in self.watcher_vars}
+        # checks types and if no variables are specified, stream all watcher variables (default)
+        _variables = self._var_arg_checker(variables)
+
+        # the streaming mode is set before the callback workers are started, since they stop when streaming is off
+        self._streaming_mode = streaming_mode
+
+        # reset streaming buffers queue (the streamed variables share the memory budget, if set)
+        self._reset_streaming_buffers_queue(_variables)
         # clear asyncio data queues
-        self._processed_data_msg_queue = asyncio.Queue()
+        self._processed_data_msg_queue.clear()
 
         self.last_streamed_buffer = {
             var["name"]: {"data": [], "timestamps": []} for var in self.watcher_vars}
 
-        if not os.path.exists(saving_dir):
+        if saving_enabled and not os.path.exists(saving_dir):
             os.makedirs(saving_dir)
 
         self._saving_enabled = True if saving_enabled else False
         self._saving_filename = self._generate_filename(
             saving_filename, saving_dir) if saving_enabled else None
-
-        async def async_callback_workers():
-
-            if on_block_callback and on_buffer_callback:
-                _print_error(
-                    "Error: Both on_buffer_callback and on_block_callback cannot be enabled at the same time.")
-                return 0
-            if on_buffer_callback:
-                self._on_buffer_callback_is_active = True
-                self._on_buffer_callback_worker_task = self.loop.create_task(
-                    self.__async_on_buffer_callback_worker(on_buffer_callback, callback_args))
-
-            elif on_block_callback:
-                self._on_block_callback_is_active = True
-                self._on_block_callback_worker_task = self.loop.create_task(
-                    self.__async_on_block_callback_worker(on_block_callback, callback_args, variables))
-
-        self.loop.create_task(async_callback_workers())
-
-        # checks types and if no variables are specified, stream all watcher variables (default)
-        return self._var_arg_checker(variables)
-
-    def start_streaming(self, variables=[], periods=[], saving_enabled=False, saving_filename="var_stream.txt", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+        self._saving_var_filenames = {}
+        if self._saving_enabled:
+            self._saving_writer = _SavingWriter()
+
+        if on_block_callback and on_buffer_callback:
+            _print_error(
+                "Error: Both on_buffer_callback and on_block_callback cannot be enabled at the same time.")
+        elif on_buffer_callback:
+            self._on_buffer_callback_is_active = True
+            self._on_buffer_callback_worker_task = self._create_task(
+                self.__async_on_buffer_callback_worker(on_buffer_callback, callback_args))
+        elif on_block_callback:
+            self._on_block_callback_is_active = True
+            self._on_block_callback_worker_task = self._create_task(
+                self.__async_on_block_callback_worker(on_block_callback, callback_args, variables))
+
+        return _variables
+
+    def start_streaming(self, variables=[], periods=[], saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
         """
         Starts the streaming session. The session can be stopped with stop_streaming(). Can't be used in async functions.
 
@@ -203,9 +369,14 @@ class Streamer(Watcher):
             callback_args (tuple, optional): Arguments to pass to the callback functions. Defaults to ().
 
         """
+        self._run(self._async_start_streaming(variables, periods, saving_enabled, saving_filename,
+                  saving_dir, on_buffer_callback, on_block_callback, callback_args))
 
-        variables = self.__streaming_common_routine(
-            variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
+    async def _async_start_streaming(self, variables=[], periods=[], saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+        """ Async version of start_streaming()
+        """
+        variables = await self.__async_streaming_common_routine(
+            "FOREVER" if self._peek_response is None else "PEEK", variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
         _all_vars = [var["name"] for var in self.watcher_vars]
         # commented because then you can only start streaming on variables whose values have been previously assigned in the Bela code
         # not useful for the Sender function (send a buffer from the laptop and stream it through the watcher)
@@ -217,18 +388,19 @@ class Streamer(Watcher):
         #     while not all(self._streaming_buffers_queue_insertion_counts[var] > 0 for var in variables):
         #             await asyncio.sleep(0.1)
 
-        self._streaming_mode = "FOREVER" if self._peek_response is None else "PEEK"
         if self._mode == "STREAM":
             if periods != []:
                 warnings.warn(
                     "Periods list is ignored in streaming mode STREAM")
-            self.send_ctrl_msg(
+            self._subscribe(variables)
+            await self._async_send_ctrl_msg(
                 {"watcher": [{"cmd": "watch", "watchers": variables, "periods": [0]*len(_all_vars)}]})
             _print_info(
                 f"Started streaming variables {variables}... Run stop_streaming() to stop streaming.")
         elif self._mode == "MONITOR":
             periods = self._check_periods(periods, variables)
-            self.send_ctrl_msg(
+            self._subscribe(variables, periods)
+            await self._async_send_ctrl_msg(
                 {"watcher": [{"cmd": "monitor", "watchers": variables, "periods": periods}]})
             # asyncio.run(async_wait_for_streaming_to_start())
             if self._streaming_mode == "FOREVER":
@@ -250,14 +422,15 @@ class Streamer(Watcher):
         if self._saving_enabled:
             self._saving_enabled = False
             self._saving_filename = None
-            # await all active saving tasks
-            await asyncio.gather(*self._active_saving_tasks, return_exceptions=True)
-            self._active_saving_tasks.clear()
+            # wait for the writer thread to write the queued buffers and close the files
+            await self.loop.run_in_executor(None, self._saving_writer.stop)
+            self._saving_writer = None
 
         _all_vars = [var["name"] for var in self.watcher_vars]
         if variables == []:
             # if no variables specified, stop streaming all watcher variables (default)
             variables = _all_vars
+        self._unsubscribe(variables)
 
         if self._mode == "STREAM" and _previous_streaming_mode != "SCHEDULE":
             await self._async_send_ctrl_msg(
@@ -270,7 +443,7 @@ class Streamer(Watcher):
             if not _previous_streaming_mode == "PEEK":
                 _print_info(f"Stopped monitoring variables {variables}...")
 
-        self._processed_data_msg_queue = asyncio.Queue()  # clear processed data queue
+        self._processed_data_msg_queue.clear()  # clear processed data queue
         self._on_buffer_callback_is_active = False
         if self._on_buffer_callback_worker_task:
             self._on_buffer_callback_worker_task.cancel()
@@ -289,9 +462,9 @@ class Streamer(Watcher):
             streaming_buffers_queue (dict): Dict containing the streaming buffers for each streamed variable.
         """
 
-        return self.loop.run_until_complete(self._async_stop_streaming(variables))
+        return self._run(self._async_stop_streaming(variables))
 
-    def schedule_streaming(self, variables=[], timestamps=[], durations=[], saving_enabled=False, saving_filename="var_stream.txt", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+    def schedule_streaming(self, variables=[], timestamps=[], durations=[], saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
         """Schedule streaming of variables. The streaming session can be stopped with stop_streaming().
 
         Args:
@@ -307,15 +480,14 @@ class Streamer(Watcher):
             callback_args (tuple, optional): Arguments to pass to the callback functions. Defaults to ().
         """
 
-        variables = self.__streaming_common_routine(
-            variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
+        async def async_schedule_streaming(variables):
+            variables = await self.__async_streaming_common_routine(
+                "SCHEDULE", variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
 
-        self._streaming_mode = "SCHEDULE"
-
-        self.send_ctrl_msg(
-            {"watcher": [{"cmd": "watch", "timestamps": timestamps, "durations": durations, "watchers": variables}]})
+            self._subscribe(variables)
+            await self._async_send_ctrl_msg(
+                {"watcher": [{"cmd": "watch", "timestamps": timestamps, "durations": durations, "watchers": variables}]})
 
-        async def async_check_if_variables_have_been_streamed_and_stop():
             # poll to see when variables start streaming and when they stop
             started_streaming_vars = []
             finished_streaming_vars = []
@@ -336,8 +508,7 @@ class Streamer(Watcher):
 
             await self._async_stop_streaming()
 
-        self.loop.run_until_complete(
-            async_check_if_variables_have_been_streamed_and_stop())
+        self._run(async_schedule_streaming(variables))
 
     def stream_n_values(self, variables=[], periods=[], n_values=1000, saving_enabled=False, saving_filename=None, saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
         """
@@ -366,9 +537,9 @@ class Streamer(Watcher):
         Returns:
             streaming_buffers_queue (dict): Dict containing the streaming buffers for each streamed variable.
         """
-        return self.loop.run_until_complete(self.async_stream_n_values(variables, periods, n_values, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args))
+        return self._run(self.async_stream_n_values(variables, periods, n_values, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args))
 
-    async def async_stream_n_values(self, variables=[], periods=[], n_values=1000, saving_enabled=False, saving_filename="var_stream.txt", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
+    async def async_stream_n_values(self, variables=[], periods=[], n_values=1000, saving_enabled=False, saving_filename="var_stream.bin", saving_dir="./", on_buffer_callback=None, on_block_callback=None, callback_args=()):
         """
         Asynchronous version of stream_n_values(). Usage:
             stream_task = self.loop.create_task(streamer.async_stream_n_values(
@@ -389,14 +560,12 @@ class Streamer(Watcher):
             callback_args (tuple, optional): Arguments to pass to the callback functions. Defaults to ().
 
         Returns:
-            deque: Streaming buffers queue
+            dict: Streaming buffers queue
         """
         # resizes the streaming buffer size to n_values and returns it when full
 
-        variables = self.__streaming_common_routine(
-            variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
-
-        self._streaming_mode = "N_VALUES"  # flag cleared in __rec_msg_callback
+        variables = await self.__async_streaming_common_routine(
+            "N_VALUES", variables, saving_enabled, saving_filename, saving_dir, on_buffer_callback, on_block_callback, callback_args)
 
         if self._mode == "STREAM":
             # if mode stream, each buffer has m values and we need to calc the min buffers needed to supply n_values
@@ -417,6 +586,9 @@ class Streamer(Watcher):
             if periods != []:
                 warnings.warn(
                     "Periods list is ignored in streaming mode STREAM")
+            self._unsubscribe([var["name"] for var in self.watcher_vars])
+            self._subscribe(variables)
+            self._n_values_pending_vars = set(variables)
             await self._async_send_ctrl_msg(
                 {"watcher": [{"cmd": "unwatch", "watchers": [var["name"] for var in self.watcher_vars]}, {"cmd": "watch", "watchers": variables}]})
             _print_info(
@@ -427,6 +599,8 @@ class Streamer(Watcher):
             self.streaming_buffers_queue_length = n_values
 
             periods = self._check_periods(periods, variables)
+            self._subscribe(variables, periods)
+            self._n_values_pending_vars = set(variables)
             await self._async_send_ctrl_msg(
                 {"watcher": [{"cmd": "monitor", "watchers": variables, "periods": periods}]})
             _print_info(
@@ -445,104 +619,83 @@ class Streamer(Watcher):
 
     # -- data processing method --
 
-    async def _process_data_msg(self, msg):
-        """ Process data message received from Bela. This function is called by the websocket listener when a data message is received.
+    async def _process_data_msg(self, channel, msg):
+        """ Process data message received from Bela. This function is called by the data processing worker for each buffer received (see Watcher._async_start_listener).
 
         Args:
+            channel (dict): Channel of the buffer (see _DataFramer)
             msg (bytestring): Data message received from Bela
         """
 
-        global _channel, _type
-        try:
-            _, __ = _channel, _type
-        except NameError:  # initialise global variables to None
-            _channel = None
-            _type = None
-
         # in case buffer is received whilst streaming mode is on but parsed after streaming_enabled has changed
         _saving_enabled = copy.copy(self._saving_enabled)
         if self._streaming_mode != "OFF":
-            if len(msg) in [3, 4]:  # _channel can be either 1 or 2 bytes long
-                # parse buffer header
-                _channel, _type = re.search(
-                    r'(\d+).*?(\w)', msg.decode()).groups()
-                _channel = int(_channel)
-
-                assert _type in ['i', 'f', 'j', 'd',
-                                 'c'], f"Unsupported type: {_type}"
-
-                assert _type == self._watcher_vars[_channel][
-                    'type'], f"Type mismatch: {_type} != {self._watcher_vars[_channel]['type']}"
-
-                # convert unsigned int to int -- struct does not support unsigned ints
-                _type = 'i' if _type == 'j' else _type
-
-            elif len(msg) > 3 and _channel is not None and _type is not None:
-                var_name = self._watcher_vars[_channel]['name']
-                var_timestamp_mode = self._watcher_vars[_channel]["timestamp_mode"]
+            if channel is not None:
+                var_name = channel["name"]
+                var_timestamp_mode = channel["timestamp_mode"]
 
                 # parse buffer body
                 parsed_buffer = self._parse_binary_data(
-                    msg, var_timestamp_mode, _type).copy()
+                    msg, var_timestamp_mode, channel["type"])
+                if parsed_buffer is None:
+                    self._parse_error_count += 1
+                    return
 
                 # put in processed_queue if callback is true
                 if self._on_buffer_callback_is_active or self._on_block_callback_is_active:
-                    await self._processed_data_msg_queue.put({"name": var_name, "buffer": parsed_buffer})
+                    await self._processed_data_msg_queue.put({"name": var_name, "buffer": parsed_buffer}, key=var_name)
+
+                subscription = self._subscription.get(var_name)
+                ring = self._streaming_buffers_queue[var_name]
 
-                # fixes bug where data is shifted by period
-                _var_streaming_buffers_queue = copy.copy(
-                    self._streaming_buffers_queue[var_name])
-                _var_streaming_buffers_queue.append(parsed_buffer)
-                self._streaming_buffers_queue[var_name] = _var_streaming_buffers_queue
+                # in monitor n_values mode, the values kept have to be spaced by the monitoring period (the first value received after monitor is called might not be), so the buffer restarts when they are not
+                if self._streaming_mode == "N_VALUES" and self._mode == "MONITOR" and subscription is not None \
+                        and var_name in self._n_values_pending_vars and subscription["last_timestamp"] is not None \
+                        and int(parsed_buffer["timestamp"]) - subscription["last_timestamp"] != subscription["period"]:
+                    ring.clear()
+
+                # copies the buffer into the variable's ring buffer (buffers of non-standard length are kept apart, see _RingBuffer.overflow())
+                ring.append(**parsed_buffer)
+
+                if subscription is not None:
+                    if self._mode == "MONITOR":
+                        subscription["received"] += 1
+                        subscription["last_timestamp"] = int(
+                            parsed_buffer["timestamp"])
+                    else:
+                        subscription["received"] += len(parsed_buffer["data"])
 
                 # populate last streamed buffer
                 if self._mode == "STREAM":
                     self.last_streamed_buffer[var_name]["data"] = parsed_buffer["data"]
                     if var_timestamp_mode == "dense":
-                        self.last_streamed_buffer[var_name]["timestamps"] = [
-                            parsed_buffer["ref_timestamp"] + i for i in range(0, len(parsed_buffer["data"]))]
+                        self.last_streamed_buffer[var_name]["timestamps"] = parsed_buffer["ref_timestamp"] + np.arange(
+                            len(parsed_buffer["data"]), dtype=np.uint64)
                     elif var_timestamp_mode == "sparse":  # sparse
-                        self.last_streamed_buffer[var_name]["timestamps"] = [
-                            parsed_buffer["ref_timestamp"] + i for i in parsed_buffer["rel_timestamps"]]
+                        self.last_streamed_buffer[var_name]["timestamps"] = parsed_buffer["ref_timestamp"] + \
+                            parsed_buffer["rel_timestamps"].astype(np.uint64)
                 elif self._mode == "MONITOR":
                     self.last_streamed_buffer[var_name] = {
                         "timestamp": parsed_buffer["timestamp"], "value": parsed_buffer["value"]}
                 # save data to file if saving is enabled
-                if _saving_enabled:
-                    _saving_var_filename = os.path.join(os.path.dirname(
-                        self._saving_filename), f"{var_name}_{os.path.basename(self._saving_filename)}")
-                    # save the data asynchronously
-                    saving_task = self.loop.create_task(
-                        self._save_data_to_file(_saving_var_filename, parsed_buffer))
-                    self._active_saving_tasks.append(saving_task)
+                if _saving_enabled and self._saving_writer is not None:
+                    await self._save_data_to_file(channel["var"], msg)
 
                 # response to .peek() call
                 if self._mode == "MONITOR" and self._peek_response is not None:
                     # check that all the watched variables have been received
-                    self._peek_response[self._watcher_vars[_channel]["name"]] = {
+                    self._peek_response[var_name] = {
                         "timestamp": parsed_buffer["timestamp"], "value": parsed_buffer["value"]}
                     # notify peek() that data is available
                     if all(value is not None for value in self._peek_response.values()):
                         self._peek_response_available.set()
 
-                # if streaming buffers queue is full for watched variables and streaming mode is n_values
-                if self._streaming_mode == "N_VALUES":  # FIXME doesn't always work for monitor
-                    _watched_vars = await self._async_watched_vars()
-                    _monitored_vars = await self._async_monitored_vars()
-                    _vars = _watched_vars if self._mode == "STREAM" else _monitored_vars
-                    if all(len(self._streaming_buffers_queue[var["name"]]) == self._streaming_buffers_queue_length
-                            for var in _vars):
-
-                        # check if timestamp values are spaced by the correct period
-                        if self._mode == "MONITOR" and np.any([np.diff(self.values[var["name"]]["timestamps"]) != self._periods[idx] for idx, var in enumerate(_monitored_vars)]):
-                            for var in _monitored_vars:
-                                # fixes bug in which the diff between first and second timestamp is less than period
-                                self._streaming_buffers_queue[var["name"]].popleft(
-                                )
-
-                        else:
-                            self._streaming_mode = "OFF"
-                            self._streaming_buffer_available.set()
+                # if streaming buffers queue is full for all the subscribed variables and streaming mode is n_values
+                if self._streaming_mode == "N_VALUES" and var_name in self._n_values_pending_vars and len(ring) == ring.capacity:
+                    self._n_values_pending_vars.discard(var_name)
+                    if len(self._n_values_pending_vars) == 0:
+                        self._streaming_mode = "OFF"
+                        self._streaming_buffer_available.set()
 
     # -- callback methods --
 
@@ -551,6 +704,7 @@ class Streamer(Watcher):
             if not self._processed_data_msg_queue.empty():
                 msg = await self._processed_data_msg_queue.get()
                 self._processed_data_msg_queue.task_done()
+                start = time.perf_counter()
                 try:
                     if asyncio.iscoroutinefunction(on_buffer_callback):
                         if callback_args != () and type(callback_args) == tuple:
@@ -567,8 +721,10 @@ class Streamer(Watcher):
                         else:
                             on_buffer_callback(msg)
                 except Exception as e:
+                    self._callback_error_count += 1
                     _print_error(
                         f"Error in on_buffer_callback: {e}")
+                self._callback_latency.record(time.perf_counter() - start)
 
             await asyncio.sleep(0.0001)
 
@@ -581,6 +737,7 @@ class Streamer(Watcher):
                 msgs.append(msg)
                 self._processed_data_msg_queue.task_done()
             if len(msgs) == len(variables):
+                start = time.perf_counter()
                 try:
                     if asyncio.iscoroutinefunction(on_block_callback):
                         if callback_args != () and type(callback_args) == tuple:
@@ -598,8 +755,10 @@ class Streamer(Watcher):
                             on_block_callback(msgs)
 
                 except Exception as e:
+                    self._callback_error_count += 1
                     _print_error(
                         f"Error in on_block_callback: {e}")
+                self._callback_latency.record(time.perf_counter() - start)
 
             await asyncio.sleep(0.001)
 
@@ -646,6 +805,10 @@ class Streamer(Watcher):
             plot_update_delay (int, optional): Delay between plot updates in ms. Defaults to 90.
         """
         # TODO add variable checkers
+        # bokeh is imported on the first plot, since it is slow to import
+        import bokeh.plotting
+        import bokeh.models
+        import bokeh.driving
 
         def _app(doc):
             # Instantiate figures
@@ -683,7 +846,7 @@ class Streamer(Watcher):
                     data[x_var]["timestamp"]]if "timestamp" in data[x_var] else data[x_var]["timestamps"]}
                 for y_var in y_vars:
                     new_data[y_var] = data[y_var]["data"] if isinstance(
-                        data[y_var]["data"], list) else [data[y_var]["data"]]
+                        data[y_var]["data"], (list, np.ndarray)) else [data[y_var]["data"]]
                 source.stream(new_data, rollover)
 
             doc.add_root(p)
@@ -714,22 +877,24 @@ class Streamer(Watcher):
         # check buffer lengths are the same
         # wait until streaming buffers have been populated
         async def wait_for_streaming_buffers_to_arrive():
-            while not all(data['data'] for data in {
+            while not all(len(data['data']) for data in {
                     var: _buffer for var, _buffer in self.last_streamed_buffer.items() if var in y_vars}.values()):
                 await asyncio.sleep(0.01)
-        self.loop.run_until_complete(
+        self._run(
             wait_for_streaming_buffers_to_arrive())
         if len(y_vars) > 1 and not all([len(self.last_streamed_buffer[y_var]) == len(self.last_streamed_buffer[y_vars[0]]) for y_var in y_vars[1:]]):
             raise NotImplementedError(
                 "PlottingError: plotting buffers of different length is not supported yet. Try using the same timestamp mode and type for your variables...")
 
         async def _async_plot_data(x_var, y_vars, y_range=None, plot_update_delay=100, rollover=1000):
+            import bokeh.io
+            from bokeh.resources import INLINE
             bokeh.io.output_notebook(INLINE)
             bokeh.io.show(self._bokeh_plot_data_app(data={
                 var: _buffer for var, _buffer in self.last_streamed_buffer.items() if var in y_vars}, x_var=x_var,
                 y_vars=y_vars, y_range=y_range, plot_update_delay=plot_update_delay, rollover=rollover))
 
-        self.loop.run_until_complete(_async_plot_data(
+        self._run(_async_plot_data(
             x_var, y_vars, y_range, plot_update_delay, rollover))
 
 # -- utils --
@@ -744,54 +909,263 @@ class Streamer(Watcher):
 
     def load_data_from_file(self, filename):
         """
-        Loads data from a file saved through the saving_enabled function in start_streaming() or stream_n_values(). The file should contain a list of dicts, each dict containing a variable name and a list of values. The list of dicts should be separated by newlines.
+        Loads data from a file saved through the saving_enabled function in start_streaming() or stream_n_values(). Files saved by previous versions of pybela (one json dict per line) are also supported. To load large files, use read_stream_file() instead, which memory-maps the file and returns numpy arrays.
         Args:
             filename (str): Filename
 
         Returns:
-            list: List of values loaded from file
+            list: List of buffers loaded from file
         """
         try:
-            data = []
-            with open(filename, "r") as f:
-                while True:
-                    line = f.readline()
-                    if not line:
-                        break
-                    try:
-                        data.append(json.loads(line))
-                    except EOFError:  # reached end of file
-                        break
+            if not self._is_stream_file(filename):  # json lines
+                data = []
+                with open(filename, "r") as f:
+                    while True:
+                        line = f.readline()
+                        if not line:
+                            break
+                        try:
+                            data.append(json.loads(line))
+                        except EOFError:  # reached end of file
+                            break
+                return data
+
+            stream = self.read_stream_file(filename)
         except Exception as e:
             _print_error(f"Error while loading data from file: {e}")
             return None
 
-        return data
+        if stream["mode"] == "MONITOR":
+            return [{"timestamp": int(timestamp), "value": value.item()}
+                    for timestamp, value in zip(stream["timestamps"], stream["values"])]
+        return [{"ref_timestamp": int(stream["ref_timestamps"][idx]),
+                 **{name: stream[name][idx] for name in ["data", "rel_timestamps"] if name in stream}}
+                for idx in range(len(stream["ref_timestamps"]))]
+
+    def read_stream_file(self, filename, start_timestamp=None, end_timestamp=None):
+        """ Reads a file saved through the saving_enabled function in start_streaming() or stream_n_values() (or converted with convert_json_file()). The file is memory-mapped, so only the requested records are read from disk. If start_timestamp and/or end_timestamp are passed, only the buffers overlapping the range [start_timestamp, end_timestamp] are returned, which are found by binary search in the index of ref_timestamps stored at the end of the file.
+
+        Args:
+            filename (str): Filename
+            start_timestamp (int, optional): Start of the time range (in frames). Defaults to None (start of the file).
+            end_timestamp (int, optional): End of the time range (in frames). Defaults to None (end of the file).
+
+        Returns:
+            dict: Dictionary with the file metadata ("project_name", "var_name", "type", "timestamp_mode", "mode") and the data as numpy arrays: "ref_timestamps" (n_buffers,), "data" (n_buffers, data_length) and "rel_timestamps" (n_buffers, data_length, sparse variables only), or "timestamps" and "values" (n_values,) for files saved in monitor mode.
+        """
+        metadata, records, index = self._open_stream_file(filename)
+
+        if start_timestamp is not None or end_timestamp is not None:
+            # in monitor mode, there is one value per record
+            start, end = _search_time_range(
+                index, start_timestamp, end_timestamp, include_previous=metadata["mode"] != "MONITOR")
+            records = records[start:end]
+
+        if metadata["mode"] == "MONITOR":
+            return {**metadata, "timestamps": records["timestamp"], "values": records["value"]}
+        return {**metadata, "ref_timestamps": records["ref_timestamp"],
+                **{name: records[name] for name in ["data", "rel_timestamps"] if name in records.dtype.names}}
+
+    def read_stream_file_time_range(self, filename, start_timestamp=None, end_timestamp=None):
+        """ Returns the values saved in a file (see read_stream_file()) whose timestamps are in the range [start_timestamp, end_timestamp], with their timestamps. The buffers in the range are found by binary search in the index stored at the end of the file, and only those buffers are read and decoded. For sparse variables, the timestamps are computed from the rel_timestamps.
+
+        Args:
+            filename (str): Filename
+            start_timestamp (int, optional): Start of the time range (in frames). Defaults to None (start of the file).
+            end_timestamp (int, optional): End of the time range (in frames). Defaults to None (end of the file).
+
+        Returns:
+            dict: Dictionary with flat "timestamps" and "data" arrays
+        """
+        metadata, records, index = self._open_stream_file(filename)
+        if metadata["mode"] == "MONITOR":
+            stream = self.read_stream_file(
+                filename, start_timestamp, end_timestamp)
+            return {"timestamps": np.asarray(stream["timestamps"]), "data": np.asarray(stream["values"])}
+        return _select_time_range(records, index, metadata["timestamp_mode"], start_timestamp, end_timestamp)
+
+    def _open_stream_file(self, filename):
+        """ Memory-maps a file saved through the saving_enabled function in start_streaming() or stream_n_values().
 
-    async def _save_data_to_file(self, filename, msg):
-        """ Saves data to file asynchronously. This function is called by _process_data_msg() when a buffer is received and saving is enabled.
+        Args:
+            filename (str): Filename
+
+        Returns:
+            (dict, np.memmap, np.ndarray): File metadata, records and index of ref_timestamps (the index stored at the end of the file, or the ref_timestamps of the records if the file was not closed properly)
+        """
+        with open(filename, "rb") as f:
+            metadata = self._parse_saving_file_header(f)
+            header_size = f.tell()
+            f.seek(0, os.SEEK_END)
+            file_size = f.tell()
+
+            # footer: index offset, number of records, magic
+            n_records, index_offset = None, None
+            if file_size - header_size >= struct.calcsize(_saving_file_footer_format):
+                f.seek(-struct.calcsize(_saving_file_footer_format), os.SEEK_END)
+                _index_offset, _n_records, magic = struct.unpack(
+                    _saving_file_footer_format, f.read(struct.calcsize(_saving_file_footer_format)))
+                if magic == _saving_file_index_magic:
+                    n_records, index_offset = _n_records, _index_offset
+
+        record_dtype = self._saving_record_dtype(
+            metadata["type"], metadata["timestamp_mode"], metadata["mode"])
+        timestamp_field = "timestamp" if metadata["mode"] == "MONITOR" else "ref_timestamp"
+
+        if n_records is None:  # the file was not closed properly, there is no index
+            n_records = (file_size - header_size) // record_dtype.itemsize
+        if n_records == 0:
+            records = np.zeros(0, dtype=record_dtype)
+            return metadata, records, records[timestamp_field]
+
+        records = np.memmap(filename, dtype=record_dtype, mode="r",
+                            offset=header_size, shape=(n_records,))
+        index = np.memmap(filename, dtype="<u8", mode="r", offset=index_offset, shape=(
+            n_records,)) if index_offset is not None else records[timestamp_field]
+        return metadata, records, index
+
+    def convert_json_file(self, json_filename, filename, var_type, var_name=None):
+        """ Converts a file saved by previous versions of pybela (one json dict per line) into the binary format read by read_stream_file(). The timestamp mode (and whether the file was saved in monitor mode) is inferred from the saved buffers.
 
         Args:
-            filename (str): Filename to save data to
+            json_filename (str): Path to the json lines file
+            filename (str): Path to the converted file
+            var_type (str): Type of the saved variable ("f", "j", "i", "c", "d")
+            var_name (str, optional): Name of the saved variable. Defaults to None.
+
+        Returns:
+            str: Path to the converted file
+        """
+        buffers = self.load_data_from_file(json_filename)
+        if not buffers:
+            _print_error(f"Error: No buffers found in {json_filename}.")
+            return None
+
+        mode = "MONITOR" if "timestamp" in buffers[0] else "STREAM"
+        timestamp_mode = "sparse" if "rel_timestamps" in buffers[0] else "dense"
+        record_dtype = self._saving_record_dtype(
+            var_type, timestamp_mode, mode)
+
+        records = np.zeros(len(buffers), dtype=record_dtype)
+        for idx, _buffer in enumerate(buffers):
+            if mode == "MONITOR":
+                records[idx] = (_buffer["timestamp"], _buffer["value"])
+            else:
+                records[idx] = tuple(_buffer[name] for name in [
+                    "ref_timestamp", "data", "rel_timestamps"][:len(record_dtype.names)])
+        index = records["timestamp" if mode ==
+                        "MONITOR" else "ref_timestamp"].astype("<u8")
+
+        header = self._saving_file_header(
+            {"name": var_name, "type": var_type, "timestamp_mode": timestamp_mode}, mode)
+        with open(filename, "wb") as f:
+            f.write(header)
+            f.write(records.tobytes())
+            f.write(index.tobytes())
+            f.write(struct.pack(_saving_file_footer_format, len(header) + records.nbytes,
+                    len(records), _saving_file_index_magic))
+
+        return filename
+
+    @staticmethod
+    def _is_stream_file(filename):
+        """ Returns True if the file was saved in the binary format read by read_stream_file() """
+        with open(filename, "rb") as f:
+            return f.read(len(_saving_file_magic)) == _saving_file_magic
+
+    async def _save_data_to_file(self, var, msg):
+        """ Queues a received buffer to be written to the variable's file by the saving writer thread (see _SavingWriter). The file is created, with its header, when the first buffer of the variable is received. The buffer is written as received (a fixed-size binary record). If the writer queue is full, this function waits until there is space in the queue without blocking the event loop. This function is called by _process_data_msg() when a buffer is received and saving is enabled.
+
+        Args:
+            var (dict): Variable properties (as in watcher_vars)
             msg (bytestr): Data message received from Bela
         """
-        _msg = copy.copy(msg)
+        # the session might be stopped while waiting for the writer queue
+        writer, saving_filename = self._saving_writer, self._saving_filename
+        if writer is None or saving_filename is None:
+            return
         try:
-            # make sure there are not two processes writing to the same file
-            if filename not in self._saving_file_locks.keys():
-                # create lock for file if it does not exist
-                self._saving_file_locks[filename] = asyncio.Lock()
-
-            async with self._saving_file_locks[filename]:
-                async with aiofiles.open(filename, "a") as f:
-                    _json = json.dumps(copy.copy(_msg))
-                    await f.write(_json+"\n")
+            filename = self._saving_var_filenames.get(var["name"])
+            if filename is None:
+                filename = os.path.join(os.path.dirname(
+                    saving_filename), f"{var['name']}_{os.path.basename(saving_filename)}")
+                self._saving_var_filenames[var["name"]] = filename
+                await self._async_put_in_saving_writer(writer, ("open", filename, self._saving_file_header(var, self._mode)))
+
+            record_size = self._saving_record_dtype(
+                var["type"], var["timestamp_mode"], self._mode).itemsize
+            if len(msg) < record_size:
+                _print_warning(
+                    f"Received buffer of unexpected length for {var['name']}. The buffer won't be saved.")
+                return
+            await self._async_put_in_saving_writer(writer, ("write", filename, msg[:record_size]))
 
         except Exception as e:
             _print_error(f"Error while saving data to file: {e}")
 
-        # finally:
-        #     await self._async_remove_item_from_list(self._active_saving_tasks, asyncio.current_task())
+    async def _async_put_in_saving_writer(self, writer, item):
+        """ Puts an item in the saving writer queue. If the queue is full, waits in an executor thread so that the event loop is not blocked.
+
+        Args:
+            writer (_SavingWriter): Saving writer
+            item (tuple): Writer command (see _SavingWriter.put())
+        """
+        try:
+            writer.put(item, block=False)
+        except queue.Full:
+            await self.loop.run_in_executor(None, writer.put, item)
+
+    def _saving_file_header(self, var, mode):
+        """ Returns the header of a saving file: the magic bytes, the format version (uint32), the length of the metadata (uint32) and the metadata (variable name, type, timestamp mode, streaming mode and project name) as utf-8 json, padded to a multiple of 8 bytes. The header is followed by the fixed-size records (see _saving_record_dtype()) and, once the file is closed, by the index of ref_timestamps (uint64) and the footer (index offset, number of records and index magic bytes, see _saving_file_footer_format).
+
+        Args:
+            var (dict): Variable properties (as in watcher_vars)
+            mode (str): Streaming mode ("STREAM" or "MONITOR")
+
+        Returns:
+            bytes: File header
+        """
+        metadata = json.dumps({"var_name": var["name"],
+                               "type": var["type"],
+                               "timestamp_mode": var["timestamp_mode"],
+                               "mode": mode,
+                               "project_name": self.project_name}).encode()
+        metadata += b" " * (-(len(_saving_file_magic) + 8 + len(metadata)) % 8)
+        return _saving_file_magic + struct.pack("<II", _saving_file_version, len(metadata)) + metadata
+
+    @staticmethod
+    def _parse_saving_file_header(file):
+        """ Parses the header of a saving file (see _saving_file_header()) and leaves the file at the start of the records.
+
+        Args:
+            file (file object): File opened in binary mode, at position 0
+
+        Returns:
+            dict: Metadata of the file
+        """
+        if file.read(len(_saving_file_magic)) != _saving_file_magic:
+            raise ValueError(f"{file.name} is not a pybela streaming file.")
+        version, metadata_length = struct.unpack("<II", file.read(8))
+        if version > _saving_file_version:
+            raise ValueError(
+                f"{file.name} was saved with a newer version of pybela (format version {version}).")
+        return json.loads(file.read(metadata_length))
+
+    @staticmethod
+    def _saving_record_dtype(var_type, timestamp_mode, mode):
+        """ Returns the dtype of the records in a saving file. In monitor mode each record is a timestamp and a value, otherwise it is a buffer as sent over websockets, without padding (see Watcher._get_buffer_dtype()).
+
+        Args:
+            var_type (str): Variable type
+            timestamp_mode (str): Timestamp mode
+            mode (str): Streaming mode ("STREAM" or "MONITOR")
+
+        Returns:
+            np.dtype: Record dtype
+        """
+        if mode == "MONITOR":
+            return np.dtype([("timestamp", "<u8"), ("value", _numpy_type_map[var_type])])
+        return Watcher._get_buffer_dtype(var_type, timestamp_mode)
 
     def _generate_filename(self, saving_filename, saving_dir="./"):
         """ Generates a filename for saving data by adding the variable name and a number at the end in case the filename already exists to avoid overwriting saved data. Pattern: varname_filename__idx.ext.  This function is called by start_streaming() and stream_n_values() when saving is enabled.
@@ -816,15 +1190,6 @@ class Streamer(Watcher):
 
         return os.path.join(saving_dir, f"{filename_wo_ext}__{idx}{filename_ext}")
 
-    async def _async_remove_item_from_list(self, _list, task):
-        """ Removes a task from a list of tasks asynchronously. This function is called by _save_data_to_file() when a task is finished.
-
-        Args:
-            _list (list):  A list of tasks
-            task (asyncio task): The task to be removed from _list
-        """
-        _list.remove(task)
-
     def _check_periods(self, periods, variables):
         """Checks the periods format and values. If periods is an int, it is converted to a list of the same length as variables. If periods is an empty list, it is converted to a list of 1000s. If periods is a list, it is checked that it has the same length as variables and that all values are integers.
 
@@ -863,3 +1228,102 @@ class Streamer(Watcher):
             self._on_buffer_callback_worker_task.cancel()
         if self._on_block_callback_worker_task is not None and not self._on_block_callback_worker_task.done():
             self._on_block_callback_worker_task.cancel()
+
+
+_saving_file_magic = b"PYBELA\x00S"
+_saving_file_index_magic = b"PYBELA\x00I"
+_saving_file_version = 1
+_saving_file_footer_format = "<QQ8s"
+
+
+class _SavingWriter:
+    def __init__(self, max_queue_size=1024, max_batch_size=256):
+        """ Writes the saved buffers of all variables in a dedicated thread. Each file is opened once and kept open until the writer is stopped, and the queued buffers are written in batches (one write per file and batch).
+
+            Args:
+                max_queue_size (int, optional): Maximum number of items in the writer queue. Defaults to 1024.
+                max_batch_size (int, optional): Maximum number of items written per batch. Defaults to 256.
+        """
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._max_batch_size = max_batch_size
+        self._stopped = False
+        self._files = {}
+        self._indexes = {}  # ref_timestamps of the records written to each file
+        self._thread = threading.Thread(
+            target=self._run, name="pybela-saving-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, item, block=True):
+        """ Queues an item for the writer thread.
+
+            Args:
+                item (tuple): ("open", filename, header) creates the file and writes the header, ("write", filename, data) appends data to the file
+                block (bool, optional): Block if the queue is full. If False, queue.Full is raised instead. Defaults to True.
+        """
+        while not self._stopped:  # items queued after stop() are discarded
+            try:
+                self._queue.put(item, block=block,
+                                timeout=0.1 if block else None)
+                return
+            except queue.Full:
+                if not block:
+                    raise
+
+    def stop(self):
+        """ Writes the queued items, closes the files and stops the writer thread. Blocks until the thread has finished. """
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # group consecutive writes to the same file
+            chunks = {}
+            for item in batch:
+                if item is None:
+                    running = False
+                    break
+                command, filename, data = item
+                if command == "open":
+                    self._write_chunks(chunks)
+                    chunks = {}
+                    try:
+                        self._files[filename] = open(filename, "wb")
+                        self._files[filename].write(data)
+                        self._indexes[filename] = array.array("Q")
+                    except OSError as e:
+                        _print_error(
+                            f"Error while saving data to file: {e}")
+                elif command == "write":
+                    chunks.setdefault(filename, []).append(data)
+            self._write_chunks(chunks)
+
+        # write the index of ref_timestamps and the footer (see Streamer.read_stream_file())
+        for filename, file in self._files.items():
+            try:
+                index_offset = file.tell()
+                file.write(self._indexes[filename].tobytes())
+                file.write(struct.pack(_saving_file_footer_format, index_offset, len(
+                    self._indexes[filename]), _saving_file_index_magic))
+            except OSError as e:
+                _print_error(f"Error while saving data to file: {e}")
+            file.close()
+        self._files.clear()
+        self._indexes.clear()
+
+    def _write_chunks(self, chunks):
+        for filename, data in chunks.items():
+            try:
+                self._files[filename].write(b"".join(data))
+                self._indexes[filename].extend(
+                    struct.unpack_from("<Q", record)[0] for record in data)
+            except (OSError, KeyError) as e:
+                _print_error(f"Error while saving data to file: {e}")
@@ -1,17 +1,35 @@
 import asyncio
 import websockets
 import json
+import re
 import errno
+import threading
+import time
+import collections
 import struct
 import os
-import nest_asyncio
-import paramiko
-from .utils import _print_error, _print_warning, _print_ok
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .utils import _print_error, _print_warning, _print_ok, _IngestQueue, _LatencyHistogram
+
+# numpy equivalents of the watcher types. Buffers are sent by Bela in little-endian byte order
+_numpy_type_map = {
+    "f": "<f4",
+    "j": "<u4",
+    "i": "<i4",
+    "c": "<i1",
+    "d": "<f8",
+}
 
 
 class Watcher:
 
-    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control"):
+    # structured dtypes used to decode buffers, cached by (type, timestamp_mode, padded)
+    _buffer_dtypes = {}
+
+    def __init__(self, ip="192.168.7.2", port=5555, data_add="gui_data", control_add="gui_control", run_in_thread=False, loop_backend="asyncio"):
         """ Watcher class - manages websockets and abstracts communication with the Bela watcher
 
             Args:
@@ -19,6 +37,8 @@ class Watcher:
                 port (int, optional): Remote address port. Defaults to 5555.
                 data_add (str, optional): Data endpoint. Defaults to "gui_data".
                 control_add (str, optional): Control endpoint. Defaults to "gui_control".
+                run_in_thread (bool, optional): Run the event loop in a dedicated background thread (shared by all the instances created with run_in_thread=True). Data is then received continuously, not only while a method of the class is running, and the sync methods can be called from any thread (but not from callbacks, which run in the loop thread: use the async methods there). nest_asyncio is not needed in this mode. Defaults to False.
+                loop_backend (str or asyncio.AbstractEventLoop, optional): Event loop implementation: "asyncio" (default asyncio loop), "uvloop" (requires the uvloop package, not available on Windows) or an event loop created by the caller. A loop supplied by the caller that is already running in another thread is used as in thread mode. Defaults to "asyncio".
         """
 
         self.project_name = None
@@ -35,6 +55,11 @@ class Watcher:
 
         self.ssh_client = None
         self.sftp_client = None
+        self._ssh_session = None  # shared by the file operations, see _get_ssh_session()
+        # paramiko calls block, so they run in a thread pool instead of the event loop (see _async_run_ssh)
+        self._ssh_executor = None
+        self.ssh_max_workers = 4
+        self.ssh_timeout = 30.0  # seconds before an ssh operation is aborted, None to wait forever
 
         self._watcher_vars = None
         self._mode = "WATCH"
@@ -43,7 +68,8 @@ class Watcher:
         try:
             _ = _pybela_ws_register
         except NameError:  # initialise _pybela_ws_register only once in runtime
-            _pybela_ws_register = {"event-loop": None,
+            _pybela_ws_register = {"event-loop": {},  # by loop backend
+                                   "thread-event-loop": {},  # by loop backend
                                    "WATCH": {},
                                    "STREAM":  {},
                                    "LOG":  {},
@@ -52,28 +78,72 @@ class Watcher:
 
         self._pybela_ws_register = _pybela_ws_register
 
-        # if running in jupyter notebook, enable nest_asyncio
         is_running_on_jupyter_notebook = False
         try:
             get_ipython().__class__.__name__
             is_running_on_jupyter_notebook = True
-            nest_asyncio.apply()
-            print("Running in Jupyter notebook. Enabling nest_asyncio.")
         except NameError:
             pass
 
-        # background event loop
-        # If no loop exists, create a new one
-        if self._pybela_ws_register["event-loop"] is None:
-
-            if is_running_on_jupyter_notebook:
-                self.loop = asyncio.get_event_loop()
+        self._loop_thread = None
+        if isinstance(loop_backend, asyncio.AbstractEventLoop):
+            # loop supplied by the caller, not shared through the register
+            self.loop = loop_backend
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is self.loop:
+                # the loop is running in this thread (e.g. asyncio.get_running_loop() passed from a coroutine): only the async methods can be used
+                self._loop_thread = threading.current_thread()
+            elif self.loop.is_running():
+                # the loop is run by the caller in another thread
+                self._loop_thread = asyncio.run_coroutine_threadsafe(
+                    self._async_current_thread(), self.loop).result()
+            elif run_in_thread:
+                self._loop_thread = threading.Thread(
+                    target=self.loop.run_forever, name="pybela-event-loop", daemon=True)
+                self._loop_thread.start()
+        else:
+            if loop_backend not in ["asyncio", "uvloop"]:
+                raise ValueError(
+                    f"Unsupported loop backend: {loop_backend}. Use 'asyncio', 'uvloop' or an event loop.")
+            if is_running_on_jupyter_notebook and loop_backend != "asyncio" and not run_in_thread:
+                # nest_asyncio only patches asyncio loops
+                _print_warning(
+                    f"The {loop_backend} loop can't run inside the notebook event loop. Running it in a background thread (run_in_thread=True).")
+                run_in_thread = True
+
+            if run_in_thread:
+                # the loop runs forever in a daemon thread, shared by all instances in thread mode with the same backend
+                if loop_backend not in self._pybela_ws_register["thread-event-loop"]:
+                    loop = self._new_event_loop(loop_backend)
+                    thread = threading.Thread(
+                        target=loop.run_forever, name="pybela-event-loop", daemon=True)
+                    thread.start()
+                    self._pybela_ws_register["thread-event-loop"][loop_backend] = (
+                        loop, thread)
+                self.loop, self._loop_thread = self._pybela_ws_register[
+                    "thread-event-loop"][loop_backend]
             else:
-                self.loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.loop)
-            self._pybela_ws_register["event-loop"] = self.loop
-        else:  # if loop exists, use the existing one
-            self.loop = self._pybela_ws_register["event-loop"]
+                # if running in jupyter notebook, enable nest_asyncio
+                if is_running_on_jupyter_notebook:
+                    import nest_asyncio
+                    nest_asyncio.apply()
+                    print("Running in Jupyter notebook. Enabling nest_asyncio.")
+
+                # background event loop
+                # If no loop exists, create a new one
+                if loop_backend not in self._pybela_ws_register["event-loop"]:
+
+                    if is_running_on_jupyter_notebook:
+                        self.loop = asyncio.get_event_loop()
+                    else:
+                        self.loop = self._new_event_loop(loop_backend)
+                        asyncio.set_event_loop(self.loop)
+                    self._pybela_ws_register["event-loop"][loop_backend] = self.loop
+                else:  # if loop exists, use the existing one
+                    self.loop = self._pybela_ws_register["event-loop"][loop_backend]
 
         # tasks
         self._ctrl_listener_task = None
@@ -82,11 +152,49 @@ class Watcher:
         self._send_data_msg_task = None
         self._send_ctrl_msg_task = None
 
-        # queues
-        self._received_data_msg_queue = asyncio.Queue()
-        self._list_response_queue = asyncio.Queue()
-        self._to_send_data_msg_queue = asyncio.Queue()
-        self._to_send_ctrl_msg_queue = asyncio.Queue()
+        # queues (created in the loop thread, since in python 3.9 they are bound to the current event loop on creation)
+        # received data buffers waiting to be processed. Unbounded by default, see set_ingest_queue()
+        self._received_data_msg_queue = self._call_on_loop(_IngestQueue)
+        self._to_send_data_msg_queue = self._call_on_loop(asyncio.Queue)
+        self._to_send_ctrl_msg_queue = self._call_on_loop(asyncio.Queue)
+
+        # watcher state cache (see _async_list). Snapshots of the list response are served for up to list_max_age seconds, and are invalidated when a command that changes the watcher state is sent
+        self.list_max_age = 0.1
+        self._list_cache = None
+        self._list_generation = 0
+        self._list_in_flight = None
+        self._list_pending = collections.deque()  # list requests awaiting a response, in the order they were sent
+
+        # control messages queued in the same tick are coalesced into one frame of at most ctrl_msg_max_batch messages (see _send_ctrl_msg_worker). If ctrl_msg_max_latency is set, the worker keeps collecting messages while they keep arriving (at most ctrl_msg_idle_time seconds apart), for up to ctrl_msg_max_latency seconds
+        self.ctrl_msg_max_latency = 0
+        self.ctrl_msg_idle_time = 0.001
+        self.ctrl_msg_max_batch = 100
+        self._sent_ctrl_msg_count = 0
+        self._sent_ctrl_frame_count = 0
+
+        # number of messages and bytes received in the data websocket
+        self._received_data_msg_count = 0
+        self._received_data_bytes_count = 0
+
+        # pipeline stats (see stats())
+        self.loop_lag_interval = 0.1  # seconds between event loop lag probes
+        self._loop_lag_task = None
+        self._process_latency = _LatencyHistogram()
+        self._loop_lag = _LatencyHistogram()
+        self._stats_start_time = time.perf_counter()
+        self._stats_start_counts = (0, 0)
+        self._received_var_counts = {}  # variable name -> [messages, bytes]
+
+        # framing state of the data websocket (see _DataFramer)
+        self._data_framer = None
+
+        # reconnection (see set_auto_reconnect)
+        self._auto_reconnect = {"enabled": False, "max_attempts": None,
+                                "initial_delay": 0.5, "max_delay": 30.0}
+        self._reconnect_task = None
+        self._reconnecting = False
+        self._closing = False  # the websockets are being closed by the user
+        self.discontinuities = []
 
         # debug
         self._printall_responses = False
@@ -160,6 +268,116 @@ class Watcher:
         _list = await self._async_list()
         return self._filtered_watcher_vars(_list["watchers"], lambda var: not var["watched"])
 
+    @property
+    def data_framing_errors(self):
+        """Returns the number of framing errors in the data websocket: headers not followed by a buffer (orphan_headers), buffers not preceded by a header (orphan_buffers) and headers of unknown channels or types (invalid_headers).
+
+        Returns:
+            dict: Number of framing errors by kind
+        """
+        return self._data_framer.errors if self._data_framer is not None else _DataFramer([]).errors
+
+    def _get_data_framer(self):
+        """Returns the framer of the data websocket. The framer is rebuilt when the watcher variables are refreshed (e.g. on connection), since its dispatch table depends on them.
+
+        Returns:
+            _DataFramer: Framer of the data websocket
+        """
+        if self._data_framer is None or self._data_framer.watcher_vars is not self._watcher_vars:
+            self._data_framer = _DataFramer(self._watcher_vars or [])
+        return self._data_framer
+
+    @property
+    def runs_in_thread(self):
+        """Returns True if the event loop runs in a dedicated background thread (see run_in_thread in the constructor)"""
+        return self._loop_thread is not None
+
+    # --- event loop methods --- #
+
+    def _run(self, coro):
+        """Runs a coroutine in the event loop and returns its result, blocking until it is done. Used by the sync methods: in thread mode, the coroutine is submitted to the loop thread with asyncio.run_coroutine_threadsafe(), otherwise the loop runs until the coroutine is complete.
+
+        Args:
+            coro (coroutine): Coroutine to run
+
+        Returns:
+            Result of the coroutine
+        """
+        if self._loop_thread is None:
+            return self.loop.run_until_complete(coro)
+        if threading.current_thread() is self._loop_thread:
+            coro.close()
+            raise RuntimeError(
+                "Sync methods can't be called from the event loop thread (e.g. in callbacks), use the async methods instead.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _call_on_loop(self, func, *args):
+        """Calls a function in the event loop thread and returns its result, blocking until it is done. Used to create and modify the state used by the loop (e.g. queues and streaming buffers) from the sync methods, which in thread mode run in other threads.
+
+        Args:
+            func (callable): Function
+            *args: Arguments of func
+
+        Returns:
+            Result of func
+        """
+        if self._loop_thread is None or threading.current_thread() is self._loop_thread:
+            return func(*args)
+
+        async def _async_call():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(_async_call(), self.loop).result()
+
+    def _create_task(self, coro):
+        """Schedules a coroutine as a task in the event loop. Can be called from any thread.
+
+        Args:
+            coro (coroutine): Coroutine to schedule
+
+        Returns:
+            asyncio.Task: Task
+        """
+        if self._loop_thread is None or threading.current_thread() is self._loop_thread:
+            return self.loop.create_task(coro)
+
+        async def _async_create_task():
+            return self.loop.create_task(coro)
+        return asyncio.run_coroutine_threadsafe(_async_create_task(), self.loop).result()
+
+    @staticmethod
+    def _new_event_loop(loop_backend):
+        """Creates an event loop of the given backend
+
+        Args:
+            loop_backend (str): "asyncio" or "uvloop"
+
+        Returns:
+            asyncio.AbstractEventLoop: Event loop
+        """
+        if loop_backend == "uvloop":
+            try:
+                import uvloop
+            except ImportError:
+                raise ImportError(
+                    "The uvloop loop backend requires the uvloop package. Install it with: pip install uvloop")
+            return uvloop.new_event_loop()
+        return asyncio.new_event_loop()
+
+    @staticmethod
+    async def _async_current_thread():
+        return threading.current_thread()
+
+    async def _async_wait_for_tasks(self, tasks):
+        """Waits until tasks are done. Exceptions raised by the tasks are returned as results.
+
+        Args:
+            tasks (list of asyncio.Task): Tasks
+
+        Returns:
+            list: Results of the tasks
+        """
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
     # --- connection methods --- #
 
     def connect(self):
@@ -169,79 +387,90 @@ class Watcher:
         if self.is_connected():
             return "Already connected"
 
-        async def _async_connect():
-            try:
-                # Close any open ctrl websocket open for the same mode (STREAM, LOG, MONITOR, WATCH)
-                if self._pybela_ws_register[self._mode].get(self.ws_ctrl_add) is not None and self._pybela_ws_register[self._mode][self.ws_ctrl_add].state == 1:
-                    _print_warning(
-                        f"pybela doesn't support more than one active connection at a time for a given mode. Closing previous connection for {self._mode} at {self.ws_ctrl_add}.")
-                    await self._pybela_ws_register[self._mode][self.ws_ctrl_add].close()
-                    self._pybela_ws_register[self._mode][self.ws_ctrl_add].keepalive_task.cancel(
-                    )
-
-                # Control and monitor can't be used at the same time
-                _is_control_mode_running = self._pybela_ws_register["CONTROL"].get(
-                    self.ws_ctrl_add) is not None and self._pybela_ws_register["CONTROL"][self.ws_ctrl_add].state == 1
-                _is_monitor_mode_running = self._pybela_ws_register["MONITOR"].get(
-                    self.ws_ctrl_add) is not None and self._pybela_ws_register["MONITOR"][self.ws_ctrl_add].state == 1
-                if (self._mode == "MONITOR" and _is_control_mode_running) or (self._mode == "CONTROL" and _is_monitor_mode_running):
-                    _print_warning(
-                        f"pybela doesn't support running control and monitor modes at the same time. You are currently running {'CONTROL' if self._mode=='MONITOR' else 'MONITOR'} at {self.ws_ctrl_add}. You can close it running controller.disconnect()")
-                    _print_error("Connection failed")
-                    return 0
+        return self._run(self._async_connect())
 
-                # Connect to the control websocket
-                # try:
-                self.ws_ctrl = await websockets.connect(self.ws_ctrl_add)
-                # except asyncio.TimeoutError:
-                #     _print_error(f"Timeout connecting to {self.ws_ctrl_add}")
-                #     return 0
-                self._pybela_ws_register[self._mode][self.ws_ctrl_add] = self.ws_ctrl
-
-                # If connection is successful,
-                #  (1) send connection reply to establish the connection
-                # (2) connect to the data websocket
-                # (3) start data processing and sending tasks
-                # (4) start listener tasks
-                # (5) refresh watcher vars in case new project has been loaded in Bela
-                response = json.loads(await self.ws_ctrl.recv())
-                if "event" in response and response["event"] == "connection":
-                    self.project_name = response["projectName"]
-
-                    # Send connection reply to establish the connection
-                    await self._async_send_ctrl_msg({"event": "connection-reply"})
-
-                    # Connect to the data websocket
-                    self.ws_data = await websockets.connect(self.ws_data_add)
-
-                    # start data sending and processing tasks
-                    self._send_ctrl_msg_task = self.loop.create_task(
-                        self._send_ctrl_msg_worker())
-                    self._send_data_msg_task = self.loop.create_task(
-                        self._send_data_msg_worker())
-                    self._process_received_data_msg_task = self.loop.create_task(
-                        self._process_data_msg_worker())
-
-                    # start listener tasks
-                    self._ctrl_listener_task = self.loop.create_task(self._async_start_listener(
-                        self.ws_ctrl, self.ws_ctrl_add))
-                    self._data_listener_task = self.loop.create_task(self._async_start_listener(
-                        self.ws_data, self.ws_data_add))
-
-                    # refresh watcher vars in case new project has been loaded in Bela
-                    self._list = await self._async_list()
-                    self._sample_rate = self._list["sampleRate"]
-                    self._watcher_vars = self._filtered_watcher_vars(self._list["watchers"],
-                                                                     lambda var: True)
-                    _print_ok("Connection successful")
-                    return 1
-                else:
-                    _print_error("Connection failed")
-                    return 0
-            except Exception as e:
-                raise ConnectionError(f"Connection failed: {str(e)}.")
+    async def _async_connect(self):
+        """Establishes the WebSocket connection. Async version of connect().
+
+        Returns:
+            int: 1 if the connection was successful, 0 otherwise
+        """
+        self._closing = False
+        try:
+            # Close any open ctrl websocket open for the same mode (STREAM, LOG, MONITOR, WATCH)
+            if self._pybela_ws_register[self._mode].get(self.ws_ctrl_add) is not None and self._pybela_ws_register[self._mode][self.ws_ctrl_add].state == 1:
+                _print_warning(
+                    f"pybela doesn't support more than one active connection at a time for a given mode. Closing previous connection for {self._mode} at {self.ws_ctrl_add}.")
+                await self._pybela_ws_register[self._mode][self.ws_ctrl_add].close()
+                self._pybela_ws_register[self._mode][self.ws_ctrl_add].keepalive_task.cancel(
+                )
+
+            # Control and monitor can't be used at the same time
+            _is_control_mode_running = self._pybela_ws_register["CONTROL"].get(
+                self.ws_ctrl_add) is not None and self._pybela_ws_register["CONTROL"][self.ws_ctrl_add].state == 1
+            _is_monitor_mode_running = self._pybela_ws_register["MONITOR"].get(
+                self.ws_ctrl_add) is not None and self._pybela_ws_register["MONITOR"][self.ws_ctrl_add].state == 1
+            if (self._mode == "MONITOR" and _is_control_mode_running) or (self._mode == "CONTROL" and _is_monitor_mode_running):
+                _print_warning(
+                    f"pybela doesn't support running control and monitor modes at the same time. You are currently running {'CONTROL' if self._mode=='MONITOR' else 'MONITOR'} at {self.ws_ctrl_add}. You can close it running controller.disconnect()")
+                _print_error("Connection failed")
+                return 0
+
+            # Connect to the control websocket
+            # try:
+            self.ws_ctrl = await websockets.connect(self.ws_ctrl_add)
+            # except asyncio.TimeoutError:
+            #     _print_error(f"Timeout connecting to {self.ws_ctrl_add}")
+            #     return 0
+            self._pybela_ws_register[self._mode][self.ws_ctrl_add] = self.ws_ctrl
+
+            # If connection is successful,
+            #  (1) send connection reply to establish the connection
+            # (2) connect to the data websocket
+            # (3) start data processing and sending tasks
+            # (4) start listener tasks
+            # (5) refresh watcher vars in case new project has been loaded in Bela
+            response = json.loads(await self.ws_ctrl.recv())
+            if "event" in response and response["event"] == "connection":
+                self.project_name = response["projectName"]
+
+                # Send connection reply to establish the connection
+                await self._async_send_ctrl_msg({"event": "connection-reply"})
+
+                # Connect to the data websocket
+                self.ws_data = await websockets.connect(self.ws_data_add)
+
+                # start data sending and processing tasks
+                self._send_ctrl_msg_task = self._create_task(
+                    self._send_ctrl_msg_worker())
+                self._send_data_msg_task = self._create_task(
+                    self._send_data_msg_worker())
+                self._process_received_data_msg_task = self._create_task(
+                    self._process_data_msg_worker())
+                self._loop_lag_task = self._create_task(
+                    self._loop_lag_worker())
+
+                # start listener tasks
+                self._ctrl_listener_task = self._create_task(self._async_start_listener(
+                    self.ws_ctrl, self.ws_ctrl_add))
+                self._data_listener_task = self._create_task(self._async_start_listener(
+                    self.ws_data, self.ws_data_add))
+
+                # refresh watcher vars in case new project has been loaded in Bela
+                self._list = await self._async_list(max_age=0)
+                self._sample_rate = self._list["sampleRate"]
+                self._watcher_vars = self._filtered_watcher_vars(self._list["watchers"],
+                                                                 lambda var: True)
+                if not self._reconnecting:  # the stats window spans reconnections
+                    self._reset_stats_counters()
+                _print_ok("Connection successful")
+                return 1
+            else:
+                _print_error("Connection failed")
+                return 0
+        except Exception as e:
+            raise ConnectionError(f"Connection failed: {str(e)}.")
 
-        return self.loop.run_until_complete(_async_connect())
 
     def is_connected(self):
         """Check if the websocket is connected
@@ -253,54 +482,178 @@ class Watcher:
 
     async def _async_disconnect(self):
         """Disconnects the websockets. Closes the websockets and cancels the keepalive task."""
+        self._closing = True  # not reconnected by the supervisor
         # close websockets
         for ws in [self.ws_ctrl, self.ws_data]:
             if ws is not None and ws.state == 1:
                 await ws.close()
                 ws.keepalive_task.cancel()  # cancel keepalive task
+        # responses to pending list requests won't arrive anymore
+        self._cancel_list_requests()
 
     def disconnect(self):
         """Closes websockets. Sync wrapper for _async_disconnect.
         """
-        self.loop.run_until_complete(self._async_disconnect())
+        self._run(self._async_disconnect())
+
+    # -- reconnection -- #
+
+    def set_auto_reconnect(self, enabled=True, max_attempts=None, initial_delay=0.5, max_delay=30.0):
+        """ Enables or disables automatic reconnection. When enabled, if a websocket is closed by anything other than disconnect() or cleanup() (e.g. a network hiccup), a supervisor task reconnects with exponential backoff and resumes the session: the Streamer and Monitor re-issue the watch/monitor commands of the streamed variables (callbacks and saving carry on), and the Logger restarts logging the variables that Bela stopped logging. Each gap is recorded in discontinuities. Outside thread mode, the supervisor only runs while the event loop runs (e.g. during wait()).
+
+        Args:
+            enabled (bool, optional): Enables automatic reconnection. Defaults to True.
+            max_attempts (int, optional): Maximum number of connection attempts after a drop. If None, it retries forever. Defaults to None.
+            initial_delay (float, optional): Delay in seconds before the second attempt. Doubled after every failed attempt. Defaults to 0.5.
+            max_delay (float, optional): Maximum delay in seconds between attempts. Defaults to 30.0.
+        """
+        self._auto_reconnect = {"enabled": enabled, "max_attempts": max_attempts,
+                                "initial_delay": initial_delay, "max_delay": max_delay}
+
+    def _on_websocket_closed(self):
+        """ Called by the listeners when their websocket is closed. Starts the reconnection supervisor (once) if auto reconnection is enabled and the websocket wasn't closed by the user.
+        """
+        if self._closing or not self._auto_reconnect["enabled"]:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self._create_task(
+                self._async_reconnect_supervisor())
+
+    async def _async_reconnect_supervisor(self):
+        """ Reconnects with exponential backoff and resumes the session (see set_auto_reconnect).
+
+        Returns:
+            int: 1 if the connection was recovered, 0 otherwise
+        """
+        disconnected_at = time.time()
+        last_timestamps = self._last_received_timestamps()
+        _print_warning(f"Connection to {self.ws_ctrl_add} lost. Reconnecting...")
+
+        # stop the workers of the lost connection (they would compete with the new ones for the queues) and close the socket that is still open, if any
+        await self._async_cancel_tasks([self._ctrl_listener_task, self._data_listener_task,
+                                        self._process_received_data_msg_task, self._send_data_msg_task,
+                                        self._send_ctrl_msg_task, self._loop_lag_task])
+        for ws in [self.ws_ctrl, self.ws_data]:
+            if ws is not None and ws.state == 1:
+                await ws.close()
+        self._cancel_list_requests()
+
+        delay = self._auto_reconnect["initial_delay"]
+        attempt = 0
+        self._reconnecting = True
+        try:
+            while not self._closing:
+                attempt += 1
+                try:
+                    if await self._async_connect():
+                        break
+                except ConnectionError as e:
+                    _print_warning(f"Reconnection attempt {attempt} failed: {e}")
+                if self._auto_reconnect["max_attempts"] is not None and attempt >= self._auto_reconnect["max_attempts"]:
+                    _print_error(
+                        f"Could not reconnect to {self.ws_ctrl_add} after {attempt} attempts.")
+                    return 0
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, self._auto_reconnect["max_delay"])
+        finally:
+            self._reconnecting = False
+        if self._closing:
+            return 0
+
+        self.discontinuities.append({"disconnected_at": disconnected_at,
+                                     "reconnected_at": time.time(),
+                                     "attempts": attempt,
+                                     "last_timestamps": last_timestamps,
+                                     "resume_timestamp": self._list["timestamp"]})
+        await self._async_resume_session()
+        return 1
+
+    def _last_received_timestamps(self):
+        """ Timestamps of the last data received for each variable before a connection drop, recorded in discontinuities. Overwritten by the Streamer.
+
+        Returns:
+            dict: Last timestamp by variable
+        """
+        return {}
+
+    async def _async_resume_session(self):
+        """ Re-issues the commands of the active session after a reconnection. Overwritten by the Streamer and the Logger.
+        """
+        pass
 
     # -- ssh methods --
 
-    def connect_ssh(self):
-        """ Connects to Bela via ssh to transfer log files.
+    def _get_ssh_session(self):
+        """Returns the ssh session shared by the file operations (see _SSHSession). The session connects on first use and stays open until disconnect_ssh() or cleanup() is called.
+
+        Returns:
+            _SSHSession: SSH session
         """
+        if self._ssh_session is None:
+            self._ssh_session = _SSHSession(self.ip)
+        return self._ssh_session
 
-        if self.sftp_client is not None:
-            self.disconnect_ssh()
+    def _get_ssh_executor(self):
+        if self._ssh_executor is None:
+            self._ssh_executor = ThreadPoolExecutor(
+                max_workers=self.ssh_max_workers, thread_name_prefix="pybela-ssh")
+        return self._ssh_executor
 
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    async def _async_run_ssh(self, func, *args, timeout=None, channel=None):
+        """ Runs a blocking paramiko call in the ssh executor, so that the event loop keeps receiving data while it waits for Bela.
 
-        # Workaround for no authentication:
-        # https://github.com/paramiko/paramiko/issues/890#issuecomment-906893725
+        Args:
+            func (callable): Blocking function
+            *args: Arguments of func
+            timeout (float, optional): Seconds before the call is aborted, or math.inf to wait until it finishes. Defaults to None (ssh_timeout).
+            channel (paramiko.SFTPClient, optional): Channel used by the call. It is closed if the call times out or is cancelled, so that the call running in the executor thread is aborted too. Defaults to None.
+
+        Returns:
+            Result of func
+        """
+        future = self.loop.run_in_executor(
+            self._get_ssh_executor(), functools.partial(func, *args))
         try:
-            self.ssh_client.connect(
-                self.ip, port=22, username="root", password=None)
-        except paramiko.SSHException as e:
-            self.ssh_client.get_transport().auth_none("root")
-        except Exception as e:
-            _print_error(
-                f"Error while connecting to Bela via ssh: {e}")
-            return
+            return await asyncio.wait_for(future, timeout=self.ssh_timeout if timeout is None else timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if channel is not None:
+                channel.close()
+            raise
+
+    @contextlib.asynccontextmanager
+    async def _async_sftp(self):
+        """ Async version of _SSHSession.sftp(). Opening the channel (and connecting, if needed) runs in the ssh executor. Usage:
+            async with self._async_sftp() as sftp:
+                await self._async_run_ssh(sftp.stat, remote_path, channel=sftp)
+        """
+        session = self._get_ssh_session()
+        channel = await self._async_run_ssh(session.open_channel)
+        try:
+            yield channel
+        finally:
+            await self._async_run_ssh(session.release_channel, channel)
+
+    def connect_ssh(self):
+        """ Connects to Bela via ssh to transfer log files. The file operations connect on demand, so calling this is only needed to use ssh_client and sftp_client directly.
+        """
+        if self.sftp_client is not None:
+            self._get_ssh_session().release_channel(self.sftp_client)
+            self.sftp_client = None
 
         try:
-            self.sftp_client = self.ssh_client.open_sftp()
-            # _print_ok("SSH connection and SFTP client established successfully.")
+            self.sftp_client = self._get_ssh_session().open_channel()
+            self.ssh_client = self._ssh_session.client
         except Exception as e:
             _print_error(
-                f"Error while opening SFTP client: {e}")
-            self.disconnect_ssh()
+                f"Error while connecting to Bela via ssh: {e}")
 
     def disconnect_ssh(self):
-        """ Disconnects from Bela via ssh.
+        """ Disconnects from Bela via ssh, closing the ssh session and its SFTP channels.
         """
-        if self.sftp_client:
-            self.sftp_client.close()
+        if self._ssh_session is not None:
+            self._ssh_session.close()
+        self.sftp_client = None
+        self.ssh_client = None
 
     # -- cleanups -- #
 
@@ -317,19 +670,27 @@ class Watcher:
     async def _async_cleanup(self):
         """Cleans up tasks
         """
-        tasks = [self._ctrl_listener_task,
+        self._closing = True
+        tasks = [self._reconnect_task,
+                 self._ctrl_listener_task,
                  self._data_listener_task,
                  self._process_received_data_msg_task,
                  self._send_data_msg_task,
-                 self._send_ctrl_msg_task
+                 self._send_ctrl_msg_task,
+                 self._loop_lag_task
                  ]
         await self._async_cancel_tasks(tasks)
         await self._async_disconnect()
+        self.disconnect_ssh()
+        if self._ssh_executor is not None:
+            # disconnect_ssh() closes the channels, which aborts the calls still running in the executor
+            self._ssh_executor.shutdown(wait=False)
+            self._ssh_executor = None
 
     def cleanup(self):
         """Cleans up tasks. Synchronous wrapper for _async_cleanup
         """
-        self.loop.run_until_complete(self._async_cleanup())
+        self._run(self._async_cleanup())
 
     # --- message sending methods --- #
 
@@ -342,13 +703,59 @@ class Watcher:
             self._to_send_data_msg_queue.task_done()
 
     async def _send_ctrl_msg_worker(self):
-        """ Send control message to websocket. Runs as long as websocket is open.
+        """ Send control message to websocket. Runs as long as websocket is open. The messages queued when the worker wakes up (up to ctrl_msg_max_batch) are coalesced into as few frames as possible (see _coalesce_ctrl_msgs). If ctrl_msg_max_latency is set, the worker also waits for the messages that follow, and sends the frame as soon as no message arrives for ctrl_msg_idle_time seconds, ctrl_msg_max_batch messages are collected or ctrl_msg_max_latency seconds have passed since the first one.
         """
         while self.ws_ctrl is not None and self.ws_ctrl.state == 1:
-            msg = await self._to_send_ctrl_msg_queue.get()
-            msg = json.dumps(msg)
-            await self.ws_ctrl.send(msg)
-            self._to_send_ctrl_msg_queue.task_done()
+            msgs = [await self._to_send_ctrl_msg_queue.get()]
+            self._get_queued_ctrl_msgs(msgs)
+            if self.ctrl_msg_max_latency > 0:
+                deadline = time.perf_counter() + self.ctrl_msg_max_latency
+                while len(msgs) < self.ctrl_msg_max_batch:
+                    timeout = min(self.ctrl_msg_idle_time,
+                                  deadline - time.perf_counter())
+                    if timeout <= 0:
+                        break
+                    n_msgs = len(msgs)
+                    await asyncio.sleep(timeout)
+                    self._get_queued_ctrl_msgs(msgs)
+                    if len(msgs) == n_msgs:  # the queue is idle
+                        break
+
+            for msg in self._coalesce_ctrl_msgs(msgs):
+                await self.ws_ctrl.send(json.dumps(msg))
+                self._sent_ctrl_frame_count += 1
+            self._sent_ctrl_msg_count += len(msgs)
+            for _ in msgs:
+                self._to_send_ctrl_msg_queue.task_done()
+
+    def _get_queued_ctrl_msgs(self, msgs):
+        """ Moves the control messages waiting in the queue to msgs, up to ctrl_msg_max_batch messages in total.
+
+        Args:
+            msgs (list of dicts): Control messages collected so far
+        """
+        while not self._to_send_ctrl_msg_queue.empty() and len(msgs) < self.ctrl_msg_max_batch:
+            msgs.append(self._to_send_ctrl_msg_queue.get_nowait())
+
+    @staticmethod
+    def _coalesce_ctrl_msgs(msgs):
+        """ Merges consecutive watcher messages ({"watcher": [...]}) into a single message with all their commands, in order. Every command is kept (e.g. all the values sent with consecutive "set" commands reach Bela). Other messages (e.g. events) are sent as they are, and split the batch so that the order is preserved.
+
+        Args:
+            msgs (list of dicts): Control messages in the order they were queued
+
+        Returns:
+            list of dicts: Coalesced control messages
+        """
+        coalesced = []
+        for msg in msgs:
+            if not (isinstance(msg, dict) and list(msg.keys()) == ["watcher"] and isinstance(msg["watcher"], list)):
+                coalesced.append(msg)
+                continue
+            if len(coalesced) == 0 or not (isinstance(coalesced[-1], dict) and list(coalesced[-1].keys()) == ["watcher"]):
+                coalesced.append({"watcher": []})
+            coalesced[-1]["watcher"].extend(msg["watcher"])
+        return coalesced
 
     async def _async_send_msg(self, ws_address, msg):
         """Send message to websocket
@@ -374,7 +781,7 @@ class Watcher:
             ws_address (str): Websocket address
             msg (str): Message to send
         """
-        return self.loop.create_task(self._async_send_msg(ws_address, msg))
+        return self._create_task(self._async_send_msg(ws_address, msg))
 
     async def _async_send_ctrl_msg(self, msg):
         """Send control message. Async version of send_ctrl_msg.
@@ -382,6 +789,7 @@ class Watcher:
         Args:
             msg (str): Message to send to the Bela watcher. Example: {"watcher": [{"cmd": "list"}]}
         """
+        self._invalidate_list_cache(msg)
         await self._async_send_msg(self.ws_ctrl_add, msg)
 
     def send_ctrl_msg(self, msg):
@@ -390,26 +798,83 @@ class Watcher:
         Args:
             msg (str): Message to send to the Bela watcher. Example: {"watcher": [{"cmd": "list"}]}
         """
+        self._invalidate_list_cache(msg)
         self._send_msg(self.ws_ctrl_add, msg)
 
     ##  -- list -- ##
 
-    async def _async_list(self):
-        """ Asks the watcher for the list of variables and their properties and returns it.
+    async def _async_list(self, max_age=None):
+        """ Asks the watcher for the list of variables and their properties and returns it. Concurrent calls are coalesced into a single list request, and a snapshot received less than max_age seconds ago is returned without asking the watcher again (unless a command that changes the watcher state has been sent since).
+
+        Args:
+            max_age (float, optional): Maximum age in seconds of a cached snapshot. 0 always waits for a response to a request sent after the last state change. Defaults to None (list_max_age).
 
         Returns:
             dict: Dictionary with the list of variables and their properties
         """
-        self.send_ctrl_msg({"watcher": [{"cmd": "list"}]})
-        # Wait for the list response to be available
-        list_res = await self._list_response_queue.get()
-        self._list_response_queue.task_done()
-        return list_res
-
-    def list(self):
+        max_age = self.list_max_age if max_age is None else max_age
+        cache = self._list_cache
+        if cache is not None and max_age > 0 and cache["generation"] == self._list_generation \
+                and time.monotonic() - cache["time"] <= max_age:
+            return cache["response"]
+
+        # join the request in flight if it was sent after the last state change, otherwise send a new one
+        request = self._list_in_flight
+        if request is None or request["generation"] != self._list_generation:
+            request = {"generation": self._list_generation,
+                       "future": self.loop.create_future()}
+            self._list_in_flight = request
+            self._list_pending.append(request)
+            # sent the same way as send_ctrl_msg so that it is not sent before the commands issued earlier
+            self._send_msg(self.ws_ctrl_add, {"watcher": [{"cmd": "list"}]})
+        # shield so that a cancelled caller doesn't cancel the response for the other callers
+        return await asyncio.shield(request["future"])
+
+    def list(self, max_age=0):
         """ Sync wrapper for _async_list
+
+        Args:
+            max_age (float, optional): Maximum age in seconds of a cached snapshot. Defaults to 0 (ask the watcher).
         """
-        return self.loop.run_until_complete(self._async_list())
+        return self._run(self._async_list(max_age))
+
+    def _process_list_response(self, response):
+        """ Routes a list response to the oldest request awaiting it (the watcher answers the requests of a connection in order) and caches it.
+
+        Args:
+            response (dict): List response
+        """
+        request = self._list_pending.popleft() if len(
+            self._list_pending) > 0 else None
+        generation = request["generation"] if request is not None else self._list_generation
+        if generation == self._list_generation:
+            self._list_cache = {"generation": generation,
+                                "time": time.monotonic(), "response": response}
+        if request is not None:
+            if self._list_in_flight is request:
+                self._list_in_flight = None
+            if not request["future"].done():
+                request["future"].set_result(response)
+
+    def _invalidate_list_cache(self, msg):
+        """ Invalidates the cached list response if msg is a command that changes the watcher state (anything but a list command).
+
+        Args:
+            msg (dict): Control message
+        """
+        cmds = msg.get("watcher", []) if isinstance(msg, dict) else []
+        if any(cmd.get("cmd") != "list" for cmd in cmds):
+            self._list_generation += 1
+
+    def _cancel_list_requests(self):
+        """ Cancels the list requests awaiting a response (e.g. when the connection is closed)
+        """
+        while len(self._list_pending) > 0:
+            request = self._list_pending.popleft()
+            if not request["future"].done():
+                request["future"].cancel()
+        self._list_in_flight = None
+        self._list_cache = None
 
     # -- listener methods -- #
 
@@ -426,13 +891,21 @@ class Watcher:
                 if self._printall_responses:
                     print(msg)
                 if ws_address == self.ws_data_add:
-                    self._received_data_msg_queue.put_nowait(msg)
+                    self._received_data_msg_count += 1
+                    self._received_data_bytes_count += len(msg)
+                    # headers and buffers are paired before queueing, so that the queue policy drops whole buffers. If the policy is "block", a full queue stops the listener from reading the websocket
+                    channel = self._get_data_framer().feed(msg)
+                    if channel is not None:
+                        var_counts = self._received_var_counts.setdefault(
+                            channel["name"], [0, 0])
+                        var_counts[0] += 1
+                        var_counts[1] += len(msg)
+                        await self._received_data_msg_queue.put((channel, msg), key=channel["name"])
                 elif ws_address == self.ws_ctrl_add:
                     _msg = json.loads(msg)
                     # response to list cmd
                     if "watcher" in _msg.keys() and "sampleRate" in _msg["watcher"].keys():
-                        self._list_response_queue.put_nowait(
-                            _msg["watcher"])
+                        self._process_list_response(_msg["watcher"])
                 else:
                     print(msg)
 
@@ -440,6 +913,9 @@ class Watcher:
             if ws.state == 1:  # otherwise websocket was closed intentionally
                 _handle_connection_exception(
                     ws_address, e, "receiving message")
+        finally:
+            if ws is not None and ws.state != 1:
+                self._on_websocket_closed()
 
     # -- data processing methods -- #
 
@@ -451,18 +927,130 @@ class Watcher:
         """
 
         while self.ws_data is not None and self.ws_data.state == 1:
-            msg = await self._received_data_msg_queue.get()
-            await self._process_data_msg(msg)
-            self._received_data_msg_queue.task_done()
+            channel, msg = await self._received_data_msg_queue.get()
+            start = time.perf_counter()
+            await self._process_data_msg(channel, msg)
+            self._process_latency.record(time.perf_counter() - start)
 
-    async def _process_data_msg(self, msg):
+    async def _process_data_msg(self, channel, msg):
         """Process data message. This method is overwritten by the streamer.
 
         Args:
+            channel (dict): Channel of the buffer (see _DataFramer)
             msg (str): Bytestring with data
         """
         pass
 
+    # -- stats -- #
+
+    def _reset_stats_counters(self):
+        self._stats_start_time = time.perf_counter()
+        self._stats_start_counts = (self._received_data_msg_count,
+                                    self._received_data_bytes_count)
+        self._received_var_counts = {}
+        for histogram in [*self._latency_histograms.values(), self._loop_lag]:
+            histogram.clear()
+
+    def reset_stats(self):
+        """ Restarts the window of the rates and the latency histograms reported by stats(). Drop and error counts are not reset.
+        """
+        self._reset_stats_counters()
+
+    async def _loop_lag_worker(self):
+        """ Measures the event loop lag: how late a timer scheduled every loop_lag_interval seconds resumes, which includes the time spent by the callbacks that block the loop in the meantime.
+        """
+        while self.ws_data is not None and self.ws_data.state == 1:
+            interval = self.loop_lag_interval
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self._loop_lag.record(
+                max(time.perf_counter() - start - interval, 0))
+
+    def stats(self):
+        """ Returns metrics of the data pipeline since the connection (or the last reset_stats()). Collecting them costs a few counter increments and two clock reads per buffer, so it is always on.
+
+        Returns:
+            dict: Stats, with keys:
+                - "elapsed": length of the window in seconds
+                - "messages", "bytes", "messages_per_second", "bytes_per_second": data messages (headers and buffers) received
+                - "vars": for each variable, the buffers ("messages") and bytes received, and their rates
+                - "queues": number of items waiting in each queue of the pipeline
+                - "latency": summary of the time spent processing each buffer ("process") and, in the Streamer, in the callbacks ("callback"), see _LatencyHistogram.summary()
+                - "loop_lag": summary of the event loop lag
+                - "dropped": buffers dropped by the pipeline queues (see dropped_buffers)
+                - "errors": framing errors (see data_framing_errors) and, in the Streamer, parse and callback errors
+                - "ctrl": control messages and frames sent (see ctrl_msg_max_latency)
+        """
+        elapsed = time.perf_counter() - self._stats_start_time
+
+        def rate(count):
+            return count / elapsed if elapsed > 0 else None
+
+        messages = self._received_data_msg_count - self._stats_start_counts[0]
+        _bytes = self._received_data_bytes_count - self._stats_start_counts[1]
+        return {"elapsed": elapsed,
+                "messages": messages,
+                "bytes": _bytes,
+                "messages_per_second": rate(messages),
+                "bytes_per_second": rate(_bytes),
+                "vars": {var: {"messages": counts[0], "bytes": counts[1],
+                               "messages_per_second": rate(counts[0]), "bytes_per_second": rate(counts[1])}
+                         for var, counts in self._received_var_counts.items()},
+                "queues": {**{name: queue.qsize() for name, queue in self._ingest_queues.items()},
+                           "send_data": self._to_send_data_msg_queue.qsize(),
+                           "send_ctrl": self._to_send_ctrl_msg_queue.qsize()},
+                "latency": {name: histogram.summary() for name, histogram in self._latency_histograms.items()},
+                "loop_lag": self._loop_lag.summary(),
+                "dropped": self.dropped_buffers,
+                "errors": self._error_counts,
+                "ctrl": {"messages_sent": self._sent_ctrl_msg_count,
+                         "frames_sent": self._sent_ctrl_frame_count}}
+
+    @property
+    def _latency_histograms(self):
+        return {"process": self._process_latency}
+
+    @property
+    def _error_counts(self):
+        return {"framing": self.data_framing_errors}
+
+    # -- ingest queues -- #
+
+    @property
+    def _ingest_queues(self):
+        """ Queues of the data pipeline, by name (see set_ingest_queue) """
+        return {"received": self._received_data_msg_queue}
+
+    def set_ingest_queue(self, queue="received", max_size=0, policy="block", priorities=None):
+        """ Bounds a queue of the data pipeline, so that memory doesn't grow without limit if the processing of the buffers (or the callbacks) falls behind. The dropped buffers are counted in dropped_buffers.
+
+        Args:
+            queue (str, optional): Queue to bound: "received" (buffers received from Bela waiting to be parsed) or, in the Streamer and Monitor, "processed" (parsed buffers waiting for the on_buffer/on_block callbacks). Defaults to "received".
+            max_size (int, optional): Maximum number of buffers in the queue. If 0, the queue is unbounded. Defaults to 0.
+            policy (str, optional): What happens when the queue is full: "block" (stop reading until there is space, which applies backpressure to Bela through the websocket), "drop-oldest", "drop-newest" or "priority" (the buffers of the variables with the lowest priority are dropped first, oldest first). Defaults to "block".
+            priorities (dict, optional): Priority of each variable (by name) for the "priority" policy, higher is kept longer. Variables not in the dict have priority 0. Defaults to None.
+        """
+        if queue not in self._ingest_queues:
+            raise ValueError(
+                f"Unknown queue {queue}. Queues: {list(self._ingest_queues)}")
+        if priorities is not None:
+            unknown = [var for var in priorities if var not in [
+                v["name"] for v in self.watcher_vars]]
+            if len(unknown) > 0:
+                _print_warning(
+                    f"Variables {unknown} are not in the watcher, their priorities will be ignored.")
+        self._ingest_queues[queue].configure(max_size, policy, priorities)
+
+    @property
+    def dropped_buffers(self):
+        """Returns the number of buffers dropped by each queue of the data pipeline (see set_ingest_queue), in total and by variable.
+
+        Returns:
+            dict: For each queue, a dict with the total ("total") and the number of buffers dropped for each variable ("vars")
+        """
+        return {name: {"total": sum(queue.dropped.values()), "vars": dict(queue.dropped)}
+                for name, queue in self._ingest_queues.items()}
+
     def _process_ctrl_msg(self, msg):
         """Process control message
 
@@ -473,10 +1061,10 @@ class Watcher:
 
         # response to list cmd
         if "watcher" in _msg.keys() and "sampleRate" in _msg["watcher"].keys():
-            self._list_response_queue.put_nowait(_msg["watcher"])
+            self._process_list_response(_msg["watcher"])
 
     def _parse_binary_data(self, binary_data, timestamp_mode, _type):
-        """Binary data parser. This method is used both by the streamer and the logger to parse the binary data buffers.
+        """Binary data parser. This method is used both by the streamer and the logger to parse the binary data buffers. The buffer is decoded with a precomputed structured dtype (see _get_buffer_dtype), so the returned data and rel_timestamps are read-only numpy views on binary_data (no copies are made).
 
         Args:
             binary_data (bytestring): String of bytes to parse
@@ -486,56 +1074,74 @@ class Watcher:
         Returns:
             dict: Dictionary with parsed buffer and timestamps
         """
-
-        _type = 'i' if _type == 'j' else _type
-
-        data_length = self.get_data_length(_type, timestamp_mode)
         # the format is the same for both logger and streamer so the parsing method is shared
 
         parsed_buffer = None
-        if self._mode == "STREAM" or self._mode == "LOG":
-            # sparse mode
-            if timestamp_mode == "sparse":
-                # ensure that the buffer is the correct size (remove padding)
-
-                binary_data = binary_data[:struct.calcsize("Q") + data_length*struct.calcsize(
-                    _type)+data_length*struct.calcsize("I")]
-
-                try:
-                    ref_timestamp, *_buffer = struct.unpack('Q' + f"{_type}" * data_length
-                                                            + 'I'*data_length, binary_data)
-                except struct.error as e:
-                    _print_error(
-                        f"Error parsing buffer: {e}. Received buffer of length: {len(binary_data)}")
-                    return None
-                data = _buffer[:data_length]
-                # remove padding
-                rel_timestamps = _buffer[data_length:][:data_length]
-
-                parsed_buffer = {"ref_timestamp": ref_timestamp,
-                                 "data": data, "rel_timestamps": rel_timestamps}
+        try:
+            if self._mode == "STREAM" or self._mode == "LOG":
+                buffer_dtype = self._get_buffer_dtype(_type, timestamp_mode)
+
+                if timestamp_mode == "dense" and len(binary_data) != buffer_dtype.itemsize:
+                    # buffer of non-standard length, the data spans the whole message
+                    ref_timestamp, = struct.unpack_from("<Q", binary_data)
+                    data_dtype = np.dtype(_numpy_type_map[_type])
+                    data = np.frombuffer(binary_data, dtype=data_dtype, count=(
+                        len(binary_data) - 8) // data_dtype.itemsize, offset=8)
+                    return {"ref_timestamp": ref_timestamp, "data": data}
+
+                # trailing bytes (padding) are ignored
+                _buffer = np.frombuffer(
+                    binary_data, dtype=buffer_dtype, count=1)
+
+                parsed_buffer = {"ref_timestamp": int(_buffer["ref_timestamp"][0]),
+                                 "data": _buffer["data"][0]}
+                if timestamp_mode == "sparse":
+                    parsed_buffer["rel_timestamps"] = _buffer["rel_timestamps"][0]
+
+            elif self._mode == "MONITOR":
+                # size of the buffer is not fixed as in the other modes, only the first value is read
+                ref_timestamp, = struct.unpack_from("<Q", binary_data)
+                value = np.frombuffer(
+                    binary_data, dtype=_numpy_type_map[_type], count=1, offset=8)[0]
 
-            elif timestamp_mode == "dense":
-                # ensure that the buffer is the correct size
-                # binary_data = binary_data[:struct.calcsize(
-                #     'Q')+data_length*struct.calcsize(_type)]
+                parsed_buffer = {
+                    "timestamp": ref_timestamp, "value": value.item()}
 
-                ref_timestamp, * \
-                    data = struct.unpack(
-                        'Q' + f"{_type}"*int((len(binary_data) - struct.calcsize('Q'))/struct.calcsize(_type)), binary_data)
+        except (ValueError, struct.error) as e:
+            _print_error(
+                f"Error parsing buffer: {e}. Received buffer of length: {len(binary_data)}")
+            return None
 
-                parsed_buffer = {
-                    "ref_timestamp": ref_timestamp, "data": data}
+        return parsed_buffer
 
-        elif self._mode == "MONITOR":
-            ref_timestamp, *_buffer = struct.unpack('Q' + f"{_type}" * int(
-                (len(binary_data) - struct.calcsize("Q")) // struct.calcsize(_type)), binary_data)
-            # size of the buffer is not fixed as in the other modes
+    @staticmethod
+    def _get_buffer_dtype(var_type, timestamp_mode, padded=False):
+        """Returns the numpy structured dtype of a buffer: ref_timestamp (uint64), data[data_length] and, in sparse mode, rel_timestamps[data_length] (uint32). The dtypes are computed once per (type, timestamp_mode) and cached.
 
-            parsed_buffer = {
-                "timestamp": ref_timestamp, "value": _buffer[0]}
+        Args:
+            var_type (str): Variable type ("f", "j", "i", "c", "d")
+            timestamp_mode (str): Timestamp mode ("sparse" or "dense")
+            padded (bool, optional): If True, the dtype includes the padding added to the buffers stored in log files, so that its itemsize is equal to get_buffer_size(). Defaults to False.
 
-        return parsed_buffer
+        Returns:
+            np.dtype: Structured dtype of the buffer
+        """
+        key = (var_type, timestamp_mode, padded)
+        if key not in Watcher._buffer_dtypes:
+            if var_type not in _numpy_type_map or timestamp_mode not in ["dense", "sparse"]:
+                raise ValueError(
+                    f"Unsupported type or timestamp mode: {var_type}, {timestamp_mode}")
+            data_length = Watcher.get_data_length(var_type, timestamp_mode)
+            fields = {"names": ["ref_timestamp", "data"],
+                      "formats": ["<u8", (_numpy_type_map[var_type], (data_length,))]}
+            if timestamp_mode == "sparse":
+                fields["names"].append("rel_timestamps")
+                fields["formats"].append(("<u4", (data_length,)))
+            if padded:
+                fields["itemsize"] = Watcher.get_buffer_size(
+                    var_type, timestamp_mode)
+            Watcher._buffer_dtypes[key] = np.dtype(fields)
+        return Watcher._buffer_dtypes[key]
 
     # --- utils --- #
 
@@ -547,15 +1153,15 @@ class Watcher:
         if time_in_seconds < 0:
             raise ValueError("Time in seconds should be greater than 0.")
         elif time_in_seconds > 0:
-            self.loop.run_until_complete(asyncio.sleep(time_in_seconds))
+            self._run(asyncio.sleep(time_in_seconds))
         else:
             async def wait_forever():
                 await asyncio.Future()
-            self.loop.run_until_complete(wait_forever())
+            self._run(wait_forever())
 
     async def _async_get_latest_timestamp(self):
         """Get latest timestamp. Async version of get_latest_timestamp."""
-        _list = await self._async_list()
+        _list = await self._async_list(max_age=0)
         return _list["timestamp"]
 
     def get_latest_timestamp(self):
@@ -645,7 +1251,8 @@ class Watcher:
         return next(
             (v[prop] for v in self.watcher_vars if v['name'] == var_name), None)
 
-    def get_data_byte_size(self, var_type):
+    @staticmethod
+    def get_data_byte_size(var_type):
         """Returns the byte size of the data type
 
         Args:
@@ -663,7 +1270,8 @@ class Watcher:
         }
         return data_byte_size_map.get(var_type, 0)
 
-    def get_data_length(self, var_type, timestamp_mode):
+    @staticmethod
+    def get_data_length(var_type, timestamp_mode):
         """Data length in the buffer
 
         Args:
@@ -696,7 +1304,8 @@ class Watcher:
             # return error message
             return 0
 
-    def get_buffer_size(self, var_type, timestamp_mode):
+    @staticmethod
+    def get_buffer_size(var_type, timestamp_mode):
         """Returns the buffer size in bytes for buffers stored in a log file. This is the size of the buffer that is sent over websockets.
 
         Args:
@@ -707,14 +1316,15 @@ class Watcher:
             int: Buffer size in bytes
         """
         # for logging
-        data_length = self.get_data_length(var_type, timestamp_mode)
+        data_length = Watcher.get_data_length(var_type, timestamp_mode)
+        _struct_type = 'I' if var_type == 'j' else var_type  # struct does not understand 'j'
         if timestamp_mode == "sparse":
-            if self.get_data_byte_size(var_type) == 4:
-                return struct.calcsize('Q')+data_length*struct.calcsize(var_type)+data_length*struct.calcsize("I")
-            elif self.get_data_byte_size(var_type) == 8:
-                return struct.calcsize('Q')+data_length*struct.calcsize(var_type)+data_length*struct.calcsize("I")+4
+            if Watcher.get_data_byte_size(var_type) == 4:
+                return struct.calcsize('Q')+data_length*struct.calcsize(_struct_type)+data_length*struct.calcsize("I")
+            elif Watcher.get_data_byte_size(var_type) == 8:
+                return struct.calcsize('Q')+data_length*struct.calcsize(_struct_type)+data_length*struct.calcsize("I")+4
         elif timestamp_mode == "dense":
-            return struct.calcsize('Q')+data_length*struct.calcsize(var_type)
+            return struct.calcsize('Q')+data_length*struct.calcsize(_struct_type)
         else:
             # return error message
             return 0
@@ -727,11 +1337,8 @@ class Watcher:
             local_path (str): Path to the local file (where the file is copied to)
             verbose (bool, optional): Show info messages. Defaults to True.
         """
-        self.connect_ssh()
-        local_path = self.loop.run_until_complete(self._async_copy_file_from_bela(
+        return self._run(self._async_copy_file_from_bela(
             remote_path, local_path, verbose))
-        self.disconnect_ssh()
-        return local_path
 
     async def _async_copy_file_from_bela(self, remote_path, local_path, verbose=False):
         """ Copies a file from the remote path in Bela to the local path. This can be used any time to copy files from Bela to the host. 
@@ -746,12 +1353,11 @@ class Watcher:
                 _local_path = self._generate_local_filename(local_path)
             else:
                 _local_path = local_path
-            transferred_event = asyncio.Event()
-            def callback(transferred, to_transfer): return transferred_event.set(
-            ) if transferred == to_transfer else None
-            self.sftp_client.get(remote_path, _local_path, callback=callback)
-            file_size = self.sftp_client.stat(remote_path).st_size
-            await asyncio.wait_for(transferred_event.wait(), timeout=file_size*1e-4)
+            async with self._async_sftp() as sftp:
+                file_size = (await self._async_run_ssh(sftp.stat, remote_path, channel=sftp)).st_size
+                # allow 0.1 ms per byte on top of ssh_timeout
+                timeout = None if self.ssh_timeout is None else self.ssh_timeout + file_size*1e-4
+                await self._async_run_ssh(sftp.get, remote_path, _local_path, timeout=timeout, channel=sftp)
             if verbose:
                 _print_ok(
                     f"\rTransferring {remote_path}-->{_local_path}... Done.")
@@ -786,3 +1392,196 @@ def _handle_connection_exception(ws_address, exception, action):
                 f"Error {exception.errno} while connecting to {ws_address}.  {bela_msg}")
     else:
         _print_error(f"Error while {action}: {exception}.  {bela_msg}")
+
+
+class _DataFramer:
+    def __init__(self, watcher_vars):
+        """ Decodes the framing of the messages received in a data websocket. Bela sends each buffer as two messages: a header with the channel (index of the variable in the watcher list) and type of the buffer (e.g. b"0/d"), and the buffer itself. The framer keeps the pending header of its connection, so that several connections don't share framing state. Headers are looked up in a dispatch table with the metadata of each channel, which is computed once from watcher_vars.
+
+            Args:
+                watcher_vars (list of dicts): Variables in the watcher and their properties (see Watcher.watcher_vars)
+        """
+        self.watcher_vars = watcher_vars
+        self._channels = [{"channel": channel,
+                           "name": var["name"],
+                           "type": var["type"],
+                           "timestamp_mode": var["timestamp_mode"],
+                           "var": var}
+                          for channel, var in enumerate(watcher_vars)]
+        # headers sent by Bela, any other header is parsed once with a regex and added to the table
+        self._dispatch = {f"{channel}/{var['type']}".encode(): self._channels[channel]
+                          for channel, var in enumerate(watcher_vars)}
+        self._pending = None
+        self._has_pending = False
+
+        # framing errors
+        self.orphan_headers = 0  # headers not followed by a buffer
+        self.orphan_buffers = 0  # buffers not preceded by a header
+        self.invalid_headers = 0  # unknown channel or type mismatch
+
+    @staticmethod
+    def is_header(msg):
+        # channel can be either 1 or 2 bytes long, buffers are at least 8 bytes long (ref_timestamp)
+        return len(msg) in [3, 4]
+
+    def feed(self, msg):
+        """ Processes a message received in the data websocket.
+
+            Args:
+                msg (bytes): Message
+
+            Returns:
+                dict: Metadata of the channel of the buffer (channel, name, type, timestamp_mode and var) if msg is a buffer preceded by a valid header, None otherwise
+        """
+        if self.is_header(msg):
+            if self._has_pending:
+                self.orphan_headers += 1
+            self._pending, self._has_pending = self._lookup(bytes(msg)), True
+            return None
+
+        if not self._has_pending:
+            self.orphan_buffers += 1
+            return None
+        # the channel is None if the header was invalid
+        channel, self._pending, self._has_pending = self._pending, None, False
+        return channel
+
+    def _lookup(self, header):
+        channel = self._dispatch.get(header)
+        if channel is None:
+            match = re.search(r'(\d+).*?(\w)', header.decode(errors="replace"))
+            if match is not None and int(match.group(1)) < len(self._channels) and match.group(2) == self._channels[int(match.group(1))]["type"]:
+                channel = self._dispatch[header] = self._channels[int(
+                    match.group(1))]
+            else:
+                self.invalid_headers += 1
+                _print_warning(
+                    f"Received invalid buffer header {header}. The buffer will be discarded.")
+        return channel
+
+    @property
+    def errors(self):
+        """ Number of framing errors in the connection
+
+            Returns:
+                dict: Number of orphan headers, orphan buffers and invalid headers
+        """
+        return {"orphan_headers": self.orphan_headers,
+                "orphan_buffers": self.orphan_buffers,
+                "invalid_headers": self.invalid_headers}
+
+
+class _SSHSession:
+    def __init__(self, ip, port=22, username="root", keepalive=15, max_idle_channels=4, compress=False):
+        """ SSH connection to Bela shared by the file operations of a Watcher. The transport is opened on first use, kept alive with keepalive packets and reopened if it drops. SFTP channels are handed out to concurrent operations (see sftp()) and reused afterwards, so that each operation doesn't pay for a new ssh handshake.
+
+            Args:
+                ip (str): Bela IP
+                port (int, optional): SSH port. Defaults to 22.
+                username (str, optional): SSH user. Defaults to "root".
+                keepalive (int, optional): Seconds between keepalive packets. Defaults to 15.
+                max_idle_channels (int, optional): Maximum number of SFTP channels kept open for reuse. Defaults to 4.
+                compress (bool, optional): Enable ssh transport compression. Defaults to False.
+        """
+        self.ip = ip
+        self.port = port
+        self.username = username
+        self.keepalive = keepalive
+        self.max_idle_channels = max_idle_channels
+        self.compress = compress
+
+        self.client = None
+        self._idle_channels = []
+        self._lock = threading.Lock()  # the channels can be requested from several threads
+        self.handshakes = 0  # number of ssh connections opened
+
+    @property
+    def is_active(self):
+        transport = self.client.get_transport() if self.client is not None else None
+        return transport is not None and transport.is_active()
+
+    def _connect(self):
+        # paramiko is imported on the first ssh connection, since it is slow to import
+        import paramiko
+
+        self._close()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        # Workaround for no authentication:
+        # https://github.com/paramiko/paramiko/issues/890#issuecomment-906893725
+        try:
+            client.connect(self.ip, port=self.port,
+                           username=self.username, password=None, compress=self.compress)
+        except paramiko.SSHException:
+            client.get_transport().auth_none(self.username)
+        client.get_transport().set_keepalive(self.keepalive)
+        self.client = client
+        self.handshakes += 1
+
+    def open_channel(self):
+        """ Returns an idle SFTP channel, or opens a new one (reconnecting first if the transport has dropped). The channel should be returned with release_channel().
+
+            Returns:
+                paramiko.SFTPClient: SFTP channel
+        """
+        with self._lock:
+            while len(self._idle_channels) > 0:
+                channel = self._idle_channels.pop()
+                if self.is_active and not channel.get_channel().closed:
+                    return channel
+                channel.close()
+            if not self.is_active:
+                self._connect()
+            return self.client.open_sftp()
+
+    def release_channel(self, channel):
+        """ Returns a channel to the session. It is kept for reuse unless it is broken or there are enough idle channels.
+
+            Args:
+                channel (paramiko.SFTPClient): SFTP channel
+        """
+        with self._lock:
+            if self.is_active and not channel.get_channel().closed and len(self._idle_channels) < self.max_idle_channels:
+                self._idle_channels.append(channel)
+            else:
+                channel.close()
+
+    def exec_command(self, command):
+        """ Runs a command in Bela in a new channel of the session (reconnecting first if the transport has dropped).
+
+            Args:
+                command (str): Command
+
+            Returns:
+                tuple: stdin, stdout and stderr of the command (paramiko.ChannelFile)
+        """
+        with self._lock:
+            if not self.is_active:
+                self._connect()
+            return self.client.exec_command(command)
+
+    @contextlib.contextmanager
+    def sftp(self):
+        """ Context manager that hands out an SFTP channel. Usage:
+            with session.sftp() as sftp:
+                sftp.stat(remote_path)
+        """
+        channel = self.open_channel()
+        try:
+            yield channel
+        finally:
+            self.release_channel(channel)
+
+    def _close(self):
+        for channel in self._idle_channels:
+            channel.close()
+        self._idle_channels = []
+        if self.client is not None:
+            self.client.close()  # closes the transport too
+            self.client = None
+
+    def close(self):
+        """ Closes the idle channels and the ssh connection """
+        with self._lock:
+            self._close()
@@ -4,4 +4,16 @@ from .Logger import Logger
 from .Monitor import Monitor
 from .Controller import Controller
 
-__all__ = ['Watcher', 'Streamer', 'Logger', 'Monitor', 'Controller']
+__all__ = ['Watcher', 'Streamer', 'Logger', 'Monitor', 'Controller', 'MockBela', 'SessionManager']
+
+# testing and session helpers, only imported when they are used
+_lazy_modules = {'MockBela': '.MockBela', 'SessionManager': '.SessionManager'}
+
+
+def __getattr__(name):
+    if name in _lazy_modules:
+        import importlib
+        value = getattr(importlib.import_module(_lazy_modules[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
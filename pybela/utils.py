@@ -1,3 +1,8 @@
+import asyncio
+import collections
+import numpy as np
+
+
 class _bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -24,3 +29,373 @@ def _print_warning(message):
 
 def _print_ok(message, end='\n', flush=False):
     print(_bcolors.OKGREEN + message + _bcolors.ENDC, end=end, flush=flush)
+
+
+class _RingBuffer:
+    def __init__(self, capacity, fields):
+        """ Fixed-capacity ring buffer backed by preallocated numpy arrays (one per field). Appending is O(1) and overwrites the oldest item once the buffer is full. Items whose values don't fit the shape of the fields (e.g. buffers of non-standard length) are stored separately as copies (see overflow()), so that they are not lost.
+
+            Args:
+                capacity (int): Maximum number of items stored in the buffer. If 0, appended items are discarded.
+                fields (dict): Dict of field name -> numpy dtype. Subarray dtypes (e.g. np.dtype(("<f4", (1024,)))) are stored as rows of shape (capacity, *subarray shape)
+        """
+        self._capacity = max(int(capacity), 0)
+        self._arrays = {name: np.zeros(self._capacity, dtype=np.dtype(dtype))
+                        for name, dtype in fields.items()}
+        self._itemsize = sum(np.dtype(dtype).itemsize
+                             for dtype in fields.values())
+        self._start = 0  # index of the oldest item
+        self._count = 0  # number of items stored
+        self._overflow = {}  # slot -> values of the items that don't fit the arrays
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def fields(self):
+        return list(self._arrays.keys())
+
+    @property
+    def itemsize(self):
+        """ Returns the size of an item (all fields) in bytes """
+        return self._itemsize
+
+    @property
+    def nbytes(self):
+        """ Returns the memory allocated by the buffer in bytes """
+        return sum(array.nbytes for array in self._arrays.values())
+
+    @property
+    def nbytes_used(self):
+        """ Returns the memory used by the stored items in bytes """
+        return self._count * self._itemsize
+
+    def __len__(self):
+        return self._count
+
+    def append(self, **values):
+        """ Appends an item to the buffer. Values are copied into the preallocated arrays.
+
+            Args:
+                **values: One value per field
+        """
+        if self._capacity == 0:
+            return
+        idx = (self._start + self._count) % self._capacity
+        try:
+            for name, value in values.items():
+                self._arrays[name][idx] = value
+            self._overflow.pop(idx, None)
+        except ValueError:  # the value doesn't fit the shape of the field
+            self._overflow[idx] = {name: np.array(value)
+                                   for name, value in values.items()}
+        if self._count < self._capacity:
+            self._count += 1
+        else:  # full, the oldest item has been overwritten
+            self._start = (self._start + 1) % self._capacity
+
+    def popleft(self):
+        """ Removes the oldest item from the buffer """
+        if self._count == 0:
+            raise IndexError("pop from an empty ring buffer")
+        self._overflow.pop(self._start, None)
+        self._start = (self._start + 1) % self._capacity
+        self._count -= 1
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+        self._overflow = {}
+
+    def overflow(self):
+        """ Returns the stored items that don't fit the shape of the fields, by position (0 is the oldest item). Their slots in the arrays returned by snapshot() hold stale values.
+
+            Returns:
+                dict: Position -> dict of field name -> value
+        """
+        return {(slot - self._start) % self._capacity: values for slot, values in self._overflow.items()}
+
+    def flat(self, name):
+        """ Returns the stored values of a field in insertion order, flattened into a new 1D array. Unlike snapshot(), items that don't fit the shape of the field are included.
+
+            Args:
+                name (str): Field name
+
+            Returns:
+                np.ndarray: 1D array
+        """
+        snapshot = self.snapshot(name, copy=True)
+        if len(self._overflow) == 0:
+            return snapshot.reshape(-1)
+        overflow = self.overflow()
+        return np.concatenate([np.asarray(overflow[idx][name], dtype=snapshot.dtype).reshape(-1) if idx in overflow else snapshot[idx].reshape(-1)
+                               for idx in range(len(snapshot))]) if len(snapshot) > 0 else snapshot.reshape(-1)
+
+    def snapshot(self, name, copy=False):
+        """ Returns the stored items of a field in insertion order (oldest first). If the items are contiguous in memory and copy is False, a read-only view is returned, which is only valid until the next item is appended (for internal use). Otherwise an independent array is returned.
+
+            Args:
+                name (str): Field name
+                copy (bool, optional): Return a copy of the items. Defaults to False.
+
+            Returns:
+                np.ndarray: Array of shape (len(self), *field shape)
+        """
+        array = self._arrays[name]
+        end = self._start + self._count
+        if end <= self._capacity:
+            snapshot = array[self._start:end].copy() if copy else array[self._start:end]
+        else:  # wrapped around
+            snapshot = np.concatenate(
+                (array[self._start:], array[:end - self._capacity]))
+        if not copy:
+            snapshot.flags.writeable = False
+        return snapshot
+
+
+class _IngestQueue:
+    policies = ["block", "drop-oldest", "drop-newest", "priority"]
+
+    def __init__(self, max_size=0, policy="block", priorities=None):
+        """ Asyncio queue with an optional bound and a policy applied when it is full. Items are retrieved in the order they were put, and the items dropped are counted by key (e.g. variable name).
+
+            Args:
+                max_size (int, optional): Maximum number of items in the queue. If 0, the queue is unbounded. Defaults to 0.
+                policy (str, optional): What happens when an item is put in a full queue: "block" (put() waits until there is space), "drop-oldest" (the oldest item is dropped), "drop-newest" (the new item is dropped) or "priority" (the oldest item with the lowest priority is dropped, or the new item if its priority is lower than all the queued ones). Defaults to "block".
+                priorities (dict, optional): Priority of each key for the "priority" policy (higher is kept longer). Keys not in the dict have priority 0. Defaults to None.
+        """
+        self._levels = {}  # priority -> deque of (sequence number, key, item)
+        self._sequence = 0
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.dropped = collections.Counter()  # dropped items by key
+        self.configure(max_size, policy, priorities)
+
+    def configure(self, max_size=0, policy="block", priorities=None):
+        """ Changes the bound and the policy of the queue. The items already queued are kept.
+
+            Args:
+                max_size (int, optional): See constructor. Defaults to 0.
+                policy (str, optional): See constructor. Defaults to "block".
+                priorities (dict, optional): See constructor. Defaults to None.
+        """
+        if policy not in self.policies:
+            raise ValueError(
+                f"Unknown queue policy {policy}. Policies: {self.policies}")
+        if max_size < 0:
+            raise ValueError("The maximum size of the queue should be 0 (unbounded) or positive.")
+        self.max_size = max_size
+        self.policy = policy
+        self.priorities = dict(priorities) if priorities is not None else {}
+        self._not_full.set()  # blocked producers check the new bound
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return self.max_size > 0 and self._size >= self.max_size
+
+    async def put(self, item, key=None):
+        """ Puts an item in the queue, applying the policy if the queue is full.
+
+            Args:
+                item: Item to put
+                key (optional): Key of the item, used for the priorities and the drop counters. Defaults to None.
+        """
+        while self.full() and self.policy == "block":
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put_nowait(item, key)
+
+    def put_nowait(self, item, key=None):
+        """ Puts an item in the queue without waiting. A full queue with the "block" policy raises asyncio.QueueFull.
+
+            Args:
+                item: Item to put
+                key (optional): See put(). Defaults to None.
+        """
+        priority = self.priorities.get(key, 0) if self.policy == "priority" else 0
+        while self.full():
+            if self.policy == "block":
+                raise asyncio.QueueFull
+            elif self.policy == "drop-newest" or (self.policy == "priority" and priority < min(self._levels)):
+                self.dropped[key] += 1
+                return
+            # drop-oldest, or the oldest item of the lowest priority
+            self._pop(min(self._levels) if self.policy == "priority" else None, count_as_dropped=True)
+
+        self._levels.setdefault(priority, collections.deque()).append(
+            (self._sequence, key, item))
+        self._sequence += 1
+        self._size += 1
+        self._not_empty.set()
+
+    async def get(self):
+        """ Removes and returns the oldest item in the queue, waiting until there is one.
+
+            Returns:
+                Item
+        """
+        while self.empty():
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def get_nowait(self):
+        """ Removes and returns the oldest item in the queue. An empty queue raises asyncio.QueueEmpty.
+
+            Returns:
+                Item
+        """
+        if self.empty():
+            raise asyncio.QueueEmpty
+        return self._pop()
+
+    def task_done(self):
+        # kept for compatibility with asyncio.Queue
+        pass
+
+    def clear(self):
+        """ Removes all the items in the queue (they are not counted as dropped) """
+        self._levels = {}
+        self._size = 0
+        self._not_full.set()
+
+    def _pop(self, priority=None, count_as_dropped=False):
+        """ Removes the oldest item of a priority level, or of the whole queue if priority is None """
+        if priority is None:
+            # with a single level (all policies but priority) this is O(1)
+            priority = min(self._levels, key=lambda level: self._levels[level][0][0])
+        _, key, item = self._levels[priority].popleft()
+        if len(self._levels[priority]) == 0:
+            del self._levels[priority]
+        self._size -= 1
+        self._not_full.set()
+        if count_as_dropped:
+            self.dropped[key] += 1
+        return item
+
+
+class _LatencyHistogram:
+    def __init__(self, n_bins=25):
+        """ Histogram of durations with power-of-two bins in microseconds (bin k counts the durations in [2^(k-1), 2^k) us), cheap enough to record every buffer.
+
+            Args:
+                n_bins (int, optional): Number of bins. Longer durations are counted in the last bin. Defaults to 25 (up to ~16 s).
+        """
+        self._counts = [0] * n_bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """ Records a duration
+
+            Args:
+                seconds (float): Duration in seconds
+        """
+        idx = min(int(seconds * 1e6).bit_length(), len(self._counts) - 1)
+        self._counts[idx] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """ Returns an upper bound of the q-th percentile (the upper edge of the bin where it falls)
+
+            Args:
+                q (float): Percentile (0-100)
+
+            Returns:
+                float: Upper bound in seconds, or None if nothing has been recorded
+        """
+        if self.count == 0:
+            return None
+        threshold = q / 100 * self.count
+        cumulative = 0
+        for idx, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= threshold and count > 0:
+                return min(2**idx * 1e-6, self.max)
+        return self.max
+
+    def summary(self):
+        """ Returns the count, mean, maximum and percentiles (upper bounds) of the recorded durations in seconds, and the non-empty bins (by upper edge in seconds)
+
+            Returns:
+                dict: Summary of the histogram
+        """
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count > 0 else None,
+                "max": self.max if self.count > 0 else None,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "bins": {2**idx * 1e-6: count for idx, count in enumerate(self._counts) if count > 0}}
+
+    def clear(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+def _search_time_range(index, start_timestamp=None, end_timestamp=None, include_previous=True):
+    """ Binary search of the buffers in a time range.
+
+        Args:
+            index (np.ndarray): Sorted ref_timestamps of the buffers
+            start_timestamp (int, optional): Start of the time range. Defaults to None (first buffer).
+            end_timestamp (int, optional): End of the time range (included). Defaults to None (last buffer).
+            include_previous (bool, optional): Include the buffer starting before start_timestamp, whose values can be in the time range. Defaults to True.
+
+        Returns:
+            (int, int): Indexes of the first and last (excluded) buffers in the time range
+    """
+    start = 0 if start_timestamp is None else max(int(np.searchsorted(
+        index, start_timestamp, side="right" if include_previous else "left")) - (1 if include_previous else 0), 0)
+    end = len(index) if end_timestamp is None else int(
+        np.searchsorted(index, end_timestamp, side="right"))
+    return start, max(start, end)
+
+
+def _select_time_range(records, index, timestamp_mode, start_timestamp=None, end_timestamp=None):
+    """ Returns the values (and their timestamps) in a time range. Only the buffers overlapping the time range are read from records. In sparse mode, the timestamps are computed from the rel_timestamps, and the padding at the end of partially filled buffers is discarded.
+
+        Args:
+            records (np.ndarray): Buffers (structured array with ref_timestamp, data and, in sparse mode, rel_timestamps fields). Can be memory-mapped.
+            index (np.ndarray): Sorted ref_timestamps of the buffers
+            timestamp_mode (str): Timestamp mode ("dense" or "sparse")
+            start_timestamp (int, optional): Start of the time range. Defaults to None.
+            end_timestamp (int, optional): End of the time range (included). Defaults to None.
+
+        Returns:
+            dict: Flat "timestamps" and "data" arrays
+    """
+    start, end = _search_time_range(index, start_timestamp, end_timestamp)
+    selected = records[start:end]
+
+    ref_timestamps = np.asarray(
+        selected["ref_timestamp"], dtype=np.uint64)[:, None]
+    if timestamp_mode == "sparse":
+        timestamps = ref_timestamps + selected["rel_timestamps"]
+        # the first rel_timestamp of a buffer is 0, the ones after it are 0 only if the buffer is not full
+        mask = selected["rel_timestamps"] > 0
+        mask[:, 0] = True
+    else:
+        timestamps = ref_timestamps + \
+            np.arange(selected["data"].shape[1], dtype=np.uint64)
+        mask = np.ones(timestamps.shape, dtype=bool)
+
+    if start_timestamp is not None:
+        mask &= timestamps >= start_timestamp
+    if end_timestamp is not None:
+        mask &= timestamps <= end_timestamp
+
+    return {"timestamps": timestamps[mask], "data": np.asarray(selected["data"])[mask]}
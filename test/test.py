@@ -1,7 +1,21 @@
 import unittest
 import os
+import sys
+import subprocess
+import importlib.util
+import asyncio
+import time
+import threading
+import contextlib
+import json
+import io
+import tarfile
+import shutil
+import struct
 import numpy as np
-from pybela import Watcher, Streamer, Logger, Monitor, Controller
+from pybela import Watcher, Streamer, Logger, Monitor, Controller, MockBela, SessionManager
+from pybela.utils import _RingBuffer, _IngestQueue, _LatencyHistogram
+from pybela.Watcher import _DataFramer
 
 # os.environ["PYTHONASYNCIODEBUG"] = "1"
 
@@ -42,7 +56,7 @@ class test_Streamer(unittest.TestCase):
             "myvar4"  # sparse double
         ]
         self.saving_dir = "./test"
-        self.saving_filename = "test_streamer_save.txt"
+        self.saving_filename = "test_streamer_save.bin"
 
     def tearDown(self):
         self.streamer.cleanup()
@@ -135,6 +149,22 @@ class test_Streamer(unittest.TestCase):
 
         self.__test_buffers(mode="schedule")
 
+    def test_memory_budget(self):
+        budget = 2**16
+        self.streamer.streaming_buffers_memory_budget = budget
+        self.streamer.start_streaming(variables=self.streaming_vars)
+        self.streamer.wait(0.5)
+        self.streamer.stop_streaming(variables=self.streaming_vars)
+
+        usage = self.streamer.streaming_buffers_memory_usage
+        self.assertLessEqual(sum(usage[var]["allocated"] for var in usage), budget,
+                             "The streaming buffers should not allocate more memory than the budget")
+        for var in self.streaming_vars:
+            self.assertGreater(usage[var]["used"], 0,
+                               "The streamed variables should have buffers stored")
+            self.assertLessEqual(usage[var]["used"], usage[var]["allocated"],
+                                 "The used memory should not be larger than the allocated memory")
+
     def test_on_buffer_callback(self):
         variables = ["myvar", "myvar5"]  # dense double
 
@@ -225,10 +255,10 @@ class test_Logger(unittest.TestCase):
                     self.assertEqual(_buffer["ref_timestamp"]+logger.get_prop_of_var(var, "data_length")-1, _buffer["data"][-1],
                                      f"{var} {local_paths[var]} The last data item should be equal to the ref_timestamp plus the length of the buffer")
                 elif timestamp_mode == "sparse":
-                    inferred_timestamps = [_ + _buffer["ref_timestamp"]
-                                           for _ in _buffer["rel_timestamps"]]
-                    self.assertEqual(
-                        inferred_timestamps, _buffer["data"], "The timestamps should be equal to the ref_timestamp plus the relative timestamps (sparse logging)")
+                    inferred_timestamps = _buffer["ref_timestamp"] + \
+                        _buffer["rel_timestamps"].astype(np.uint64)
+                    self.assertTrue(np.array_equal(
+                        inferred_timestamps, _buffer["data"]), "The timestamps should be equal to the ref_timestamp plus the relative timestamps (sparse logging)")
 
     def test_logged_files_with_transfer(self):
         # log with transfer
@@ -304,7 +334,7 @@ class test_Monitor(unittest.TestCase):
     def setUp(self):
         self.monitor_vars = ["myvar", "myvar2", "myvar3", "myvar4"]
         self.period = 1000
-        self.saving_filename = "test_monitor_save.txt"
+        self.saving_filename = "test_monitor_save.bin"
         self.saving_dir = "./test"
 
         self.monitor = Monitor()
@@ -369,10 +399,10 @@ class test_Monitor(unittest.TestCase):
             loaded_buffers = self.monitor.load_data_from_file(os.path.join(self.saving_dir,
                                                                            f"{var}_{self.saving_filename}"))
 
-            self.assertEqual(loaded_buffers["timestamps"], monitored_buffers[var]["timestamps"],
-                             "The timestamps of the loaded buffer should be equal to the timestamps of the monitored buffer")
-            self.assertEqual(loaded_buffers["values"], monitored_buffers[var]["values"],
-                             "The values of the loaded buffer should be equal to the values of the monitored buffer")
+            self.assertTrue(np.array_equal(loaded_buffers["timestamps"], monitored_buffers[var]["timestamps"]),
+                            "The timestamps of the loaded buffer should be equal to the timestamps of the monitored buffer")
+            self.assertTrue(np.array_equal(loaded_buffers["values"], monitored_buffers[var]["values"]),
+                            "The values of the loaded buffer should be equal to the values of the monitored buffer")
 
         for var in self.monitor_vars:
             remove_file(os.path.join(self.saving_dir,
@@ -422,6 +452,874 @@ class test_Controller(unittest.TestCase):
                 _controlled_values[var] == expected_values[idx], "The controlled value should be 4")
 
 
+class test_Parser(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def setUp(self):
+        self.streamer = Streamer()
+        self.logger = Logger()
+
+    def test_parse_binary_data(self):
+        for _type, _struct_type in [("f", "f"), ("i", "i"), ("j", "I"), ("d", "d")]:
+            for timestamp_mode in ["dense", "sparse"]:
+                data_length = self.streamer.get_data_length(
+                    _type, timestamp_mode)
+                data = list(range(data_length))
+                fmt = "<Q" + _struct_type*data_length
+                values = [100] + data
+                if timestamp_mode == "sparse":
+                    fmt += "I"*data_length
+                    values += [2*i for i in range(data_length)]
+                msg = struct.pack(fmt, *values)
+                # logged buffers are padded
+                msg += bytes(self.logger.get_buffer_size(_type,
+                             timestamp_mode) - len(msg))
+
+                for watcher in [self.streamer, self.logger]:
+                    parsed = watcher._parse_binary_data(
+                        msg, timestamp_mode, _type)
+                    self.assertEqual(parsed["ref_timestamp"], 100,
+                                     "The ref_timestamp should be the first item of the buffer")
+                    self.assertTrue(np.array_equal(parsed["data"], data),
+                                    f"The parsed data should be equal to the packed data ({_type}, {timestamp_mode})")
+                    if timestamp_mode == "sparse":
+                        self.assertTrue(np.array_equal(parsed["rel_timestamps"], values[1+data_length:]),
+                                        "The parsed rel_timestamps should be equal to the packed rel_timestamps")
+
+        # unsigned ints are not parsed as signed
+        msg = struct.pack("<Q" + "I"*1024, 0, *[2**32-1]*1024)
+        self.assertEqual(self.streamer._parse_binary_data(
+            msg, "dense", "j")["data"][0], 2**32-1, "Type j should be parsed as an unsigned int")
+
+    def test_data_framer(self):
+        watcher_vars = [{"name": "myvar", "type": "d", "timestamp_mode": "dense"},
+                        {"name": "myvar2", "type": "j", "timestamp_mode": "sparse"}]
+        framers = [_DataFramer(watcher_vars), _DataFramer(watcher_vars)]
+        body = bytes(Logger.get_buffer_size("d", "dense"))
+
+        # interleaved connections don't share framing state
+        self.assertIsNone(framers[0].feed(b"0/d"))
+        self.assertIsNone(framers[1].feed(b"1/j"))
+        self.assertEqual(framers[0].feed(body)["name"], "myvar",
+                         "The buffer should be dispatched to the channel of the header of its connection")
+        self.assertEqual(framers[1].feed(body)["name"], "myvar2",
+                         "The buffer should be dispatched to the channel of the header of its connection")
+
+        # out of order messages
+        framer = framers[0]
+        framer.feed(b"0/d")
+        framer.feed(b"1/j")
+        self.assertEqual(framer.feed(body)["name"], "myvar2",
+                         "The buffer should be dispatched to the last header")
+        self.assertIsNone(framer.feed(body),
+                          "A buffer without a header should be discarded")
+        framer.feed(b"1/d")
+        self.assertIsNone(framer.feed(body),
+                          "A buffer after an invalid header should be discarded")
+        self.assertEqual(framer.errors, {"orphan_headers": 1, "orphan_buffers": 1, "invalid_headers": 1},
+                         "The framing errors should be counted")
+
+    def test_coalesce_ctrl_msgs(self):
+        msgs = [{"event": "connection-reply"},
+                {"watcher": [{"cmd": "unwatch", "watchers": ["myvar"]}]},
+                {"watcher": [{"cmd": "watch", "watchers": ["myvar2"]}]},
+                {"watcher": [{"cmd": "set", "watchers": ["myvar", "myvar2"], "values": [1, 2]}]},
+                {"watcher": [{"cmd": "set", "watchers": ["myvar"], "values": [3]}]},
+                {"watcher": [{"cmd": "list"}]}]
+        self.assertEqual(Watcher._coalesce_ctrl_msgs(msgs),
+                         [{"event": "connection-reply"},
+                          {"watcher": [{"cmd": "unwatch", "watchers": ["myvar"]},
+                                       {"cmd": "watch", "watchers": ["myvar2"]},
+                                       {"cmd": "set", "watchers": ["myvar", "myvar2"], "values": [1, 2]},
+                                       {"cmd": "set", "watchers": ["myvar"], "values": [3]},
+                                       {"cmd": "list"}]}],
+                         "Consecutive watcher commands should be merged in order, keeping every command")
+        self.assertEqual(msgs[1], {"watcher": [{"cmd": "unwatch", "watchers": ["myvar"]}]},
+                         "The queued messages should not be modified")
+
+    def test_parse_monitor_data(self):
+        monitor = Monitor()
+        parsed = monitor._parse_binary_data(
+            struct.pack("<Qd", 1000, 1000.0), "dense", "d")
+        self.assertEqual(parsed, {"timestamp": 1000, "value": 1000.0},
+                         "The monitor parser should return the timestamp and the value")
+
+
+class test_StreamFile(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def setUp(self):
+        self.streamer = Streamer()
+        self.json_filename = "./test/test_stream_file.txt"
+        self.filename = "./test/test_stream_file.bin"
+
+    def tearDown(self):
+        remove_file(self.json_filename)
+        remove_file(self.filename)
+
+    def test_convert_and_read_range(self):
+        data_length = self.streamer.get_data_length("d", "dense")
+        with open(self.json_filename, "w") as f:
+            for idx in range(10):
+                ref_timestamp = idx*data_length
+                f.write(json.dumps({"ref_timestamp": ref_timestamp, "data": list(
+                    range(ref_timestamp, ref_timestamp+data_length))}) + "\n")
+
+        self.streamer.convert_json_file(
+            self.json_filename, self.filename, var_type="d", var_name="myvar")
+        stream = self.streamer.read_stream_file(self.filename)
+        self.assertEqual((stream["var_name"], stream["timestamp_mode"]), ("myvar", "dense"),
+                         "The file header should describe the variable")
+        self.assertTrue(np.array_equal(stream["data"].reshape(-1), np.arange(10*data_length)),
+                        "The converted data should be equal to the json data")
+
+        stream = self.streamer.read_stream_file(
+            self.filename, start_timestamp=data_length+1, end_timestamp=3*data_length)
+        self.assertTrue(np.array_equal(stream["ref_timestamps"], [data_length, 2*data_length, 3*data_length]),
+                        "Only the buffers overlapping the time range should be returned")
+
+
+class test_LogFile(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def setUp(self):
+        self.logger = Logger()
+        self.n_buffers = 50
+        self.file_paths = {"dense": "./test/test_log_file_dense.bin",
+                           "sparse": "./test/test_log_file_sparse.bin"}
+        for timestamp_mode, file_path in self.file_paths.items():
+            write_log_file(file_path, "myvar", "d",
+                           timestamp_mode, self.n_buffers)
+
+    def tearDown(self):
+        for file_path in self.file_paths.values():
+            remove_file(file_path)
+            remove_file(file_path + ".idx")
+            for suffix in ("_timestamps.npy", "_data.npy"):
+                remove_file(file_path.replace(".bin", suffix))
+
+    def test_open_binary_file(self):
+        for timestamp_mode, file_path in self.file_paths.items():
+            log_file = self.logger.open_binary_file(file_path, timestamp_mode)
+            data_length = self.logger.get_data_length("d", timestamp_mode)
+
+            self.assertEqual((log_file.var_name, log_file.type), ("myvar", "d"),
+                             "The header should be parsed")
+            self.assertEqual(len(log_file.data), self.n_buffers*data_length,
+                             "The flat data should have data_length values per buffer")
+            self.assertTrue(np.array_equal(log_file.timestamps, log_file.data),
+                            f"The timestamps should be inferred from the ref_timestamps ({timestamp_mode})")
+            self.assertEqual(len(self.logger.read_binary_file(file_path, timestamp_mode)["buffers"]), self.n_buffers,
+                             "read_binary_file should return one buffer per record")
+
+    def test_sparse_padding(self):
+        file_path = self.file_paths["sparse"]
+        data_length = self.logger.get_data_length("d", "sparse")
+        # append a partially filled buffer with 3 values, padded with zeros
+        ref_timestamp = 2*self.n_buffers*data_length
+        rel_timestamps = [0, 2, 4] + [0]*(data_length - 3)
+        _buffer = struct.pack("<Q" + "d"*data_length + "I"*data_length, ref_timestamp,
+                              *[ref_timestamp + t for t in rel_timestamps[:3]], *[0]*(data_length - 3), *rel_timestamps)
+        with open(file_path, "ab") as f:
+            f.write(_buffer + bytes(self.logger.get_buffer_size("d", "sparse") - len(_buffer)))
+
+        log_file = self.logger.open_binary_file(file_path, "sparse")
+        self.assertEqual(len(log_file.data), self.n_buffers*data_length + 3,
+                         "The padding of partially filled buffers should be discarded")
+        self.assertTrue(np.array_equal(log_file.timestamps, log_file.data),
+                        "The timestamps should be aligned with the data")
+        chunks = list(log_file.iter_chunks(chunk_size=1000))
+        self.assertTrue(np.array_equal(np.concatenate([chunk["data"] for chunk in chunks]), log_file.data),
+                        "The flat data should match iter_chunks()")
+
+    def test_time_range(self):
+        for timestamp_mode, file_path in self.file_paths.items():
+            data_length = self.logger.get_data_length("d", timestamp_mode)
+            start, end = 3*data_length + 5, 7*data_length + 2
+            unsaved = self.logger.read_binary_file_time_range(
+                file_path, timestamp_mode, start, end)
+            self.assertFalse(os.path.exists(file_path + ".idx"),
+                             "The index should not be saved by default")
+            time_range = self.logger.read_binary_file_time_range(
+                file_path, timestamp_mode, start, end, save_index=True)
+            self.assertTrue(np.array_equal(unsaved["timestamps"], time_range["timestamps"]),
+                            f"Saving the index should not change the values returned ({timestamp_mode})")
+
+            self.assertTrue(os.path.exists(file_path + ".idx"),
+                            "The index should be saved in a sidecar file")
+            self.assertTrue(np.array_equal(time_range["timestamps"], time_range["data"]),
+                            f"The timestamps should match the data ({timestamp_mode})")
+            self.assertTrue(time_range["timestamps"][0] >= start and time_range["timestamps"][-1] <= end,
+                            f"The timestamps should be in the range ({timestamp_mode})")
+            log_file = self.logger.open_binary_file(file_path, timestamp_mode)
+            expected = log_file.timestamps[(log_file.timestamps >= start) & (
+                log_file.timestamps <= end)]
+            self.assertTrue(np.array_equal(time_range["timestamps"], expected),
+                            f"All the values in the range should be returned ({timestamp_mode})")
+
+    def test_iter_chunks(self):
+        for timestamp_mode, file_path in self.file_paths.items():
+            log_file = self.logger.open_binary_file(file_path, timestamp_mode)
+            values = log_file.get_time_range()["data"]
+            chunks = list(self.logger.iter_binary_file(
+                file_path, timestamp_mode, chunk_size=1000))
+
+            self.assertTrue(all(len(chunk["data"]) == 1000 for chunk in chunks[:-1]),
+                            "All the chunks but the last should have chunk_size values")
+            self.assertTrue(np.array_equal(np.concatenate([chunk["data"] for chunk in chunks]), values),
+                            f"The chunks should contain all the values ({timestamp_mode})")
+            self.assertEqual((log_file.min(1000), log_file.max(1000)), (values.min(), values.max()),
+                             "The min and max should be computed chunk by chunk")
+            self.assertAlmostEqual(log_file.mean(1000), values.mean(),
+                                   msg="The mean should be computed chunk by chunk")
+            self.assertTrue(np.array_equal(log_file.histogram(7, chunk_size=1000)[0], np.histogram(values, 7)[0]),
+                            "The histogram should be computed chunk by chunk")
+
+    def test_read_binary_files(self):
+        decoded = self.logger.read_binary_files(
+            list(self.file_paths.values()), max_workers=2)
+        for timestamp_mode, file_path in self.file_paths.items():
+            self.assertEqual(decoded[file_path]["timestamp_mode"], timestamp_mode,
+                             "The timestamp mode should be inferred from the file")
+            log_file = self.logger.open_binary_file(file_path, timestamp_mode)
+            self.assertIsInstance(decoded[file_path]["data"], np.memmap,
+                                  "The decoded arrays should be memory-mapped")
+            self.assertTrue(np.array_equal(decoded[file_path]["timestamps"], log_file.get_time_range()["timestamps"]),
+                            f"The timestamps should be decoded ({timestamp_mode})")
+            self.assertTrue(np.array_equal(decoded[file_path]["data"], decoded[file_path]["timestamps"]),
+                            f"The data should be decoded ({timestamp_mode})")
+            self.assertFalse(os.path.exists(file_path.replace(".bin", "_data.npy")),
+                             "The .npy files should not be written next to the log files by default")
+        output_dirs = {result["output_dir"] for result in decoded.values()}
+        self.assertEqual(len(output_dirs), 1,
+                         "The files should be decoded to a single temporary directory")
+        del decoded, log_file  # release the memory-mapped files
+        for output_dir in output_dirs:
+            shutil.rmtree(output_dir)
+
+
+    def test_tail_follow_transfer(self):
+        # the sftp channel is replaced by the local filesystem
+        class LocalFile:
+            def __init__(self, path):
+                self.file = open(path, "rb")
+
+            def readv(self, chunks):
+                for offset, size in chunks:
+                    self.file.seek(offset)
+                    yield self.file.read(size)
+
+            def close(self):
+                self.file.close()
+
+        class LocalSFTP:
+            def stat(self, path):
+                return os.stat(path)
+
+            def open(self, path, mode):
+                return LocalFile(path)
+
+            def close(self):
+                pass
+
+        @contextlib.asynccontextmanager
+        async def local_sftp():
+            yield LocalSFTP()
+
+        self.logger._async_sftp = local_sftp
+        remote_path, local_path = "./test/test_remote_log.bin", "./test/test_local_log.bin"
+        data = os.urandom(2**23)
+
+        async def log_and_transfer():
+            self.logger._logging_mode = "FOREVER"
+            open(remote_path, "wb").close()
+            task = self.logger._Logger__copy_file_in_chunks(
+                remote_path, local_path)
+            self.logger._active_copying_tasks.append(task)
+            with open(remote_path, "ab") as remote_file:
+                for start in range(0, len(data), 2**19):
+                    remote_file.write(data[start:start+2**19])
+                    remote_file.flush()
+                    await asyncio.sleep(0.02)
+            self.logger._logging_mode = "OFF"
+            start_time = time.perf_counter()
+            await task
+            return time.perf_counter() - start_time
+
+        try:
+            catch_up_time = self.logger.loop.run_until_complete(
+                log_and_transfer())
+            with open(local_path, "rb") as local_file:
+                self.assertEqual(local_file.read(), data,
+                                 "The local copy should match the remote file")
+            lag = self.logger.transfer_lag[remote_path]
+            self.assertTrue(lag["done"])
+            self.assertEqual((lag["transferred"], lag["lag_bytes"]), (len(data), 0),
+                             "The transfer should finish with no lag")
+            self.assertLess(catch_up_time, 2,
+                            "The transfer should keep up with the remote file")
+        finally:
+            remove_file(remote_path)
+            remove_file(local_path)
+
+
+    def test_unpack_tar_stream(self):
+        # tar stream of the log files, as streamed by copy_all_bin_files_in_project(method="tar")
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for file_path in self.file_paths.values():
+                tar.add(file_path, arcname=os.path.basename(file_path))
+        archive.seek(0)
+
+        local_dir = "./test/test-unpacked"
+        os.makedirs(local_dir, exist_ok=True)
+        existing_path = os.path.join(
+            local_dir, os.path.basename(self.file_paths["dense"]))
+        open(existing_path, "wb").close()
+        try:
+            local_paths = self.logger._unpack_tar_stream(archive, local_dir)
+            self.assertEqual(len(local_paths), len(self.file_paths))
+            self.assertNotIn(existing_path, local_paths,
+                             "Existing files should not be overwritten")
+            for file_path, local_path in zip(self.file_paths.values(), local_paths):
+                with open(file_path, "rb") as original, open(local_path, "rb") as unpacked:
+                    self.assertEqual(original.read(), unpacked.read())
+        finally:
+            shutil.rmtree(local_dir)
+
+
+class test_MockBela(unittest.TestCase):
+    # does not need Bela to be connected, runs against a local mock of the Bela watcher
+
+    def setUp(self):
+        self.bela = MockBela(port=0, speed=4)
+        self.bela.start()
+
+    def tearDown(self):
+        self.bela.stop()
+
+    def test_stream_n_values(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        self.assertEqual(streamer.project_name, self.bela.project_name,
+                         "The project name should be received on connection")
+        self.assertEqual(len(streamer.watcher_vars), len(self.bela.variables),
+                         "The list should contain the mock variables")
+
+        streamer.stream_n_values(["myvar", "myvar3"], n_values=2000)
+        for var in ["myvar", "myvar3"]:
+            buffers = streamer.streaming_buffers_queue[var]
+            self.assertGreater(len(buffers), 0, f"{var} should be streamed")
+            for _buffer in buffers:
+                timestamps = _buffer["ref_timestamp"] + (_buffer["rel_timestamps"] if "rel_timestamps" in _buffer else np.arange(
+                    len(_buffer["data"])))
+                self.assertTrue(np.array_equal(_buffer["data"], timestamps),
+                                f"The values of {var} should be equal to their timestamps")
+        streamer.cleanup()
+
+    def test_monitor_and_control(self):
+        monitor = Monitor(ip=self.bela.ip, port=self.bela.port)
+        monitor.connect()
+        peeked = monitor.peek(["myvar", "myvar2"])
+        for var in ["myvar", "myvar2"]:
+            self.assertEqual(peeked[var]["value"], peeked[var]["timestamp"],
+                             "The peeked values should be equal to their timestamps")
+        monitor.cleanup()
+
+        controller = Controller(ip=self.bela.ip, port=self.bela.port)
+        controller.connect()
+        controller.start_controlling(["myvar2"])
+        controller.send_value(["myvar2"], [7])
+        controller.wait(0.1)
+        self.assertEqual(controller.get_value(["myvar2"])["myvar2"], 7,
+                         "The controlled value should be set")
+        controller.stop_controlling(["myvar2"])
+        controller.cleanup()
+
+    def test_n_values_without_list(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        requests = self.bela.received_list_requests
+        streamer.stream_n_values(["myvar", "myvar3"], n_values=2000)
+        self.assertEqual(self.bela.received_list_requests, requests,
+                         "stream_n_values should not ask the watcher for the list")
+        streamer.cleanup()
+
+        monitor = Monitor(ip=self.bela.ip, port=self.bela.port)
+        monitor.connect()
+        requests = self.bela.received_list_requests
+        periods = {"myvar": 500, "myvar2": 1000}
+        values = monitor.monitor_n_values(
+            list(periods), periods=list(periods.values()), n_values=20)
+        self.assertEqual(self.bela.received_list_requests, requests,
+                         "monitor_n_values should not ask the watcher for the list")
+        for var, period in periods.items():
+            self.assertEqual(len(values[var]["timestamps"]), 20,
+                             f"{var} should have n_values values")
+            self.assertTrue(np.all(np.diff(values[var]["timestamps"]) == period),
+                            f"The values of {var} should be spaced by its period")
+        monitor.cleanup()
+
+    def test_non_standard_buffer_length(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        received = []
+        streamer.start_streaming(
+            ["myvar"], on_buffer_callback=lambda msg: received.append(msg["buffer"]))
+        streamer.wait(0.1)
+        data = np.arange(1, 11, dtype=np.float64)
+        self.bela.send_buffer("myvar", 1, data)
+        streamer.wait(0.2)
+        streamer.stop_streaming()
+
+        def non_standard(buffers):
+            return [buffer for buffer in buffers if len(buffer["data"]) == len(data)]
+        self.assertEqual(len(non_standard(received)), 1)
+        queue = streamer.streaming_buffers_queue["myvar"]
+        self.assertEqual(len(non_standard(queue)), 1,
+                         "Buffers of non-standard length should be stored")
+        self.assertEqual(non_standard(queue)[0]["ref_timestamp"], 1)
+        self.assertTrue(np.array_equal(non_standard(queue)[0]["data"], data))
+        self.assertTrue(np.array_equal(streamer.streaming_buffers_data["myvar"],
+                                       np.concatenate([buffer["data"] for buffer in queue])),
+                        "The flat data should include the buffers of non-standard length")
+        streamer.cleanup()
+
+    def test_small_memory_budget(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.streaming_buffers_memory_budget = 1  # smaller than one buffer
+        streamer.start_streaming(["myvar"])
+        streamer.wait(0.2)
+        streamer.stop_streaming()
+
+        usage = streamer.streaming_buffers_memory_usage["myvar"]
+        self.assertEqual(usage["allocated"], streamer.get_buffer_size("d", "dense"),
+                         "A variable whose budget share is smaller than one buffer should store one buffer")
+        self.assertEqual(len(streamer.streaming_buffers_queue["myvar"]), 1,
+                         "The last buffer received should be stored")
+        streamer.cleanup()
+
+    def test_ctrl_msg_coalescing(self):
+        controller = Controller(ip=self.bela.ip, port=self.bela.port)
+        controller.connect()
+        controller.start_controlling(["myvar2"])
+        msgs, sets = self.bela.received_ctrl_msgs, self.bela.received_cmds["set"]
+        for value in range(100):
+            controller.send_value(["myvar2"], [value])
+        controller.wait(0.1)
+        self.assertLess(self.bela.received_ctrl_msgs - msgs, 100,
+                        "Control messages queued together should be sent in fewer frames")
+        self.assertEqual(self.bela.received_cmds["set"] - sets, 100,
+                         "Every value sent should reach Bela")
+        self.assertEqual(controller.get_value(["myvar2"])["myvar2"], 99,
+                         "The latest value should be set")
+        controller.cleanup()
+
+    def test_ctrl_msg_max_latency(self):
+        controller = Controller(ip=self.bela.ip, port=self.bela.port)
+        controller.connect()
+        controller.start_controlling(["myvar2"])
+        controller.ctrl_msg_max_latency = 1
+        sets = self.bela.received_cmds["set"]
+        start = time.perf_counter()
+        controller.send_value(["myvar2"], [1])
+        while self.bela.received_cmds["set"] == sets and time.perf_counter() - start < 2:
+            controller.wait(0.005)
+        self.assertLess(time.perf_counter() - start, 0.5,
+                        "A single message should be sent as soon as the queue is idle, not after ctrl_msg_max_latency")
+
+        msgs, sets = self.bela.received_ctrl_msgs, self.bela.received_cmds["set"]
+        for value in range(100):
+            controller.send_value(["myvar2"], [value])
+        controller.wait(0.1)
+        self.assertLess(self.bela.received_ctrl_msgs - msgs, 100,
+                        "Control messages queued together should be sent in fewer frames")
+        self.assertEqual(self.bela.received_cmds["set"] - sets, 100,
+                         "Every value sent should reach Bela")
+        controller.cleanup()
+
+    def test_bounded_ingest_queue(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.set_ingest_queue(
+            "processed", max_size=10, policy="priority", priorities={"myvar": 1})
+        received = {"myvar": 0, "myvar2": 0}
+
+        async def slow_callback(buffer):
+            received[buffer["name"]] += 1
+            await asyncio.sleep(0.01)
+
+        streamer.start_streaming(
+            ["myvar", "myvar2"], on_buffer_callback=slow_callback)
+        streamer.wait(0.5)
+        streamer.stop_streaming()
+        dropped = streamer.dropped_buffers["processed"]
+        self.assertGreater(dropped["total"], 0,
+                           "Buffers should be dropped when the callback falls behind")
+        dropped_ratio = {var: dropped["vars"].get(var, 0) / (dropped["vars"].get(var, 0) + received[var])
+                         for var in received}
+        self.assertGreater(dropped_ratio["myvar2"], dropped_ratio["myvar"],
+                           "The buffers of the low priority variable should be dropped first")
+        self.assertEqual(streamer.dropped_buffers["received"]["total"], 0,
+                         "The unbounded queue should not drop buffers")
+        streamer.cleanup()
+
+    def test_stats(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.start_streaming(
+            ["myvar", "myvar3"], on_buffer_callback=lambda buffer: None)
+        streamer.wait(0.5)
+        streamer.stop_streaming()
+        streamer.wait(0.1)  # the buffer of the last header can still be on its way
+        stats = streamer.stats()
+        for var in ["myvar", "myvar3"]:
+            self.assertGreater(stats["vars"][var]["messages_per_second"], 0,
+                               f"The rate of {var} should be reported")
+        self.assertEqual(stats["messages"], 2 * sum(var["messages"] for var in stats["vars"].values()),
+                         "Each buffer is received as a header and a buffer message")
+        self.assertGreater(stats["latency"]["process"]["count"], 0)
+        self.assertGreater(stats["latency"]["callback"]["count"], 0)
+        self.assertGreater(stats["loop_lag"]["count"], 0)
+        self.assertEqual(set(stats["queues"]), {"received", "processed", "send_data", "send_ctrl"})
+        self.assertEqual(stats["errors"]["parse"], 0)
+
+        streamer.reset_stats()
+        self.assertEqual(streamer.stats()["messages"], 0,
+                         "reset_stats() should restart the window")
+        streamer.cleanup()
+
+    def test_auto_reconnect(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.set_auto_reconnect(initial_delay=0.1)
+        received = []
+        streamer.start_streaming(
+            ["myvar"], on_buffer_callback=lambda buffer: received.append(buffer["buffer"]["ref_timestamp"]))
+        streamer.wait(0.3)
+        n_before = len(received)
+
+        self.bela.drop_connections()
+        streamer.wait(1)
+        self.assertTrue(streamer.is_connected(), "The streamer should reconnect")
+        self.assertEqual(len(streamer.discontinuities), 1,
+                         "The gap should be recorded as a discontinuity")
+        gap = streamer.discontinuities[0]
+        self.assertGreater(gap["resume_timestamp"], gap["last_timestamps"]["myvar"])
+        self.assertGreater(len(received), n_before,
+                           "The callback should receive buffers after the reconnection")
+        self.assertGreater(received[-1], gap["resume_timestamp"])
+
+        streamer.stop_streaming()
+        streamer.cleanup()
+        self.assertEqual(len(streamer.discontinuities), 1,
+                         "cleanup() should not trigger a reconnection")
+
+    def test_ssh_executor(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.start_streaming(["myvar"])
+
+        class Channel:
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        async def blocking_ssh_calls():
+            received = streamer._received_data_msg_count
+            await streamer._async_run_ssh(time.sleep, 0.5)
+            received_during_call = streamer._received_data_msg_count - received
+            channel = Channel()
+            with self.assertRaises(asyncio.TimeoutError):
+                await streamer._async_run_ssh(time.sleep, 1, timeout=0.1, channel=channel)
+            return received_during_call, channel.closed
+
+        received, closed = streamer.loop.run_until_complete(
+            blocking_ssh_calls())
+        self.assertGreater(received, 0,
+                           "Data should be received while a blocking ssh call runs")
+        self.assertTrue(closed,
+                        "The channel of a call that times out should be closed")
+        streamer.stop_streaming()
+        streamer.cleanup()
+
+    def test_list_cache(self):
+        streamer = Streamer(ip=self.bela.ip, port=self.bela.port)
+        streamer.connect()
+        streamer.list_max_age = 10
+
+        async def concurrent_lists():
+            return await asyncio.gather(*[streamer._async_list(max_age=0) for _ in range(10)])
+
+        requests = self.bela.received_list_requests
+        responses = streamer.loop.run_until_complete(concurrent_lists())
+        self.assertEqual(self.bela.received_list_requests - requests, 1,
+                         "Concurrent list calls should be coalesced into one request")
+        self.assertTrue(all(response is responses[0] for response in responses),
+                        "Concurrent list calls should receive the same response")
+
+        streamer.loop.run_until_complete(streamer._async_watched_vars())
+        self.assertEqual(self.bela.received_list_requests - requests, 1,
+                         "A recent snapshot should be served from the cache")
+
+        streamer.send_ctrl_msg(
+            {"watcher": [{"cmd": "watch", "watchers": ["myvar"]}]})
+        watched_vars = streamer.loop.run_until_complete(
+            streamer._async_watched_vars())
+        self.assertEqual([var["name"] for var in watched_vars], ["myvar"],
+                         "A state change should invalidate the cache")
+        self.assertEqual(self.bela.received_list_requests - requests, 2)
+
+        streamer.cleanup()
+
+    def test_run_in_thread(self):
+        main_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(main_loop)
+        try:
+            streamer = Streamer(ip=self.bela.ip, port=self.bela.port,
+                                run_in_thread=True)
+            self.assertIs(asyncio.get_event_loop(), main_loop,
+                          "The event loop of the caller thread should not be replaced")
+        finally:
+            asyncio.set_event_loop(None)
+            main_loop.close()
+        streamer.connect()
+        streamer.start_streaming(["myvar"])
+        time.sleep(0.5)  # no pybela calls in the main thread
+        self.assertGreater(len(streamer.streaming_buffers_queue["myvar"]), 0,
+                           "Data should be received while the main thread is busy")
+
+        streamer.streaming_buffers_queue_length = 10  # the buffers are replaced in the loop thread
+        time.sleep(0.2)
+        self.assertEqual(len(streamer.streaming_buffers_queue["myvar"]), 10)
+
+        responses = []
+        thread = threading.Thread(
+            target=lambda: responses.append(streamer.list()))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(responses[0]["watchers"]), len(self.bela.variables),
+                         "Sync methods should be callable from other threads")
+        streamer.stop_streaming()
+        streamer.cleanup()
+
+    def test_loop_backend(self):
+        loop = asyncio.new_event_loop()
+        loop_backends = [loop]
+        if importlib.util.find_spec("uvloop") is not None:
+            loop_backends.append("uvloop")
+
+        try:
+            for loop_backend in loop_backends:
+                streamer = Streamer(ip=self.bela.ip, port=self.bela.port,
+                                    loop_backend=loop_backend)
+                if not isinstance(loop_backend, str):
+                    self.assertIs(streamer.loop, loop_backend,
+                                  "The loop supplied by the caller should be used")
+                streamer.connect()
+                streamer.stream_n_values(["myvar"], n_values=1000)
+                self.assertGreater(len(streamer.streaming_buffers_queue["myvar"]), 0,
+                                   f"Data should be received with the {loop_backend} loop backend")
+                streamer.cleanup()
+        finally:
+            loop.close()
+
+        with self.assertRaises(ValueError):
+            Streamer(loop_backend="unknown")
+
+    def test_running_loop_backend(self):
+        # the loop of the caller, running in the same thread, e.g. from a coroutine or a notebook
+        async def stream_from_coroutine():
+            streamer = Streamer(ip=self.bela.ip, port=self.bela.port,
+                                loop_backend=asyncio.get_running_loop())
+            self.assertIs(streamer._loop_thread, threading.current_thread())
+            await streamer._async_connect()
+            with self.assertRaises(RuntimeError, msg="Sync methods should raise instead of blocking the loop"):
+                streamer.list()
+            _list = await streamer._async_list()
+            await streamer._async_cleanup()
+            return _list
+
+        _list = asyncio.run(stream_from_coroutine())
+        self.assertEqual(len(_list["watchers"]), len(self.bela.variables))
+
+
+class test_SessionManager(unittest.TestCase):
+    # does not need Bela to be connected, runs against two local mocks of the Bela watcher
+
+    def setUp(self):
+        self.boards = {"bela1": MockBela(port=0, speed=4),
+                       "bela2": MockBela(port=0, speed=4)}
+        for bela in self.boards.values():
+            bela.start()
+        self.manager = SessionManager(
+            {name: {"ip": bela.ip, "port": bela.port} for name, bela in self.boards.items()})
+
+    def tearDown(self):
+        self.manager.cleanup()
+        for bela in self.boards.values():
+            bela.stop()
+
+    def test_stream_from_several_boards(self):
+        connected = self.manager.connect()
+        self.assertTrue(all(connected[board]["streamer"] for board in self.boards),
+                        "All boards should be connected")
+
+        received = {board: 0 for board in self.boards}
+
+        def callback(msg):
+            received[msg["board"]] += 1
+
+        self.manager.start_streaming(["myvar"], on_buffer_callback=callback)
+        self.manager.wait(0.5)
+        self.manager.stop_streaming()
+
+        metrics = self.manager.metrics()
+        for board in self.boards:
+            self.assertGreater(received[board], 0,
+                               f"The buffers of {board} should be received in the session callback")
+            self.assertGreater(metrics[board]["streamer"]["messages"], 0,
+                               f"The metrics of {board} should count the received messages")
+            self.assertLessEqual(metrics[board]["streamer"]["messages"],
+                                 self.manager.streamer(board).stats()["messages"])
+            self.assertFalse(os.path.exists(board),
+                             "No saving directories should be created when saving is disabled")
+
+
+class test_RingBuffer(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def test_append_and_snapshot(self):
+        ring = _RingBuffer(4, {"ref_timestamp": "<u8",
+                               "data": np.dtype(("<f4", (8,)))})
+        for idx in range(6):
+            ring.append(ref_timestamp=idx*8,
+                        data=np.arange(idx*8, (idx+1)*8))
+
+        self.assertEqual(len(ring), 4,
+                         "The ring buffer should not grow beyond its capacity")
+        self.assertTrue(np.array_equal(ring.snapshot("ref_timestamp"), [16, 24, 32, 40]),
+                        "The ring buffer should keep the most recent items in insertion order")
+        self.assertTrue(np.array_equal(ring.snapshot("data").reshape(-1), np.arange(16, 48)),
+                        "The flattened data should be continuous")
+        ring.popleft()
+        self.assertEqual(ring.snapshot("ref_timestamp")[0], 24,
+                         "popleft() should remove the oldest item")
+
+        copy = ring.snapshot("data", copy=True)
+        ring.append(ref_timestamp=48, data=np.arange(48, 56))
+        self.assertTrue(np.array_equal(copy.reshape(-1), np.arange(24, 48)),
+                        "A copy should not change when items are appended")
+
+        ring.append(ref_timestamp=56, data=np.arange(56, 60))  # shorter than the field
+        self.assertEqual(list(ring.overflow()), [3],
+                         "Items that don't fit the fields should be kept apart")
+        self.assertTrue(np.array_equal(ring.flat("data"), np.concatenate((np.arange(32, 56), np.arange(56, 60)))))
+
+
+class test_IngestQueue(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def fill(self, queue, items):
+        for key, item in items:
+            queue.put_nowait(item, key)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    def test_policies(self):
+        items = [("a", 0), ("b", 1), ("a", 2), ("b", 3), ("a", 4)]
+
+        self.assertEqual(self.fill(_IngestQueue(3, "drop-oldest"), items), [2, 3, 4],
+                         "drop-oldest should keep the newest items")
+        self.assertEqual(self.fill(_IngestQueue(3, "drop-newest"), items), [0, 1, 2],
+                         "drop-newest should keep the oldest items")
+        queue = _IngestQueue(3, "priority", {"a": 1})
+        self.assertEqual(self.fill(queue, items), [0, 2, 4],
+                         "The items with the lowest priority should be dropped first")
+        self.assertEqual(dict(queue.dropped), {"b": 2},
+                         "The dropped items should be counted by key")
+
+        queue = _IngestQueue(1, "block")
+        queue.put_nowait(0)
+        with self.assertRaises(asyncio.QueueFull):
+            queue.put_nowait(1)
+
+        async def blocked_put():
+            # the put waits until the item in the queue is retrieved
+            put = asyncio.ensure_future(queue.put(1))
+            await asyncio.sleep(0.01)
+            self.assertFalse(put.done(), "put() should block while the queue is full")
+            self.assertEqual(await queue.get(), 0)
+            await put
+            return await queue.get()
+
+        loop = asyncio.new_event_loop()
+        self.assertEqual(loop.run_until_complete(blocked_put()), 1)
+        loop.close()
+
+
+class test_LatencyHistogram(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def test_summary(self):
+        histogram = _LatencyHistogram()
+        for duration in [10e-6]*90 + [1e-3]*9 + [0.1]:
+            histogram.record(duration)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["max"], 0.1)
+        self.assertTrue(10e-6 <= summary["p50"] <= 20e-6,
+                        "The percentiles should be bounded by the upper edge of their bin")
+        self.assertTrue(1e-3 <= summary["p99"] <= 2e-3,
+                        "The percentiles should be bounded by the upper edge of their bin")
+        self.assertEqual(sum(summary["bins"].values()), 100)
+
+
+class test_Imports(unittest.TestCase):
+    # does not need Bela to be connected
+
+    def test_lazy_dependencies(self):
+        # runs in a fresh interpreter, since the tests import everything
+        code = "import sys; import pybela; pybela.Controller(); pybela.Logger(); print(','.join(m for m in ['bokeh', 'paramiko', 'aiofiles'] if m in sys.modules))"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        self.assertEqual(output.stdout.strip().split("\n")[-1], "",
+                         "The optional dependencies should not be imported until they are needed")
+
+    def test_lazy_helpers(self):
+        code = "import sys; import pybela; print(','.join(m for m in ['pybela.MockBela', 'pybela.SessionManager'] if m in sys.modules)); from pybela import MockBela, SessionManager; print(MockBela.__name__, SessionManager.__name__)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        lines = output.stdout.rstrip("\n").split("\n")
+        self.assertEqual(lines[-2], "",
+                         "MockBela and SessionManager should not be imported by import pybela")
+        self.assertEqual(lines[-1], "MockBela SessionManager",
+                         "MockBela and SessionManager should be importable from pybela")
+
+
+def write_log_file(file_path, var_name, _type, timestamp_mode, n_buffers):
+    # writes a log file in the format of the Bela logger, where each value is equal to its timestamp
+    data_length = Logger.get_data_length(_type, timestamp_mode)
+    struct_type = {"d": "d", "f": "f", "i": "i", "j": "I"}[_type]
+    with open(file_path, "wb") as f:
+        header = b"bela-test\0" + var_name.encode() + b"\0" + \
+            _type.encode() + b"\0" + struct.pack("II", 0, 0)
+        f.write(header + bytes(-len(header) % 4))
+        for idx in range(n_buffers):
+            if timestamp_mode == "dense":
+                ref_timestamp = idx*data_length
+                _buffer = struct.pack("<Q" + struct_type*data_length, ref_timestamp,
+                                      *range(ref_timestamp, ref_timestamp + data_length))
+            else:  # values assigned every other frame
+                ref_timestamp = 2*idx*data_length
+                rel_timestamps = range(0, 2*data_length, 2)
+                _buffer = struct.pack("<Q" + struct_type*data_length + "I"*data_length, ref_timestamp,
+                                      *[ref_timestamp + t for t in rel_timestamps], *rel_timestamps)
+            f.write(_buffer + bytes(Logger.get_buffer_size(_type,
+                    timestamp_mode) - len(_buffer)))
+
+
 def remove_file(file_path):
     if os.path.exists(file_path):
         os.remove(file_path)
@@ -446,6 +1344,7 @@ def run_tests():
             test_Streamer('test_stream_n_values'),
             test_Streamer('test_start_stop_streaming'),
             test_Streamer('test_scheduling_streaming'),
+            test_Streamer('test_memory_budget'),
             test_Streamer('test_on_buffer_callback'),
             test_Streamer('test_on_block_callback'),
             # logger
@@ -459,7 +1358,41 @@ def run_tests():
             test_Monitor('test_save_monitor'),
             #  controller
             test_Controller('test_start_stop_controlling'),
-            test_Controller('test_send_value')
+            test_Controller('test_send_value'),
+            # parser
+            test_Parser('test_parse_binary_data'),
+            test_Parser('test_parse_monitor_data'),
+            test_Parser('test_data_framer'),
+            test_Parser('test_coalesce_ctrl_msgs'),
+            test_StreamFile('test_convert_and_read_range'),
+            test_LogFile('test_open_binary_file'),
+            test_LogFile('test_sparse_padding'),
+            test_LogFile('test_time_range'),
+            test_LogFile('test_read_binary_files'),
+            test_LogFile('test_iter_chunks'),
+            test_LogFile('test_tail_follow_transfer'),
+            test_LogFile('test_unpack_tar_stream'),
+            test_MockBela('test_stream_n_values'),
+            test_MockBela('test_monitor_and_control'),
+            test_MockBela('test_n_values_without_list'),
+            test_MockBela('test_ctrl_msg_coalescing'),
+            test_MockBela('test_ctrl_msg_max_latency'),
+            test_MockBela('test_bounded_ingest_queue'),
+            test_MockBela('test_stats'),
+            test_MockBela('test_auto_reconnect'),
+            test_MockBela('test_list_cache'),
+            test_MockBela('test_non_standard_buffer_length'),
+            test_MockBela('test_small_memory_budget'),
+            test_MockBela('test_ssh_executor'),
+            test_MockBela('test_run_in_thread'),
+            test_MockBela('test_loop_backend'),
+            test_MockBela('test_running_loop_backend'),
+            test_SessionManager('test_stream_from_several_boards'),
+            test_RingBuffer('test_append_and_snapshot'),
+            test_IngestQueue('test_policies'),
+            test_LatencyHistogram('test_summary'),
+            test_Imports('test_lazy_dependencies'),
+            test_Imports('test_lazy_helpers')
         ])
         # suite.addTest(test_Streamer('test_on_block_callback'))
         runner = unittest.TextTestRunner(verbosity=2)